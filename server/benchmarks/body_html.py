@@ -0,0 +1,94 @@
+"""Benchmark of the body HTML pipeline of the STT NewsML parser on long articles
+
+Usage: python -m benchmarks.body_html [--number 200] [--paragraphs 50 200 1000]
+"""
+
+import argparse
+import os
+from copy import deepcopy
+from glob import glob
+from timeit import timeit
+
+from lxml import etree, html
+from lxml.html.clean import Cleaner
+
+from settings import HTML_TAGS_WHITELIST
+from stt.html_utils import clean_body_html
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+IPTC_NS = "http://iptc.org/std/nar/2006-10-01/"
+
+
+def legacy_clean_html(elem):
+    # ``superdesk.etree.clean_html``
+    if not isinstance(elem, html.HtmlElement):
+        elem = html.fromstring(etree.tostring(elem))
+    safe_attrs = set(html.defs.safe_attrs)
+    safe_attrs.remove("class")
+    cleaner = Cleaner(allow_tags=HTML_TAGS_WHITELIST, remove_unknown_tags=False, safe_attrs=safe_attrs)
+    return cleaner.clean_html(elem)
+
+
+def legacy_to_string(elem):
+    # ``superdesk.etree.to_string``
+    string = etree.tostring(elem, encoding="unicode", method="html")
+    if string.startswith("<div>") and string.endswith("</div>"):
+        return string[len("<div>"):-len("</div>")]
+    return string
+
+
+def legacy_body_html(body_elt):
+    body_elt = legacy_clean_html(body_elt)
+    for pre in body_elt.findall(".//pre"):
+        pre.tag = "p"
+    for a in body_elt.findall(".//a"):
+        a.attrib["target"] = "_blank"
+
+    content = {}
+    if len(body_elt) > 0:
+        content["content"] = "\n".join([legacy_to_string(e) for e in body_elt])
+    elif body_elt.text:
+        content["content"] = "<p>" + body_elt.text + "</p>"
+        content["format"] = "xhtml/xml"
+
+    if content.get("content"):
+        content["content"] = content["content"].replace("&lt;endash&gt;-&lt;/endash&gt;", "-")
+    return content
+
+
+def load_paragraphs():
+    paragraphs = []
+    for filename in sorted(glob(os.path.join(FIXTURES_PATH, "stt_newsml_*.xml"))):
+        for body in etree.parse(filename).getroot().iter(etree.QName(IPTC_NS, "body").text):
+            paragraphs.extend(body)
+    return paragraphs
+
+
+def build_body(paragraphs, count: int):
+    body = etree.Element(etree.QName(IPTC_NS, "body").text, nsmap={None: IPTC_NS})
+    for index in range(count):
+        body.append(deepcopy(paragraphs[index % len(paragraphs)]))
+    return body
+
+
+def run(number: int, sizes):
+    paragraphs = load_paragraphs()
+    print(f"{'paragraphs':>10} {'legacy (ms)':>12} {'single pass (ms)':>17} {'saved (ms)':>11} {'speedup':>8}")
+
+    for size in sizes:
+        body = build_body(paragraphs, size)
+        assert legacy_body_html(body) == clean_body_html(body, HTML_TAGS_WHITELIST)
+
+        legacy = timeit(lambda: legacy_body_html(body), number=number) / number * 1000
+        single_pass = timeit(lambda: clean_body_html(body, HTML_TAGS_WHITELIST), number=number) / number * 1000
+        print(f"{size:>10} {legacy:>12.3f} {single_pass:>17.3f} {legacy - single_pass:>11.3f} "
+              f"{legacy / single_pass:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200, help="Number of iterations per article size")
+    parser.add_argument("--paragraphs", type=int, nargs="+", default=[50, 200, 1000],
+                        help="Number of body elements of the generated articles")
+    args = parser.parse_args()
+    run(args.number, args.paragraphs)
@@ -0,0 +1,294 @@
+"""Benchmark of the STT parsers and the content linking hooks, against in-memory Mongo/Elastic stand-ins
+
+Reports the items per second, the p50/p99 latency of each operation, the database round trips per item
+and the peak memory of a single operation. The results are written as JSON with ``--output``, so the runs
+of different releases can be compared.
+
+Usage: python -m benchmarks.ingest [--number 200] [--coverages 20] [--cold] [--output results.json]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from copy import deepcopy
+from datetime import datetime, timezone
+from glob import glob
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+from flask import Flask
+from lxml import etree
+
+import settings
+from superdesk import default_settings
+from benchmarks.standins import StandinResources, install_standins
+from stt.cache import clear_caches
+from stt.parser import STTParser
+from stt.stt_events_ml import STTEventsMLParser
+from stt.stt_planning_ml import STTPlanningMLParser
+from stt.signal_hooks import link_coverages_to_content, before_content_published
+
+ROOT_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_PATH = os.path.join(ROOT_PATH, "tests", "fixtures")
+VOCABULARIES_PATH = os.path.join(ROOT_PATH, "data", "vocabularies.json")
+
+PROVIDER_ID = ObjectId()
+PLANNING_ID = "urn:newsml:stt.fi:20220330:437036"
+DESK_ID = ObjectId()
+USER_ID = ObjectId()
+
+
+def get_app() -> Flask:
+    """A Flask app with the settings of ``app.get_app``, without the Superdesk resources and their backends"""
+
+    app = Flask(__name__)
+    for module in (default_settings, settings):
+        for key in dir(module):
+            if key.isupper():
+                app.config[key] = getattr(module, key)
+    app.config["APP_ABSPATH"] = ROOT_PATH
+    return app
+
+
+def load_fixture(filename: str) -> etree._Element:
+    return etree.parse(os.path.join(FIXTURES_PATH, filename)).getroot()
+
+
+def get_content(index: int) -> Dict[str, Any]:
+    guid = f"urn:newsml:stt.fi:20220330:{index}"
+    return {
+        "_id": guid,
+        "guid": guid,
+        "uri": guid,
+        "type": "text",
+        "state": "published",
+        "slugline": f"Benchmark {index}",
+        "rewrite_sequence": 0,
+        "versioncreated": datetime(2022, 3, 30, 12, tzinfo=timezone.utc),
+        "task": {"desk": DESK_ID, "user": USER_ID},
+        "extra": {},
+    }
+
+
+def get_planning(coverages: int) -> Dict[str, Any]:
+    return {
+        "_id": PLANNING_ID,
+        "ingest_provider": PROVIDER_ID,
+        "coverages": [
+            {
+                "coverage_id": f"ID_TEXT_{index}",
+                "planning": {"g2_content_type": "text", "slugline": f"Coverage {index}"},
+                "news_coverage_status": {"qcode": "ncostat:int"},
+                "flags": {},
+            }
+            for index in range(coverages)
+        ],
+    }
+
+
+def get_deliveries(coverages: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "planning_id": PLANNING_ID,
+            "coverage_id": f"ID_TEXT_{index}",
+            "item_id": get_content(index)["uri"],
+            "assignment_id": None,
+        }
+        for index in range(coverages)
+    ]
+
+
+class Scenario:
+    """An operation to benchmark, ``prepare`` resets the stand-ins it changes before each (untimed) run"""
+
+    name = ""
+
+    def setup(self, resources: StandinResources):
+        pass
+
+    def prepare(self, resources: StandinResources):
+        pass
+
+    def run(self) -> int:
+        """Runs the operation once, returning the number of items processed"""
+        raise NotImplementedError
+
+
+class ParserScenario(Scenario):
+    def __init__(self, name: str, parser_class: Callable, fixtures: List[str]):
+        self.name = name
+        self.parser_class = parser_class
+        self.documents = [load_fixture(fixture) for fixture in fixtures]
+        self.provider = {"_id": PROVIDER_ID, "name": "STT", "feed_parser": parser_class.NAME}
+
+    def run(self) -> int:
+        items = 0
+        for document in self.documents:
+            items += len(self.parser_class().parse(document, self.provider))
+        return items
+
+
+class PlanningParserScenario(ParserScenario):
+    def setup(self, resources: StandinResources):
+        # The Event the Planning item is linked to
+        resources.service("events").seed([{
+            "_id": "urn:newsml:stt.fi:259431",
+            "guid": "urn:newsml:stt.fi:259431",
+            "extra": {"stt_short_id": "urn:newsml:stt.fi:259431"},
+        }])
+
+
+class LinkCoveragesScenario(Scenario):
+    name = "link_coverages_to_content"
+
+    def __init__(self, coverages: int):
+        self.coverages = coverages
+        self.planning = get_planning(coverages)
+
+    def setup(self, resources: StandinResources):
+        resources.service("archive").seed(get_content(index) for index in range(self.coverages))
+
+    def prepare(self, resources: StandinResources):
+        resources.service("planning").docs.clear()
+        resources.service("planning").seed([self.planning])
+        resources.service("delivery").docs.clear()
+        resources.service("delivery").seed(get_deliveries(self.coverages))
+
+    def run(self) -> int:
+        link_coverages_to_content(None, item=deepcopy(self.planning))
+        return self.coverages
+
+
+class ContentPublishedScenario(Scenario):
+    name = "before_content_published"
+
+    def __init__(self, coverages: int):
+        self.coverages = coverages
+        self.content = get_content(0)
+
+    def prepare(self, resources: StandinResources):
+        resources.service("planning").docs.clear()
+        resources.service("planning").seed([get_planning(self.coverages)])
+        resources.service("delivery").docs.clear()
+        resources.service("delivery").seed(get_deliveries(1))
+
+    def run(self) -> int:
+        before_content_published(None, item=deepcopy(self.content), updates={})
+        return 1
+
+
+def get_scenarios(coverages: int) -> List[Scenario]:
+    return [
+        ParserScenario(
+            "STTParser",
+            STTParser,
+            [os.path.basename(filename) for filename in sorted(glob(os.path.join(FIXTURES_PATH, "stt_newsml_*.xml")))],
+        ),
+        ParserScenario("STTEventsMLParser", STTEventsMLParser, ["events_ml_259431.xml"]),
+        PlanningParserScenario("STTPlanningMLParser", STTPlanningMLParser, ["planning_ml_584717.xml"]),
+        LinkCoveragesScenario(coverages),
+        ContentPublishedScenario(coverages),
+    ]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Nearest-rank percentile of the sorted ``values``"""
+
+    index = max(0, min(len(values) - 1, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def measure(scenario: Scenario, resources: StandinResources, number: int, cold: bool) -> Dict[str, Any]:
+    latencies = []
+    items = 0
+    round_trips = 0
+    for _ in range(number):
+        scenario.prepare(resources)
+        if cold:
+            clear_caches()
+        before = resources.total_round_trips()
+        start = time.perf_counter()
+        items += scenario.run()
+        latencies.append(time.perf_counter() - start)
+        round_trips += resources.total_round_trips() - before
+
+    # Peak memory of one more run, traced on its own as tracing slows down the operation
+    scenario.prepare(resources)
+    if cold:
+        clear_caches()
+    tracemalloc.start()
+    try:
+        scenario.run()
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "operations": number,
+        "items": items,
+        "items_per_second": items / sum(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "round_trips_per_item": round_trips / items if items else 0,
+        "peak_memory_kib": peak_memory / 1024,
+    }
+
+
+def get_git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT_PATH, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def run(number: int, coverages: int, cold: bool) -> Dict[str, Any]:
+    results = {}
+    with get_app().app_context(), install_standins() as resources:
+        with open(VOCABULARIES_PATH) as f:
+            resources.service("vocabularies").seed(json.load(f))
+        resources.service("ingest_providers").seed([{
+            "_id": PROVIDER_ID,
+            "name": "STT Planning",
+            "feed_parser": STTPlanningMLParser.NAME,
+        }])
+        clear_caches()
+
+        for scenario in get_scenarios(coverages):
+            scenario.setup(resources)
+            results[scenario.name] = measure(scenario, resources, number, cold)
+
+    print(f"{'scenario':<26} {'items/s':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} {'trips/item':>11} {'peak (KiB)':>11}")
+    for name, result in results.items():
+        print(f"{name:<26} {result['items_per_second']:>10.1f} {result['p50_ms']:>9.3f} {result['p99_ms']:>9.3f} "
+              f"{result['round_trips_per_item']:>11.2f} {result['peak_memory_kib']:>11.1f}")
+
+    return {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "git_revision": get_git_revision(),
+        "python": platform.python_version(),
+        "number": number,
+        "coverages": coverages,
+        "cold": cold,
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200, help="Number of operations per scenario")
+    parser.add_argument("--coverages", type=int, default=20, help="Number of coverages of the linked Planning item")
+    parser.add_argument("--cold", action="store_true", help="Clear the STT caches before each operation")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    report = run(args.number, args.coverages, args.cold)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,269 @@
+"""In-memory stand-ins of the Mongo and Elasticsearch backed services used by the STT parsers and linking hooks
+
+``install_standins`` replaces the registered Superdesk resources, so every ``get_resource_service`` call made
+by ``stt`` (or the Superdesk and Planning code it calls) gets a ``MemoryService``. Each call made to a service
+counts as one round trip to the database, which the benchmarks report per ingested item.
+"""
+
+import json
+import re
+from collections import Counter
+from contextlib import contextmanager
+from copy import deepcopy
+from typing import Any, Dict, Iterable, List, Optional
+from unittest import mock
+
+import superdesk
+from bson import ObjectId
+
+
+class Cursor(list):
+    """Results of a ``find``/``search``, with the ``count`` method of the Mongo and Elastic cursors"""
+
+    def __init__(self, docs: Iterable[Dict[str, Any]], total: Optional[int] = None):
+        super().__init__(docs)
+        self.total = len(self) if total is None else total
+
+    def count(self, **kwargs) -> int:
+        return self.total
+
+
+def get_value(doc: Dict[str, Any], path: str) -> Any:
+    value = doc
+    for key in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def _matches_value(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict) and any(key.startswith("$") for key in condition):
+        for operator, operand in condition.items():
+            if operator == "$in":
+                values = value if isinstance(value, list) else [value]
+                if not any(v in operand for v in values):
+                    return False
+            elif operator == "$nin":
+                if _matches_value(value, {"$in": operand}):
+                    return False
+            elif operator == "$ne":
+                if _matches_value(value, operand):
+                    return False
+            elif operator == "$exists":
+                if (value is not None) != bool(operand):
+                    return False
+            elif operator == "$regex":
+                if not isinstance(value, str) or not re.search(operand, value, re.I):
+                    return False
+            elif operator != "$options":
+                raise NotImplementedError(f"Unsupported operator {operator}")
+        return True
+    elif isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return value == condition
+
+
+def matches(doc: Dict[str, Any], lookup: Optional[Dict[str, Any]]) -> bool:
+    """Matches the document against the subset of the Mongo query language used by ``stt``"""
+
+    for key, condition in (lookup or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub_lookup) for sub_lookup in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub_lookup) for sub_lookup in condition):
+                return False
+        elif not _matches_value(get_value(doc, key), condition):
+            return False
+    return True
+
+
+def project(doc: Dict[str, Any], projection: Optional[Dict[str, int]]) -> Dict[str, Any]:
+    if not projection:
+        return deepcopy(doc)
+
+    included = [field for field, value in projection.items() if value and field != "_id"]
+    if included:
+        projected = {field: deepcopy(doc[field]) for field in included if field in doc}
+    else:
+        projected = {field: deepcopy(value) for field, value in doc.items() if projection.get(field, 1)}
+    if projection.get("_id", 1) and "_id" in doc:
+        projected["_id"] = doc["_id"]
+    else:
+        projected.pop("_id", None)
+    return projected
+
+
+class MemoryService:
+    """The methods of ``superdesk.services.BaseService`` used by ``stt``, backed by a list of documents"""
+
+    def __init__(self, name: str, round_trips: Counter):
+        self.name = name
+        self.round_trips = round_trips
+        self.docs: Dict[Any, Dict[str, Any]] = {}
+
+    def count_round_trip(self):
+        self.round_trips[self.name] += 1
+
+    def seed(self, docs: Iterable[Dict[str, Any]]):
+        for doc in docs:
+            doc = deepcopy(doc)
+            self.docs[doc.setdefault("_id", ObjectId())] = doc
+
+    def _find(self, lookup: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [doc for doc in self.docs.values() if matches(doc, lookup)]
+
+    def find_one(self, req=None, **lookup) -> Optional[Dict[str, Any]]:
+        self.count_round_trip()
+        docs = self._find(lookup)
+        return deepcopy(docs[0]) if docs else None
+
+    def find(self, where=None, **kwargs) -> Cursor:
+        self.count_round_trip()
+        return Cursor(deepcopy(doc) for doc in self._find(where))
+
+    def get_from_mongo(self, req=None, lookup=None, projection=None) -> Cursor:
+        self.count_round_trip()
+        return Cursor(project(doc, projection) for doc in self._find(lookup))
+
+    def get(self, req=None, lookup=None) -> Cursor:
+        return self.get_from_mongo(req, lookup)
+
+    def post(self, docs: List[Dict[str, Any]], **kwargs) -> List[Any]:
+        self.count_round_trip()
+        ids = []
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            doc.setdefault("_etag", str(ObjectId()))
+            self.docs[doc["_id"]] = deepcopy(doc)
+            ids.append(doc["_id"])
+        return ids
+
+    def patch(self, id, updates: Dict[str, Any]) -> Dict[str, Any]:
+        self.count_round_trip()
+        doc = self.docs[id]
+        doc.update(deepcopy(updates))
+        doc["_etag"] = str(ObjectId())
+        return deepcopy(doc)
+
+    def system_update(self, id, updates: Dict[str, Any], original: Optional[Dict[str, Any]] = None):
+        self.patch(id, updates)
+
+    def update(self, id, updates: Dict[str, Any], original: Optional[Dict[str, Any]] = None):
+        return self.patch(id, updates)
+
+    def delete_action(self, lookup: Optional[Dict[str, Any]] = None):
+        self.count_round_trip()
+        for doc in self._find(lookup):
+            del self.docs[doc["_id"]]
+
+    def update_published_items(self, _id, field: str, state: Any):
+        self.count_round_trip()
+        for doc in self._find({"item_id": _id}):
+            doc[field] = state
+
+    def search(self, source: Dict[str, Any]) -> Cursor:
+        """Elastic search, matching the ``term`` and ``match`` queries of ``search_existing_contacts``"""
+
+        self.count_round_trip()
+        results = []
+        for doc in self.docs.values():
+            for query in source["query"]["bool"]["must"]:
+                if "term" in query:
+                    field, value = next(iter(query["term"].items()))
+                    if not _matches_value(get_value(doc, field.replace(".keyword", "")), value):
+                        break
+                elif "match" in query:
+                    field, match = next(iter(query["match"].items()))
+                    if (get_value(doc, field) or "").lower() != match["query"]:
+                        break
+            else:
+                results.append(deepcopy(doc))
+        return Cursor(results)
+
+
+class PlanningService(MemoryService):
+    """Planning service, creating the Assignment of the coverages ``assigned_to`` a desk as the Planning module"""
+
+    def patch(self, id, updates: Dict[str, Any]) -> Dict[str, Any]:
+        for coverage in updates.get("coverages") or []:
+            assigned_to = coverage.get("assigned_to") or {}
+            if assigned_to.get("desk") and not assigned_to.get("assignment_id"):
+                assigned_to["assignment_id"] = ObjectId()
+        return super().patch(id, updates)
+
+
+class VocabulariesService(MemoryService):
+    def get_items(self, _id: str, qcode: Optional[str] = None, is_active: Optional[bool] = None, **kwargs):
+        self.count_round_trip()
+        vocabulary = self.docs.get(_id) or {}
+        return [
+            deepcopy(item)
+            for item in vocabulary.get("items") or []
+            if (qcode is None or item.get("qcode") == qcode)
+            and (is_active is None or item.get("is_active") == is_active)
+        ]
+
+
+class SearchService(MemoryService):
+    """Elastic search of the content repos, for the ``terms`` queries of ``stt.signal_hooks``"""
+
+    def __init__(self, name: str, round_trips: Counter, resources: "StandinResources"):
+        super().__init__(name, round_trips)
+        self.resources = resources
+
+    def get(self, req=None, lookup=None) -> Cursor:
+        self.count_round_trip()
+        source = json.loads(req.args["source"])
+        lookup = {}
+        for query in source["query"]["bool"]["must"]:
+            field, values = next(iter(query["terms"].items()))
+            lookup[field] = {"$in": values}
+
+        docs = []
+        for repo in req.args.get("repo", "archive").split(","):
+            if repo in self.resources:
+                docs.extend(self.resources[repo].service._find(lookup))
+        for sort in reversed(source.get("sort") or []):
+            field, order = next(iter(sort.items()))
+            docs.sort(key=lambda doc: doc.get(field) or 0, reverse=order == "desc")
+        return Cursor((deepcopy(doc) for doc in docs[:source.get("size", 10)]), len(docs))
+
+
+class StandinResource:
+    def __init__(self, service: MemoryService):
+        self.service = service
+
+
+class StandinResources(dict):
+    """``superdesk.resources``, creating an empty ``MemoryService`` for the resources without a stand-in"""
+
+    def __init__(self):
+        super().__init__()
+        self.round_trips: Counter = Counter()
+        self.add(PlanningService("planning", self.round_trips))
+        self.add(VocabulariesService("vocabularies", self.round_trips))
+        self.add(SearchService("search", self.round_trips, self))
+
+    def add(self, service: MemoryService):
+        self[service.name] = StandinResource(service)
+
+    def __missing__(self, name: str) -> StandinResource:
+        self.add(MemoryService(name, self.round_trips))
+        return self[name]
+
+    def service(self, name: str) -> MemoryService:
+        return self[name].service
+
+    def total_round_trips(self) -> int:
+        return sum(self.round_trips.values())
+
+
+@contextmanager
+def install_standins():
+    """Replaces the Superdesk resources with in-memory stand-ins for the duration of the context"""
+
+    resources = StandinResources()
+    with mock.patch.object(superdesk, "resources", resources):
+        yield resources
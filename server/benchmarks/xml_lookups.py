@@ -0,0 +1,69 @@
+"""Micro-benchmark of the XML lookups shared by the STT parsers, using the test fixtures
+
+Usage: python -m benchmarks.xml_lookups [--number 10000]
+"""
+
+import argparse
+import os
+from glob import glob
+from timeit import timeit
+
+from lxml import etree
+
+from stt.xml_utils import REMOVE_SIGNAL_XPATH, qname, get_namespace_from_tag
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures")
+
+
+def legacy_remove_signal(xml) -> bool:
+    namespaces = {"iptc": "http://iptc.org/std/nar/2006-10-01/"}
+    if xml.xpath("//iptc:itemMeta/iptc:signal[@qcode='sttinstruct:remove']", namespaces=namespaces):
+        return True
+    return False
+
+
+def legacy_qname(root, tag, ns=None):
+    if ns is None:
+        ns = root.tag.rsplit("}")[0].lstrip("{")
+    return str(etree.QName(ns, tag))
+
+
+def cached_qname(root, tag, ns=None):
+    if ns is None:
+        ns = get_namespace_from_tag(root.tag)
+    return qname(tag, ns)
+
+
+def load_fixtures():
+    fixtures = {}
+    for filename in sorted(glob(os.path.join(FIXTURES_PATH, "*.xml"))):
+        with open(filename, "rb") as f:
+            fixtures[os.path.basename(filename)] = etree.fromstring(f.read())
+    return fixtures
+
+
+def run(number: int):
+    fixtures = load_fixtures()
+    print(f"{'fixture':<45} {'remove signal (us)':>20} {'anchored (us)':>15} {'qname (us)':>12} {'cached (us)':>12}")
+
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for name, root in fixtures.items():
+        assert legacy_remove_signal(root) == REMOVE_SIGNAL_XPATH(root)
+        timings = [
+            timeit(lambda: legacy_remove_signal(root), number=number),
+            timeit(lambda: REMOVE_SIGNAL_XPATH(root), number=number),
+            timeit(lambda: legacy_qname(root, "contentMeta"), number=number),
+            timeit(lambda: cached_qname(root, "contentMeta"), number=number),
+        ]
+        totals = [total + timing for total, timing in zip(totals, timings)]
+        print(f"{name:<45} " + " ".join(
+            f"{timing / number * 1e6:>{width}.2f}" for timing, width in zip(timings, (20, 15, 12, 12))
+        ))
+
+    print(f"\nremove signal speedup: {totals[0] / totals[1]:.1f}x, qname speedup: {totals[2] / totals[3]:.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=10000, help="Number of iterations per fixture")
+    run(parser.parse_args().number)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8; -*-
+# This file is part of Superdesk.
+# For the full copyright and license information, please see the
+# AUTHORS and LICENSE files distributed with this source code, or
+# at https://www.sourcefabric.org/superdesk/license
+#
+# Author  : agent
+# Creation: 2026-10-18 10:16
+
+from superdesk.commands.data_updates import DataUpdate
+from stt.indexes import backfill_short_ids
+
+
+class DataUpdate(DataUpdate):
+
+    resource = 'planning'
+
+    def forwards(self, mongodb_collection, mongodb_database):
+        backfill_short_ids(mongodb_collection)
+
+    def backwards(self, mongodb_collection, mongodb_database):
+        mongodb_collection.update_many(
+            {'extra.stt_short_id': {'$exists': True}},
+            {'$unset': {'extra.stt_short_id': 1}}
+        )
@@ -11,7 +11,7 @@
 from typing import Dict, Any
 from os import path
 
-from superdesk import get_resource_service, etree
+from superdesk import get_resource_service
 from superdesk.tests.environment import before_feature, before_step, after_scenario   # noqa
 from superdesk.tests.environment import setup_before_all, setup_before_scenario
 from superdesk.io.commands.update_ingest import ingest_items
@@ -20,6 +20,7 @@ from apps.prepopulate.app_populate import AppPopulateCommand
 
 from app import get_app
 from settings import INSTALLED_APPS
+from stt.cache import clear_caches
 
 
 def before_all(context):
@@ -36,6 +37,7 @@ def before_scenario(context, scenario):
         'ELASTICSEARCH_FORCE_REFRESH': True,
     }
     setup_before_scenario(context, scenario, config, app_factory=get_app)
+    clear_caches()
 
     if 'stt_providers' in scenario.tags:
         setup_stt_providers(context)
@@ -67,8 +69,7 @@ def mock_fetch_ingest(self: FileFeedingService, guid: str):
     feeding_parser = self.get_feed_parser(self.provider)
 
     with open(file_path, "rb") as f:
-        xml_string = etree.etree.fromstring(f.read())
-        return feeding_parser.parse(xml_string, self.provider)
+        return list(feeding_parser.parse_stream(f, self.provider))
 
 
 def setup_stt_providers(context):
@@ -16,6 +16,10 @@ import superdesk
 from flask_script import Manager
 from app import get_app
 
+# Development commands, only registered here so the rest, work and wamp processes don't load them
+import stt.feed_generator  # noqa
+import stt.startup  # noqa
+
 app = get_app()
 manager = Manager(app)
 
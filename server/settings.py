@@ -83,12 +83,32 @@ SCHEMA = {
 }
 QCODE_MISSING_VOC = "create"
 
+#: Link published content to coverages with a Celery task (see ``stt.tasks``), instead of while publishing
+STT_ASYNC_CONTENT_LINKING = env('STT_ASYNC_CONTENT_LINKING', 'false').lower() == 'true'
+
+#: Record the timings of the stages of the ingest and content linking (see ``stt.instrumentation``)
+STT_INSTRUMENTATION = env('STT_INSTRUMENTATION', 'false').lower() == 'true'
+
+#: Record the STT ingest and linking metrics in Redis, served at ``/stt/metrics`` (see ``stt.metrics``)
+STT_METRICS = env('STT_METRICS', 'false').lower() == 'true'
+
+#: Bearer token required to read ``/stt/metrics``, the endpoint is not served if empty
+STT_METRICS_TOKEN = env('STT_METRICS_TOKEN', '')
+
 INSTALLED_APPS = [
+    'stt.instrumentation',
+    'stt.metrics',
     'stt.parser',
     'stt.stt_events_ml',
+    'stt.contact_index',
+    'stt.vocabularies',
+    'stt.ingest_providers',
+    'stt.content_uris',
     'stt.stt_planning_ml',
     'stt.signal_hooks',
+    'stt.tasks',
     'planning',
+    'stt.indexes',
     'apps.languages',
 ]
 
@@ -0,0 +1,105 @@
+from typing import Dict, Any, Hashable, Optional, Tuple
+from collections import OrderedDict
+from threading import RLock
+import time
+
+_registered_caches: Dict[str, Any] = {}
+
+
+def register_cache(cache):
+    """Register a cache, which must provide ``name``, ``clear()`` and ``stats()``"""
+
+    _registered_caches[cache.name] = cache
+    return cache
+
+
+class LRUCache:
+    """Thread-safe, size bounded Least Recently Used cache
+
+    Entries expire ``ttl`` seconds after being set, if provided (i.e. for data other processes can change).
+    Every cache is registered by its ``name`` so all of them can be cleared at once (see ``clear_caches``)
+    """
+
+    def __init__(self, name: str, max_size: int, ttl: Optional[float] = None):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = RLock()
+        register_cache(self)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the value without counting a hit or miss, nor marking it as recently used"""
+
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+            return default if expires is not None and expires <= time.monotonic() else value
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (value, None if self.ttl is None else time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                return self._data.pop(key)[0]
+            except KeyError:
+                return default
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def clear_caches():
+    """Clear all registered caches (used when the underlying data is reset, i.e. between tests)"""
+
+    for cache in _registered_caches.values():
+        cache.clear()
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _registered_caches.items()}
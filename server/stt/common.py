@@ -1,4 +1,6 @@
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, List, Optional, Set
+import logging
+import time
 
 from xml.etree.ElementTree import Element
 from eve.utils import config
@@ -7,29 +9,106 @@ from superdesk import get_resource_service
 from superdesk.metadata.item import ITEM_TYPE, ITEM_STATE
 from planning.common import WORKFLOW_STATE, POST_STATE, update_post_item
 
+from .cache import LRUCache
+from .xml_utils import REMOVE_SIGNAL_XPATH
+from .instrumentation import instrumented
+
+logger = logging.getLogger(__name__)
+
+ITEM_ID_CACHE_SIZE = 10000
+
+#: Workflow states of the items spiked (instead of cancelled) when receiving the ``sttinstruct:remove`` signal
+SPIKE_STATES = (
+    WORKFLOW_STATE.INGESTED,
+    WORKFLOW_STATE.DRAFT,
+    WORKFLOW_STATE.POSTPONED,
+    WORKFLOW_STATE.CANCELLED,
+)
+
+#: Canonical (date-less) ID of ingested Events and Planning items, see ``remove_date_portion_from_id``
+SHORT_ID_FIELD = "extra.stt_short_id"
+
+_item_id_caches: Dict[str, LRUCache] = {}
+
 
 def planning_xml_contains_remove_signal(xml: Element) -> bool:
     """Returns ``True`` if the ``sttinstruct:remove`` signal is included, ``False`` otherwise"""
 
-    namespaces = {"iptc": "http://iptc.org/std/nar/2006-10-01/"}
-    if xml.xpath("//iptc:itemMeta/iptc:signal[@qcode='sttinstruct:remove']", namespaces=namespaces):
-        return True
-    return False
+    return REMOVE_SIGNAL_XPATH(xml)
+
+
+class RemoveItemsFailed(Exception):
+    """Raised when some of the items that received the ``sttinstruct:remove`` signal failed to be removed"""
+
+    def __init__(self, failed: List[str], counts: Dict[str, int]):
+        super().__init__(f"Failed to remove items: {', '.join(failed)}")
+        self.failed = failed
+        self.counts = counts
 
 
 def unpost_or_spike_event_or_planning(item: Dict[str, Any]):
-    item_resource = "events" if item.get(ITEM_TYPE) == "event" else "planning"
-    original: Dict[str, Any] = get_resource_service(item_resource).find_one(req=None, _id=item["guid"]) or {}
+    unpost_or_spike_events_and_planning([item])
+
 
-    if not original.get("pubstatus") and original.get(ITEM_STATE) in [
-        WORKFLOW_STATE.INGESTED,
-        WORKFLOW_STATE.DRAFT,
-        WORKFLOW_STATE.POSTPONED,
-        WORKFLOW_STATE.CANCELLED,
-    ]:
-        get_resource_service(item_resource + "_spike").patch(original[config.ID_FIELD], original)
-    elif original.get("pubstatus") != POST_STATE.CANCELLED:
-        update_post_item({"pubstatus": POST_STATE.CANCELLED, "_etag": original["_etag"]}, original)
+def unpost_or_spike_events_and_planning(items: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+    """Spike or cancel the Events and Planning items that received the ``sttinstruct:remove`` signal
+
+    Items are grouped by resource, and their originals fetched with a single query per resource.
+    Items not posted yet (and still a draft) are spiked, posted items have their post cancelled.
+
+    The state changes can't be written in bulk: the Planning services have no bulk spike or post,
+    and apply the Planning workflow to each item (lock and state checks, spiking or cancelling the
+    Planning items of an Event, history, re-posting to subscribers and notifications). So they still
+    go through the services one item at a time, and an item failing doesn't stop the others being removed.
+
+    Returns the number of items spiked, cancelled and skipped (already cancelled or not found).
+    Raises ``RemoveItemsFailed`` once all the items are processed, if any of them failed to be removed.
+    """
+
+    start = time.perf_counter()
+    counts = {"spiked": 0, "cancelled": 0, "skipped": 0, "failed": 0}
+    failed: List[str] = []
+    first_error: Optional[Exception] = None
+    ids_by_resource: Dict[str, List[str]] = {}
+    for item in items:
+        resource = "events" if item.get(ITEM_TYPE) == "event" else "planning"
+        ids_by_resource.setdefault(resource, []).append(item["guid"])
+
+    for resource, item_ids in ids_by_resource.items():
+        originals = {
+            original[config.ID_FIELD]: original
+            for original in get_resource_service(resource).get_from_mongo(
+                req=None,
+                lookup={config.ID_FIELD: {"$in": list(set(item_ids))}},
+            )
+        }
+        counts["skipped"] += len(set(item_ids) - set(originals.keys()))
+
+        spike_service = get_resource_service(resource + "_spike")
+        for original in originals.values():
+            try:
+                if not original.get("pubstatus") and original.get(ITEM_STATE) in SPIKE_STATES:
+                    spike_service.patch(original[config.ID_FIELD], original)
+                    counts["spiked"] += 1
+                elif original.get("pubstatus") != POST_STATE.CANCELLED:
+                    update_post_item({"pubstatus": POST_STATE.CANCELLED, "_etag": original["_etag"]}, original)
+                    counts["cancelled"] += 1
+                else:
+                    counts["skipped"] += 1
+            except Exception as error:
+                logger.exception("Failed to remove item", extra=dict(resource=resource, item_id=original["_id"]))
+                counts["failed"] += 1
+                failed.append(original[config.ID_FIELD])
+                first_error = first_error or error
+
+    if ids_by_resource:
+        logger.info("Processed remove signals", extra=dict(
+            **counts,
+            duration_ms=round((time.perf_counter() - start) * 1000, 2),
+        ))
+    if failed:
+        raise RemoveItemsFailed(failed, counts) from first_error
+    return counts
 
 
 def remove_date_portion_from_id(item_id: str) -> str:
@@ -51,8 +130,97 @@ def remove_date_portion_from_id(item_id: str) -> str:
     return ":".join(id_parts)
 
 
-def original_item_exists(resource: str, item_id: str) -> bool:
-    return get_resource_service(resource).find_one(req=None, _id=item_id) is not None
+def set_short_id(item: Dict[str, Any]):
+    """Stores the canonical short ID of an ingested Event or Planning item under ``SHORT_ID_FIELD``"""
+
+    item.setdefault("extra", {})["stt_short_id"] = remove_date_portion_from_id(item["guid"])
+
+
+def get_short_id_lookup(short_ids: Iterable[str], item_ids: Iterable[str] = ()) -> Dict[str, Any]:
+    """Returns the lookup for items by their short ID (or ``_id``, for items stored before ``SHORT_ID_FIELD``)"""
+
+    short_ids = list(set(short_ids))
+    return {"$or": [
+        {SHORT_ID_FIELD: {"$in": short_ids}},
+        {config.ID_FIELD: {"$in": list(set(short_ids) | set(item_ids))}},
+    ]}
+
+
+def find_stored_item_ids(resource: str, item_ids: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Returns the ID each ingested Event or Planning ID is stored with, ``None`` if not stored
+
+    An item stored with the exact ID requested is used first, then one stored with the ID
+    without its date portion (see ``remove_date_portion_from_id``).
+    All the IDs are looked up with a single ``_id`` query.
+    """
+
+    short_ids = {item_id: remove_date_portion_from_id(item_id) for item_id in item_ids}
+    if not short_ids:
+        return {}
+
+    stored_ids = {
+        doc[config.ID_FIELD]
+        for doc in get_resource_service(resource).get_from_mongo(
+            req=None,
+            lookup={config.ID_FIELD: {"$in": list(set(short_ids.keys()) | set(short_ids.values()))}},
+            projection={config.ID_FIELD: 1},
+        )
+    }
+
+    found: Dict[str, Optional[str]] = {}
+    for item_id, short_id in short_ids.items():
+        if item_id in stored_ids:
+            found[item_id] = item_id
+        elif short_id in stored_ids:
+            found[item_id] = short_id
+        else:
+            found[item_id] = None
+    return found
+
+
+def _get_item_id_cache(resource: str) -> LRUCache:
+    try:
+        return _item_id_caches[resource]
+    except KeyError:
+        cache = _item_id_caches[resource] = LRUCache(f"{resource}_item_ids", ITEM_ID_CACHE_SIZE)
+        return cache
+
+
+@instrumented("resolve_item_ids", len)
+def resolve_item_ids(resource: str, item_ids: Iterable[str]) -> Dict[str, str]:
+    """Resolves ingested Event or Planning IDs to the ID the item is stored with
+
+    Items that were ingested with the full ID (including the date portion) keep using it,
+    otherwise the date portion is removed (see ``remove_date_portion_from_id``).
+
+    IDs not already known are resolved using a single query (see ``find_stored_item_ids``), and the result
+    is kept in an LRU cache so repeat deliveries of the same item don't touch the database.
+    """
+
+    cache = _get_item_id_cache(resource)
+    resolved: Dict[str, str] = {}
+    unresolved = set()
+
+    for item_id in item_ids:
+        if item_id in resolved:
+            continue
+
+        cached_id = cache.get(item_id)
+        if cached_id is not None:
+            resolved[item_id] = cached_id
+        else:
+            unresolved.add(item_id)
+
+    if unresolved:
+        for item_id, stored_id in find_stored_item_ids(resource, unresolved).items():
+            resolved[item_id] = stored_id or remove_date_portion_from_id(item_id)
+            cache.set(item_id, resolved[item_id])
+
+    return resolved
+
+
+def resolve_item_id(resource: str, item_id: str) -> str:
+    return resolve_item_ids(resource, [item_id])[item_id]
 
 
 def is_online_version(item: Dict[str, Any]) -> bool:
@@ -63,3 +231,30 @@ def is_online_version(item: Dict[str, Any]) -> bool:
         ),
         None
     ) is not None
+
+
+class SubjectMerger:
+    """Appends subjects to an item, keeping a set based index of the names of the subjects it already has
+
+    Subjects are appended in order, using ``add`` (unconditionally) or ``add_if_new_name``
+    (skipped if a subject with the same ``name`` exists).
+    """
+
+    def __init__(self, item: Dict[str, Any]):
+        if item.get("subject") is None:
+            item["subject"] = []
+        self.subjects = item["subject"]
+        self._names: Set[Optional[str]] = {subject.get("name") for subject in self.subjects}
+
+    def has_name(self, name: Optional[str]) -> bool:
+        return name in self._names
+
+    def add(self, subject: Dict[str, Any]):
+        self.subjects.append(subject)
+        self._names.add(subject.get("name"))
+
+    def add_if_new_name(self, subject: Dict[str, Any]) -> bool:
+        if self.has_name(subject.get("name")):
+            return False
+        self.add(subject)
+        return True
@@ -0,0 +1,167 @@
+from typing import Dict, Any, Optional, Tuple, Union
+from threading import RLock
+from bson import ObjectId
+
+from superdesk import get_resource_service
+from superdesk.factory.app import SuperdeskEve
+
+from .cache import register_cache
+
+NameKey = Tuple[str, str]
+
+
+def normalise_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def get_name_key(first_name: str, last_name: str) -> NameKey:
+    return first_name.strip().lower(), last_name.strip().lower()
+
+
+class ContactIndex:
+    """In-process index of media contacts, keyed by email address and first/last name
+
+    The index is warmed from the ``contacts`` collection on first use, and kept up to date
+    by the ``contacts`` resource hooks (see ``init_app``) and the Events parser when it creates contacts.
+    As other processes may create, edit or delete contacts too, neither a miss nor a hit is authoritative.
+    Callers should fall back to searching Elasticsearch on a miss (recording it with ``fallbacks``, so the
+    fallback rate can be monitored), and check a hit still ``matches`` the stored contact before using it.
+    """
+
+    name = "contact_index"
+
+    def __init__(self):
+        self.warm = False
+        self.lookups = 0
+        self.hits = 0
+        self.fallbacks = 0
+        self.stale = 0
+        self._by_email: Dict[str, ObjectId] = {}
+        self._by_name: Dict[NameKey, ObjectId] = {}
+        self._lock = RLock()
+
+    def warm_up(self):
+        with self._lock:
+            if self.warm:
+                return
+
+            for contact in get_resource_service("contacts").get_from_mongo(
+                req=None,
+                lookup={},
+                projection={"first_name": 1, "last_name": 1, "contact_email": 1},
+            ):
+                self.add(contact)
+            self.warm = True
+
+    def add(self, contact: Dict[str, Any]):
+        contact_id = contact.get("_id")
+        if contact_id is None:
+            return
+
+        contact_id = ObjectId(contact_id)
+        with self._lock:
+            for email in contact.get("contact_email") or []:
+                if email:
+                    self._by_email[normalise_email(email)] = contact_id
+
+            if contact.get("first_name") and contact.get("last_name"):
+                self._by_name[get_name_key(contact["first_name"], contact["last_name"])] = contact_id
+
+    def remove(self, contact: Dict[str, Any]):
+        contact_id = contact.get("_id")
+        if contact_id is None:
+            return
+
+        contact_id = ObjectId(contact_id)
+        with self._lock:
+            for email in contact.get("contact_email") or []:
+                if email and self._by_email.get(normalise_email(email)) == contact_id:
+                    del self._by_email[normalise_email(email)]
+
+            if contact.get("first_name") and contact.get("last_name"):
+                name_key = get_name_key(contact["first_name"], contact["last_name"])
+                if self._by_name.get(name_key) == contact_id:
+                    del self._by_name[name_key]
+
+    def get(self, contact: Dict[str, Any]) -> Optional[ObjectId]:
+        """Returns the ID of an indexed contact, matching on email first then on first/last name"""
+
+        self.warm_up()
+        self.lookups += 1
+
+        contact_id = None
+        if len(contact.get("contact_email") or []):
+            contact_id = self._by_email.get(normalise_email(contact["contact_email"][0]))
+
+        if contact_id is None and contact.get("first_name") and contact.get("last_name"):
+            contact_id = self._by_name.get(get_name_key(contact["first_name"], contact["last_name"]))
+
+        if contact_id is not None:
+            self.hits += 1
+        return contact_id
+
+    def matches(self, existing: Dict[str, Any], contact: Dict[str, Any]) -> bool:
+        """Returns ``True`` if the ``existing`` contact still has the email or first/last name of ``contact``"""
+
+        if len(contact.get("contact_email") or []):
+            email = normalise_email(contact["contact_email"][0])
+            if any(normalise_email(existing_email) == email for existing_email in existing.get("contact_email") or []
+                   if existing_email):
+                return True
+
+        return bool(
+            contact.get("first_name") and contact.get("last_name") and
+            existing.get("first_name") and existing.get("last_name") and
+            get_name_key(contact["first_name"], contact["last_name"]) ==
+            get_name_key(existing["first_name"], existing["last_name"])
+        )
+
+    def clear(self):
+        with self._lock:
+            self._by_email.clear()
+            self._by_name.clear()
+            self.warm = False
+            self.lookups = 0
+            self.hits = 0
+            self.fallbacks = 0
+            self.stale = 0
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            "emails": len(self._by_email),
+            "names": len(self._by_name),
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "fallbacks": self.fallbacks,
+            "stale": self.stale,
+            "fallback_rate": self.fallbacks / self.lookups if self.lookups else 0.0,
+        }
+
+
+contact_index = register_cache(ContactIndex())
+
+
+def on_contacts_inserted(docs):
+    for doc in docs:
+        contact_index.add(doc)
+
+
+def on_contact_updated(updates, original):
+    contact_index.remove(original)
+    contact_index.add({**original, **updates})
+
+
+def on_contact_replaced(document, original):
+    contact_index.remove(original)
+    contact_index.add({**document, "_id": original.get("_id")})
+
+
+def on_contact_deleted(doc):
+    contact_index.remove(doc)
+
+
+def init_app(app: SuperdeskEve):
+    app.on_inserted_contacts += on_contacts_inserted
+    app.on_updated_contacts += on_contact_updated
+    app.on_replaced_contacts += on_contact_replaced
+    app.on_deleted_item_contacts += on_contact_deleted
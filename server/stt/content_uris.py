@@ -0,0 +1,119 @@
+"""Cache of the content linked to coverages, keyed by its canonical STT URI
+
+Linking coverages to content looks the content up by ``uri``, searching Elasticsearch across
+``archive``, ``published`` and ``archived`` for the content with the lowest ``rewrite_sequence``. This cache maps
+each URI to the ``_id`` of the content found by the search, so known content is read from the ``archive`` collection
+by ``_id`` instead, falling back to the search on a miss.
+
+Only the search results are authoritative, so the cache is only filled from them (see ``record_content``).
+The ``archive`` resource hooks (see ``init_app``) remove the entries that may no longer be the content to link,
+and entries expire after ``CONTENT_URI_CACHE_TTL`` as content can change in other processes.
+"""
+
+from typing import Dict, Any, Iterable, NamedTuple, Optional, Tuple
+
+from eve.utils import config
+
+from superdesk import get_resource_service
+from superdesk.factory.app import SuperdeskEve
+
+from .cache import LRUCache
+
+CONTENT_URI_CACHE_SIZE = 10000
+CONTENT_URI_CACHE_TTL = 600
+
+
+class CachedContent(NamedTuple):
+    item_id: str
+    rewrite_sequence: Optional[int]
+
+
+content_uri_cache = LRUCache("content_uris", CONTENT_URI_CACHE_SIZE, ttl=CONTENT_URI_CACHE_TTL)
+
+
+def get_rewrite_sort_key(content: Dict[str, Any]) -> Tuple[bool, int]:
+    """Sorts content as the content search does: lowest ``rewrite_sequence`` first, content without one last"""
+
+    rewrite_sequence = content.get("rewrite_sequence")
+    return rewrite_sequence is None, rewrite_sequence or 0
+
+
+def record_content(content: Dict[str, Any]):
+    """Add content found by the content search to the cache
+
+    The search returns the content with the lowest ``rewrite_sequence`` of a uri first,
+    only that content must be recorded.
+    """
+
+    uri = content.get("uri")
+    item_id = content.get(config.ID_FIELD)
+    if not uri or not item_id:
+        return
+
+    content_uri_cache.set(uri, CachedContent(item_id, content.get("rewrite_sequence")))
+
+
+def invalidate_content(content: Dict[str, Any]):
+    """Remove the entry of the uri of the content, if it's this content or this content would be linked instead"""
+
+    uri = content.get("uri")
+    cached: Optional[CachedContent] = content_uri_cache.peek(uri) if uri else None
+    if cached is not None and (
+        cached.item_id == content.get(config.ID_FIELD) or
+        get_rewrite_sort_key(content) <= get_rewrite_sort_key(cached._asdict())
+    ):
+        content_uri_cache.pop(uri)
+
+
+def get_cached_content(uris: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Returns the content of the cached uris, read from the ``archive`` collection with a single query
+
+    Content no longer in ``archive`` (i.e. archived) is removed from the cache, to be searched for again.
+    """
+
+    entries: Dict[str, CachedContent] = {}
+    for uri in set(uris):
+        entry = content_uri_cache.get(uri)
+        if entry is not None:
+            entries[uri] = entry
+
+    if not entries:
+        return {}
+
+    items = {
+        item[config.ID_FIELD]: item
+        for item in get_resource_service("archive").get_from_mongo(
+            req=None,
+            lookup={config.ID_FIELD: {"$in": list(set(entry.item_id for entry in entries.values()))}},
+        )
+    }
+
+    content: Dict[str, Dict[str, Any]] = {}
+    for uri, entry in entries.items():
+        if entry.item_id in items:
+            content[uri] = items[entry.item_id]
+        else:
+            content_uri_cache.pop(uri)
+    return content
+
+
+def on_archive_inserted(docs):
+    for doc in docs:
+        invalidate_content(doc)
+
+
+def on_archive_updated(updates, original):
+    if "uri" in updates or "rewrite_sequence" in updates:
+        invalidate_content(original)
+        invalidate_content({**original, **updates})
+
+
+def on_archive_deleted(doc):
+    invalidate_content(doc)
+
+
+def init_app(app: SuperdeskEve):
+    app.on_inserted_archive += on_archive_inserted
+    app.on_updated_archive += on_archive_updated
+    app.on_replaced_archive += on_archive_updated
+    app.on_deleted_item_archive += on_archive_deleted
@@ -0,0 +1,131 @@
+"""Copy-on-write updates of the coverages of a Planning item
+
+The signal hooks linking content to coverages used to ``deepcopy`` every coverage of the Planning item
+and patch all of them back, even when only one coverage changed (or none did). ``CoverageUpdates`` only copies
+the coverages being edited, and ``patch_coverages`` skips the update (and so the re-posting of the Planning item)
+when the coverages didn't change, logging the number of changed coverages and bytes written otherwise.
+
+The Planning service replaces the ``coverages`` of the item as a whole, so the patch still includes every coverage.
+When given the ``_etag`` of the Planning item the coverages were read from (by the content linking task,
+which retries on conflicts), ``patch_coverages`` only patches the item if it wasn't updated since,
+raising ``LinkingConflict`` otherwise.
+"""
+
+from typing import Dict, Any, List, Optional
+from copy import deepcopy
+import logging
+
+import bson
+from eve.utils import config
+from eve.methods.common import resolve_document_etag
+from superdesk import get_resource_service
+
+logger = logging.getLogger(__name__)
+
+
+class LinkingConflict(Exception):
+    """Raised when the Planning item was updated concurrently, while linking content to one of its coverages"""
+
+
+class CoverageUpdates:
+    """Coverages of a Planning item, copying the original coverages only when edited"""
+
+    def __init__(self, planning: Dict[str, Any]):
+        self.original: List[Dict[str, Any]] = planning.get("coverages") or []
+        self.coverages: List[Dict[str, Any]] = list(self.original)
+        self._original_ids = {id(coverage) for coverage in self.original}
+
+    def get(self, coverage_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the first coverage with this ``coverage_id``, to read only"""
+
+        return next((coverage for coverage in self.coverages if coverage.get("coverage_id") == coverage_id), None)
+
+    def edit(self, coverage_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the first coverage with this ``coverage_id``, copied if it's an original coverage"""
+
+        for index, coverage in enumerate(self.coverages):
+            if coverage.get("coverage_id") == coverage_id:
+                return self.edit_at(index)
+        return None
+
+    def edit_at(self, index: int) -> Dict[str, Any]:
+        if id(self.coverages[index]) in self._original_ids:
+            self.coverages[index] = deepcopy(self.coverages[index])
+        return self.coverages[index]
+
+    def get_changed(self) -> List[Dict[str, Any]]:
+        """Returns the coverages added or changed"""
+
+        originals = {coverage.get("coverage_id"): coverage for coverage in self.original}
+        changed = []
+        for coverage in self.coverages:
+            original = originals.get(coverage.get("coverage_id"))
+            if original is not coverage and original != coverage:
+                changed.append(coverage)
+        return changed
+
+    def has_changes(self) -> bool:
+        if [coverage.get("coverage_id") for coverage in self.coverages] != \
+                [coverage.get("coverage_id") for coverage in self.original]:
+            # Coverages were added or removed
+            return True
+        return any(
+            coverage is not original and coverage != original
+            for coverage, original in zip(self.coverages, self.original)
+        )
+
+    def get_updates(self) -> Dict[str, Any]:
+        return {"coverages": self.coverages}
+
+
+def patch_coverages(
+    planning_id: str,
+    updates: CoverageUpdates,
+    etag: Optional[str] = None,
+) -> Optional[Dict[str, Any]]:
+    """Patch the coverages of the Planning item if any changed, returning the updated item (``None`` if unchanged)
+
+    :param etag: The ``_etag`` of the Planning item the coverages were read from, if given ``LinkingConflict``
+        is raised (and the item left unchanged) when the Planning item was updated since
+    """
+
+    if not updates.has_changes():
+        logger.debug("Coverages unchanged, skip updating Planning item", extra=dict(planning_id=planning_id))
+        return None
+
+    planning_updates = updates.get_updates()
+    logger.info("Updating coverages of Planning item", extra=dict(
+        planning_id=planning_id,
+        changed_coverages=len(updates.get_changed()),
+        bytes_written=len(bson.encode(planning_updates)),
+    ))
+    if etag is None:
+        return get_resource_service("planning").patch(planning_id, planning_updates)
+    return _patch_if_unchanged(planning_id, planning_updates, etag)
+
+
+def _patch_if_unchanged(planning_id: str, updates: Dict[str, Any], etag: str) -> Dict[str, Any]:
+    """Patch the Planning item through its service like ``BaseService.patch``, if its ``_etag`` is still ``etag``
+
+    ``BaseService.patch`` reads the original item again, so it would patch over any update made since ``etag``
+    was read. Instead, the original is read with ``etag`` and passed to the service ``update``, whose Mongo update
+    only matches the item with the ``_etag`` of the original. If the item is updated in between, the data layer
+    skips the update (of both Mongo and Elasticsearch), which is detected by reading back the new ``_etag``.
+    """
+
+    planning_service = get_resource_service("planning")
+    original = planning_service.find_one(req=None, _id=planning_id, _etag=etag)
+    if original is None:
+        raise LinkingConflict(planning_id)
+
+    updated = original.copy()
+    planning_service.on_update(updates, original)
+    updated.update(updates)
+    resolve_document_etag(updated, "planning")
+    updates[config.ETAG] = updated[config.ETAG]
+    updated.update(planning_service.update(planning_id, updates, original) or {})
+    if planning_service.find_one(req=None, _id=planning_id, _etag=updates[config.ETAG]) is None:
+        raise LinkingConflict(planning_id)
+
+    planning_service.on_updated(updates, original)
+    return updated
@@ -0,0 +1,362 @@
+"""Generator of synthetic STT feeds, to load test the ingest at a realistic scale
+
+Generates the EventsML, NewsML and PlanningML documents of a number of STT topics, modelled on the documents
+in ``tests/fixtures``. Each topic has an Event, the articles of its text coverages and a Planning item
+with one coverage per article, which references:
+
+* the Event, with a ``cpnat:event`` subject of its coverages
+* the articles, with the ``deliveredItemRef`` of the coverage delivery
+
+The articles and Event reference the topic with a ``stt-topics`` subject. A share of the articles have
+an online version (``sttversion:6``), and a share of the Events and Planning items are removed afterwards
+(``sttinstruct:remove``).
+"""
+
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List, NamedTuple, Optional
+
+from lxml import etree
+from lxml.builder import ElementMaker
+
+import superdesk
+
+from stt.xml_utils import IPTC_NS, STT_NS, XML_NS
+
+E = ElementMaker(namespace=IPTC_NS, nsmap={None: IPTC_NS, "stt": STT_NS})
+STT = ElementMaker(namespace=STT_NS, nsmap={None: IPTC_NS, "stt": STT_NS})
+
+FIRST_EVENT_ID = 300000
+FIRST_TOPIC_ID = 600000
+FIRST_ARTICLE_ID = 130000000
+
+DEPARTMENTS = [("9", "Politiikka"), ("14", "Ulkomaat"), ("2", "Talous"), ("5", "Urheilu")]
+SUBJECTS = [
+    ("11000000", "Politiikka"),
+    ("11006000", "Julkinen hallinto"),
+    ("04000000", "Talous"),
+    ("15000000", "Urheilu"),
+]
+WORDS = (
+    "eduskunta hallitus kokous ministeri kaupunki puolue ehdotus talous vaalit tiedote "
+    "päätös lakiesitys kunta valtuusto yhtiö tulos kausi ottelu joukkue sopimus"
+).split()
+
+
+class GeneratedDocument(NamedTuple):
+    #: The file name of the document, sorted in the order the documents must be ingested
+    filename: str
+    kind: str
+    guid: str
+    xml: bytes
+
+
+def _format_datetime(value: datetime) -> str:
+    return value.isoformat(timespec="seconds")
+
+
+def _get_guid(date: datetime, item_id: int) -> str:
+    return f"urn:newsml:stt.fi:{date:%Y%m%d}:{item_id}"
+
+
+def _root(tag: str, guid: str, version: int = 1, lang: str = "fi-FI") -> etree._Element:
+    root = getattr(E, tag)(
+        guid=guid,
+        version=str(version),
+        standard="NewsML-G2",
+        standardversion="2.12",
+        conformance="power",
+    )
+    root.set(f"{{{STT_NS}}}formatversion", "1.1")
+    root.set(f"{{{XML_NS}}}lang", lang)
+    root.append(E.catalogRef(href="http://www.iptc.org/std/catalog/catalog.IPTC-G2-Standards_19.xml"))
+    root.append(E.catalogRef(href="http://www.stt-lehtikuva.fi/newsml/doc/stt-NewsCodesCatalog_1.xml"))
+    return root
+
+
+def _item_meta(item_class: str, created: datetime, removed: bool = False) -> etree._Element:
+    return E.itemMeta(
+        E.itemClass(qcode=item_class),
+        E.provider(literal="STT"),
+        E.versionCreated(_format_datetime(created)),
+        E.firstCreated(_format_datetime(created)),
+        E.pubStatus(qcode="stat:usable"),
+        E.signal(qcode="sttinstruct:remove" if removed else "sig:update"),
+    )
+
+
+class FeedGenerator:
+    """Generates the documents of ``volume`` STT topics
+
+    :param volume: Number of topics (Events and Planning items)
+    :param coverages: Number of text coverages (and articles) of each Planning item
+    :param contacts: Number of distinct contacts, two of which are added to each Event
+    :param paragraphs: Number of paragraphs of the body of the articles
+    :param online_ratio: Share of the articles with an online version
+    :param remove_ratio: Share of the topics whose Event and Planning item are removed
+    :param seed: Seed of the random generator, the same parameters and seed generate the same feed
+    """
+
+    def __init__(
+        self,
+        volume: int = 100,
+        coverages: int = 3,
+        contacts: int = 50,
+        paragraphs: int = 8,
+        online_ratio: float = 0.1,
+        remove_ratio: float = 0.05,
+        seed: int = 0,
+        start: Optional[datetime] = None,
+    ):
+        self.volume = volume
+        self.coverages = coverages
+        self.contacts = max(contacts, 1)
+        self.paragraphs = paragraphs
+        self.online_ratio = online_ratio
+        self.remove_ratio = remove_ratio
+        self.random = random.Random(seed)
+        self.start = start or datetime(2022, 4, 1, 8, tzinfo=timezone(timedelta(hours=3)))
+        self.count = 0
+
+    def generate(self) -> Iterator[GeneratedDocument]:
+        removed = []
+        for index in range(self.volume):
+            yield from self.generate_topic(index)
+            if self.random.random() < self.remove_ratio:
+                removed.append(index)
+
+        for index in removed:
+            yield self._document("events", self.get_event(index, removed=True))
+            yield self._document("planning", self.get_planning(index, removed=True))
+
+    def generate_topic(self, index: int) -> Iterator[GeneratedDocument]:
+        yield self._document("events", self.get_event(index))
+        for coverage in range(self.coverages):
+            online = self.random.random() < self.online_ratio
+            yield self._document("newsml", self.get_article(index, coverage))
+            if online:
+                yield self._document("newsml", self.get_article(index, coverage, online=True))
+        yield self._document("planning", self.get_planning(index))
+
+    def _document(self, kind: str, root: etree._Element) -> GeneratedDocument:
+        self.count += 1
+        guid = root.get("guid")
+        return GeneratedDocument(
+            f"{self.count:07d}_{kind}_{guid.rsplit(':', 1)[-1]}.xml",
+            kind,
+            guid,
+            etree.tostring(root, xml_declaration=True, encoding="UTF-8"),
+        )
+
+    def get_date(self, index: int) -> datetime:
+        return self.start + timedelta(minutes=15 * index)
+
+    def get_event_guid(self, index: int) -> str:
+        return _get_guid(self.get_date(index), FIRST_EVENT_ID + index)
+
+    def get_planning_guid(self, index: int) -> str:
+        return _get_guid(self.get_date(index), FIRST_TOPIC_ID + index)
+
+    def get_article_id(self, index: int, coverage: int, online: bool = False) -> int:
+        # The online version is a separate article, with the next ID
+        return FIRST_ARTICLE_ID + (index * self.coverages + coverage) * 2 + int(online)
+
+    def get_article_guid(self, index: int, coverage: int, online: bool = False) -> str:
+        return _get_guid(self.get_date(index), self.get_article_id(index, coverage, online))
+
+    def _headline(self, words: int = 6) -> str:
+        return " ".join(self.random.choice(WORDS) for _ in range(words)).capitalize()
+
+    def _subjects(self, index: int) -> List[etree._Element]:
+        department = DEPARTMENTS[index % len(DEPARTMENTS)]
+        subject = SUBJECTS[index % len(SUBJECTS)]
+        return [
+            E.subject(E.name(department[1]), type="cpnat:abstract", qcode=f"sttdepartment:{department[0]}"),
+            E.subject(E.name(subject[1]), type="cpnat:abstract", qcode=f"sttsubj:{subject[0]}"),
+        ]
+
+    def _contact(self, contact: int) -> etree._Element:
+        return E.contactInfo(
+            STT.organization(f"Organisaatio {contact % 10}"),
+            E.phone(f"040 {contact:07d}"),
+            E.email(f"contact{contact}@example.com"),
+            E.web(f"www.example.com/contact/{contact}"),
+            STT.firstname(f"Etunimi{contact}"),
+            STT.lastname(f"Sukunimi{contact}"),
+            STT.title("tiedottaja"),
+        )
+
+    def get_event(self, index: int, removed: bool = False) -> etree._Element:
+        date = self.get_date(index)
+        root = _root("conceptItem", self.get_event_guid(index), version=2 if removed else 1)
+        root.append(_item_meta("cinat:concept", date, removed))
+        root.append(E.contentMeta(
+            E.contentCreated(_format_datetime(date)),
+            E.contentModified(_format_datetime(date)),
+            E.infoSource(E.name("STT"), qcode="sttsource:1"),
+            E.contributor(E.name("STT")),
+            E.language({"tag": "fi-FI"}),
+        ))
+
+        event_details = E.eventDetails(
+            E.dates(E.start(_format_datetime(date + timedelta(days=1)))),
+            E.subject(qcode=f"stt-topics:{FIRST_TOPIC_ID + index}"),
+            *self._subjects(index),
+        )
+        for contact in (index * 2 % self.contacts, (index * 2 + 1) % self.contacts):
+            event_details.append(self._contact(contact))
+        event_details.append(E.location(
+            E.name(f"Paikka {index % 20}"),
+            E.broader(E.name("Helsinki"), type="cpnat:geoArea", qcode="sttcity:35"),
+            E.broader(E.name("Uusimaa"), type="cpnat:geoArea", qcode="sttstate:31"),
+            E.broader(
+                E.name("Suomi", role="nrol:display"),
+                E.sameAs(qcode="iso3166-1a2:FI"),
+                type="cpnat:geoArea",
+                qcode="sttcountry:1",
+            ),
+            qcode=f"sttlocationalias:{20000 + index % 20}",
+        ))
+
+        root.append(E.concept(
+            E.conceptId(qcode=f"sttevents:{FIRST_EVENT_ID + index}", created=_format_datetime(date)),
+            E.type(qcode="cpnat:event"),
+            E.name(self._headline()),
+            E.definition(self._headline(20), role="drol:summary"),
+            E.note(f"Kutsu medialle: www.example.com/event/{index}", role="sttdescription:eventinv"),
+            E.related(E.name("Mediatilaisuudet"), rel="sttnat:sttEventType", qcode="sttEventType:21"),
+            event_details,
+        ))
+        return root
+
+    def get_article(self, index: int, coverage: int, online: bool = False) -> etree._Element:
+        date = self.get_date(index) + timedelta(days=1, minutes=coverage)
+        guid = self.get_article_guid(index, coverage, online)
+        root = _root("newsItem", guid)
+        root.append(_item_meta("ninat:text", date))
+        root[-1].append(E.link(guidref=guid, version="1"))
+
+        if online:
+            version = E.genre(E.name("Nettiuutiset"), literal="Nettiuutiset", qcode="sttversion:6",
+                              type="sttnat:versiontype")
+        else:
+            version = E.genre(E.name("Pika+"), literal="Pika+", qcode="sttversion:1", type="sttnat:versiontype")
+        root.append(E.contentMeta(
+            E.urgency("3"),
+            E.contentCreated(_format_datetime(date)),
+            E.contentModified(_format_datetime(date)),
+            E.altId(str(self.get_article_id(index, coverage, online)), type="sttidtype:textid"),
+            E.subject(qcode=f"stt-topics:{FIRST_TOPIC_ID + index}", type="cpnat:abstract"),
+            E.located(E.name("Helsinki"), type="loctyp:City"),
+            E.infoSource(E.name("STT"), qcode="sttsource:1"),
+            *self._subjects(index),
+            E.slugline(f"juttu-{index}-{coverage}"),
+            E.dateline("Helsinki"),
+            E.headline(self._headline()),
+            E.genre(E.name("Pääjuttu"), literal="Pääjuttu", qcode="sttgenre:1", type="sttnat:texttype"),
+            version,
+        ))
+
+        body = E.body()
+        for _ in range(self.paragraphs):
+            body.append(E.p(self._headline(self.random.randint(20, 60)) + "."))
+        root.append(E.contentSet(E.inlineXML(E.html(body), contenttype="xhtml/xml")))
+        return root
+
+    def get_planning(self, index: int, removed: bool = False) -> etree._Element:
+        date = self.get_date(index)
+        topic_id = FIRST_TOPIC_ID + index
+        department = DEPARTMENTS[index % len(DEPARTMENTS)]
+        root = _root("planningItem", self.get_planning_guid(index), version=2 if removed else 1, lang="fi")
+        root.append(_item_meta("plinat:newscoverage", date, removed))
+        root.append(E.contentMeta(
+            E.urgency("3"),
+            E.contentCreated(_format_datetime(date)),
+            E.contentModified(_format_datetime(date)),
+            E.headline(self._headline()),
+            E.description(self._headline(20), role="drol:summary"),
+            E.subject(
+                E.related(rel="sttrel:assigneddate", value=f"{date + timedelta(days=1):%Y-%m-%d}",
+                          valuedatatype="Date"),
+                qcode=f"stt-topics:{topic_id}",
+            ),
+            E.subject(E.name(department[1]), type="cpnat:department", qcode=f"sttdepartment:{department[0]}"),
+        ))
+
+        coverage_set = E.newsCoverageSet()
+        for coverage in range(self.coverages):
+            article_guid = self.get_article_guid(index, coverage)
+            coverage_set.append(E.newsCoverage(
+                E.planning(
+                    E.g2contentType("application/vnd.iptc.g2.newsitem+xml"),
+                    E.itemClass(qcode="ninat:text"),
+                    E.headline(self._headline()),
+                    E.description(),
+                    E.subject(qcode=f"stt-topics:{topic_id}", type="cpnat:abstract"),
+                    E.subject(E.name(self._headline(3)), type="cpnat:event", qcode=self.get_event_guid(index)),
+                    E.genre(E.name("Pääjuttu"), qcode="sttgenre:1"),
+                ),
+                E.delivery(E.deliveredItemRef(
+                    E.modified(_format_datetime(date + timedelta(days=1))),
+                    E.version(),
+                    guidref=article_guid,
+                )),
+                id=f"ID_TEXT_{self.get_article_id(index, coverage)}",
+            ))
+        root.append(coverage_set)
+        return root
+
+
+def write_feed(generator: FeedGenerator, path: str) -> List[GeneratedDocument]:
+    """Writes the documents of the feed to the ``path`` directory, returning them without their XML"""
+
+    os.makedirs(path, exist_ok=True)
+    documents = []
+    for document in generator.generate():
+        with open(os.path.join(path, document.filename), "wb") as f:
+            f.write(document.xml)
+        documents.append(document._replace(xml=b""))
+    return documents
+
+
+class GenerateFeedCommand(superdesk.Command):
+    """Generates a synthetic STT feed of NewsML, EventsML and PlanningML documents, to load test the ingest
+
+    The documents are written to the ``--path`` directory, with file names sorted in the order to ingest them.
+
+    Example:
+    ::
+
+        $ python manage.py stt:generate_feed --path /tmp/stt_feed
+        $ python manage.py stt:generate_feed --path /tmp/stt_feed --volume 5000 --coverages 10 --contacts 2000
+
+    """
+
+    option_list = [
+        superdesk.Option("--path", "-p", dest="path", required=True, help="Directory the documents are written to"),
+        superdesk.Option("--volume", "-v", dest="volume", type=int, default=100, help="Number of topics"),
+        superdesk.Option("--coverages", "-c", dest="coverages", type=int, default=3,
+                         help="Number of text coverages (and articles) of each Planning item"),
+        superdesk.Option("--contacts", dest="contacts", type=int, default=50, help="Number of distinct contacts"),
+        superdesk.Option("--paragraphs", dest="paragraphs", type=int, default=8,
+                         help="Number of paragraphs of the articles"),
+        superdesk.Option("--online-ratio", dest="online_ratio", type=float, default=0.1,
+                         help="Share of the articles with an online version"),
+        superdesk.Option("--remove-ratio", dest="remove_ratio", type=float, default=0.05,
+                         help="Share of the Events and Planning items removed afterwards"),
+        superdesk.Option("--seed", dest="seed", type=int, default=0, help="Seed of the random generator"),
+    ]
+
+    def run(self, path, volume=100, coverages=3, contacts=50, paragraphs=8, online_ratio=0.1, remove_ratio=0.05,
+            seed=0):
+        documents = write_feed(
+            FeedGenerator(volume, coverages, contacts, paragraphs, online_ratio, remove_ratio, seed),
+            path,
+        )
+        for kind in ("events", "newsml", "planning"):
+            print(f"{kind}: {sum(1 for document in documents if document.kind == kind)} document(s)")
+        print(f"Written {len(documents)} document(s) to {path}")
+
+
+superdesk.command("stt:generate_feed", GenerateFeedCommand())
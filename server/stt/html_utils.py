@@ -0,0 +1,70 @@
+"""Sanitising and rewriting of the body of STT NewsML items
+
+``clean_body_html`` produces the same HTML as cleaning the body with ``superdesk.etree.clean_html``,
+replacing ``<pre>`` with ``<p>``, opening links in a new window, serialising each child of the body
+and joining them with new lines. The body is sanitised by the lxml ``Cleaner`` (built once per set of
+allowed tags), rewritten in a single walk of the cleaned tree and serialised once.
+"""
+
+from typing import Dict, FrozenSet, Iterable
+from functools import lru_cache
+
+from lxml import etree, html
+from lxml.html import defs
+from lxml.html.clean import Cleaner
+
+ENDASH_ARTEFACT = "&lt;endash&gt;-&lt;/endash&gt;"
+
+SAFE_ATTRS = frozenset(defs.safe_attrs - {"class"})
+
+
+@lru_cache(maxsize=None)
+def get_allowed_tags(tags: Iterable[str]) -> FrozenSet[str]:
+    return frozenset(tags)
+
+
+@lru_cache(maxsize=None)
+def get_body_cleaner(allowed_tags: FrozenSet[str]) -> Cleaner:
+    """Returns the ``Cleaner`` configured as in ``superdesk.etree.clean_html``"""
+
+    return Cleaner(allow_tags=allowed_tags, remove_unknown_tags=False, safe_attrs=SAFE_ATTRS)
+
+
+def clean_body_html(body_elt: etree._Element, allowed_tags: Iterable[str]) -> Dict[str, str]:
+    """Returns the ``content`` (and ``format`` if plain text) of an item from its ``body`` element"""
+
+    allowed_tags = get_allowed_tags(tuple(allowed_tags))
+    source = etree.tostring(body_elt)
+
+    root = html.fromstring(source)
+    get_body_cleaner(allowed_tags)(root)
+    for elt in root.iter("pre", "a"):
+        if elt.tag == "pre":
+            elt.tag = "p"
+        else:
+            elt.attrib["target"] = "_blank"
+
+    content = {}
+    if len(root) > 0:
+        # Serialise the children in one go, separated by new lines
+        root.text = None
+        unwrapped = []
+        for child in root:
+            if child.tag == "div" and not child.attrib and not child.tail:
+                # ``superdesk.etree.to_string`` removes the ``<div>`` around children serialised on their own
+                unwrapped.append(child)
+            if child.getnext() is not None:
+                child.tail = (child.tail or "") + "\n"
+        for child in unwrapped:
+            child.drop_tag()
+        root.tag = "div"
+        root.attrib.clear()
+        content["content"] = etree.tostring(root, encoding="unicode", method="html", with_tail=False)[5:-6]
+    elif root.text:
+        content["content"] = "<p>" + root.text + "</p>"
+        content["format"] = "xhtml/xml"
+
+    if content.get("content"):
+        content["content"] = content["content"].replace(ENDASH_ARTEFACT, "-")
+
+    return content
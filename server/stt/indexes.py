@@ -0,0 +1,163 @@
+"""Mongo indexes backing the STT lookups of ingested Events, Planning items and deliveries
+
+The indexes are added to the ``mongo_indexes__init`` of the Superdesk Planning resources,
+so they're created along with the other indexes by ``app:initialize_data``.
+Items ingested before ``SHORT_ID_FIELD`` was stored are updated by the data updates using ``backfill_short_ids``.
+The ``stt:index_report`` command reports how the indexes are used, and which of the STT indexes are missing.
+"""
+
+from typing import Dict, Any, Iterable, List, Tuple
+
+from flask import current_app as app
+from pymongo import UpdateOne
+
+import superdesk
+from superdesk.factory.app import SuperdeskEve
+
+from .common import SHORT_ID_FIELD, remove_date_portion_from_id
+
+STT_ID_PREFIX = "urn:newsml:stt.fi:"
+BACKFILL_BATCH_SIZE = 1000
+
+STT_MONGO_INDEXES: Dict[str, Dict[str, Any]] = {
+    "events": {
+        "stt_short_id_1": ([(SHORT_ID_FIELD, 1)], {"sparse": True, "background": True}),
+    },
+    "planning": {
+        "stt_short_id_1": ([(SHORT_ID_FIELD, 1)], {"sparse": True, "background": True}),
+    },
+    # MongoDB can't build partial indexes of the unlinked deliveries only, as a ``partialFilterExpression``
+    # doesn't support ``{"assignment_id": None}`` (nor ``$exists: false`` or ``$ne``).
+    # So ``assignment_id`` is part of the keys instead, after the fields queried by equality.
+    "delivery": {
+        # ``{planning_id}`` (the projected read of the PlanningML parser, served by the index) and
+        # ``{planning_id, coverage_id, assignment_id: None, item_id: {$ne: None}}`` (``link_coverages_to_content``)
+        "stt_planning_id_1_coverage_id_1_assignment_id_1_item_id_1": (
+            [("planning_id", 1), ("coverage_id", 1), ("assignment_id", 1), ("item_id", 1)],
+            {"background": True},
+        ),
+        # ``{item_id, assignment_id: None}`` (``before_content_published``),
+        # content is linked to deliveries using its URI, which is already the short ID of the content
+        "stt_item_id_1_assignment_id_1": ([("item_id", 1), ("assignment_id", 1)], {"background": True}),
+        # ``{coverage_id, assignment_id: None}`` (removing the temporary deliveries once linked)
+        "stt_coverage_id_1_assignment_id_1": ([("coverage_id", 1), ("assignment_id", 1)], {"background": True}),
+    },
+}
+
+#: Collections queried by STT, reported by the ``stt:index_report`` command
+REPORTED_RESOURCES = ("events", "planning", "delivery", "assignments", "contacts", "ingest_providers")
+
+
+def backfill_short_ids(mongodb_collection) -> int:
+    """Stores ``SHORT_ID_FIELD`` on the STT items of the collection missing it, returning the number updated"""
+
+    updated = 0
+    requests: List[UpdateOne] = []
+    for doc in mongodb_collection.find(
+        {"_id": {"$regex": f"^{STT_ID_PREFIX}"}, SHORT_ID_FIELD: {"$exists": False}},
+        {"extra": 1},
+    ):
+        short_id = remove_date_portion_from_id(doc["_id"])
+        if isinstance(doc.get("extra"), dict):
+            updates = {SHORT_ID_FIELD: short_id}
+        else:
+            updates = {"extra": {"stt_short_id": short_id}}
+        requests.append(UpdateOne({"_id": doc["_id"]}, {"$set": updates}))
+
+        if len(requests) >= BACKFILL_BATCH_SIZE:
+            updated += mongodb_collection.bulk_write(requests, ordered=False).modified_count
+            requests = []
+
+    if requests:
+        updated += mongodb_collection.bulk_write(requests, ordered=False).modified_count
+    return updated
+
+
+def _get_index_keys(keys: Iterable[Tuple[str, Any]]) -> Tuple[Tuple[str, Any], ...]:
+    return tuple((field, int(direction) if isinstance(direction, float) else direction) for field, direction in keys)
+
+
+def get_index_report(resources: Iterable[str] = REPORTED_RESOURCES) -> List[Dict[str, Any]]:
+    """Returns the indexes of each collection with their usage (from ``$indexStats``), and the STT indexes missing"""
+
+    report = []
+    for resource in resources:
+        collection = app.data.get_mongo_collection(resource)
+        existing_keys = set(
+            _get_index_keys(index["key"])
+            for index in collection.index_information().values()
+        )
+
+        report.append({
+            "resource": resource,
+            "indexes": [
+                {
+                    "name": stats["name"],
+                    "key": _get_index_keys(stats["key"].items()),
+                    "ops": stats["accesses"]["ops"],
+                    "since": stats["accesses"]["since"],
+                }
+                for stats in sorted(collection.aggregate([{"$indexStats": {}}]), key=lambda stats: stats["name"])
+            ],
+            "missing": [
+                name
+                for name, (keys, _options) in STT_MONGO_INDEXES.get(resource, {}).items()
+                if _get_index_keys(keys) not in existing_keys
+            ],
+        })
+    return report
+
+
+def create_missing_indexes(report: List[Dict[str, Any]]):
+    for entry in report:
+        collection = app.data.get_mongo_collection(entry["resource"])
+        for name in entry["missing"]:
+            keys, options = STT_MONGO_INDEXES[entry["resource"]][name]
+            collection.create_index(keys, name=name, **options)
+
+
+class IndexReportCommand(superdesk.Command):
+    """Reports the usage of the indexes of the collections queried by STT, and the STT indexes missing
+
+    Index usage is counted by MongoDB since the index was created or the server restarted (see ``since``).
+
+    Example:
+    ::
+
+        $ python manage.py stt:index_report
+        $ python manage.py stt:index_report --create
+
+    """
+
+    option_list = [
+        superdesk.Option(
+            "--create",
+            "-c",
+            dest="create",
+            action="store_true",
+            default=False,
+            help="Create the missing STT indexes",
+        ),
+    ]
+
+    def run(self, create=False):
+        report = get_index_report()
+        for entry in report:
+            print(f"{entry['resource']}:")
+            for index in entry["indexes"]:
+                keys = ", ".join(f"{field}: {direction}" for field, direction in index["key"])
+                print(f"    {index['name']:<60} {index['ops']:>12} ops since {index['since']:%Y-%m-%d %H:%M}  ({keys})")
+            for name in entry["missing"]:
+                print(f"    {name:<60} MISSING")
+
+        if create:
+            create_missing_indexes(report)
+            print(f"Created {sum(len(entry['missing']) for entry in report)} missing index(es)")
+
+
+superdesk.command("stt:index_report", IndexReportCommand())
+
+
+def init_app(app: SuperdeskEve):
+    for resource, indexes in STT_MONGO_INDEXES.items():
+        app.config["DOMAIN"][resource].setdefault("mongo_indexes__init", {}).update(indexes)
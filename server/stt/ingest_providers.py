@@ -0,0 +1,68 @@
+"""Process-wide cache of the metadata of ingest providers, shared by the STT hooks
+
+Providers are looked up on every ingested item (i.e. to know which parser ingested a Planning item),
+yet they hardly ever change. Providers updated in this process are invalidated straight away
+by the ``ingest_providers`` resource hooks (see ``init_app``), and the others after ``PROVIDER_CACHE_TTL``.
+"""
+
+from typing import Dict, Any, Optional, Union
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from superdesk import get_resource_service
+from superdesk.factory.app import SuperdeskEve
+
+from .cache import LRUCache
+
+PROVIDER_CACHE_SIZE = 1000
+PROVIDER_CACHE_TTL = 300
+
+#: Fields of the providers kept in the cache
+PROVIDER_FIELDS = ("name", "source", "feed_parser", "feeding_service")
+
+provider_cache = LRUCache("ingest_providers", PROVIDER_CACHE_SIZE, ttl=PROVIDER_CACHE_TTL)
+
+_NOT_CACHED = object()
+
+
+def get_provider(provider_id: Union[ObjectId, str, None]) -> Optional[Dict[str, Any]]:
+    """Returns the ``PROVIDER_FIELDS`` of an ingest provider, ``None`` if the provider doesn't exist"""
+
+    try:
+        provider_id = ObjectId(provider_id)
+    except (InvalidId, TypeError):
+        return None
+
+    provider = provider_cache.get(provider_id, _NOT_CACHED)
+    if provider is _NOT_CACHED:
+        original = get_resource_service("ingest_providers").find_one(req=None, _id=provider_id)
+        provider = {field: original.get(field) for field in PROVIDER_FIELDS} if original else None
+        provider_cache.set(provider_id, provider)
+
+    return provider
+
+
+def invalidate_provider(provider: Dict[str, Any]):
+    if provider.get("_id") is not None:
+        provider_cache.pop(ObjectId(provider["_id"]))
+
+
+def on_providers_inserted(docs):
+    for doc in docs:
+        invalidate_provider(doc)
+
+
+def on_provider_updated(updates, original):
+    invalidate_provider(original)
+
+
+def on_provider_deleted(doc):
+    invalidate_provider(doc)
+
+
+def init_app(app: SuperdeskEve):
+    app.on_inserted_ingest_providers += on_providers_inserted
+    app.on_updated_ingest_providers += on_provider_updated
+    app.on_replaced_ingest_providers += on_provider_updated
+    app.on_deleted_item_ingest_providers += on_provider_deleted
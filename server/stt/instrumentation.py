@@ -0,0 +1,223 @@
+"""Timing of the stages of the STT ingest pipeline and content linking
+
+Functions decorated with ``instrumented`` record their duration, the number of items they processed and
+the number of MongoDB commands they issued (counted with a ``pymongo`` command listener, in the thread
+running the stage) in ``stage_registry``. Each run of a stage is logged at debug level with these as
+structured fields, and a summary of all stages is logged at most every ``SUMMARY_LOG_INTERVAL`` seconds.
+
+Instrumentation is enabled with the ``STT_INSTRUMENTATION`` setting. When disabled, the decorated functions
+only check a global flag before being called. Commands are only counted for the ``MongoClient`` instances
+created once instrumentation is enabled, which includes the clients Eve creates on first use.
+
+Stages may be nested (i.e. ``eventsml.set_contact_details`` runs within ``eventsml.parse``), the duration
+and commands of a stage include the ones of its nested stages.
+"""
+
+import bisect
+import logging
+import time
+from functools import wraps
+from threading import Lock, local
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from superdesk.factory.app import SuperdeskEve
+
+from stt.cache import register_cache
+
+logger = logging.getLogger(__name__)
+
+#: Upper bounds (in milliseconds) of the buckets of the duration histograms
+DURATION_BUCKETS_MS: Tuple[float, ...] = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+#: Minimum number of seconds between two logs of the summary of all stages
+SUMMARY_LOG_INTERVAL = 60
+
+_enabled = False
+_thread_state = local()
+
+
+class DurationHistogram:
+    """Histogram of durations, counted in non-cumulative buckets bounded by ``DURATION_BUCKETS_MS``"""
+
+    def __init__(self):
+        # The last bucket counts the durations above the last bound
+        self.buckets: List[int] = [0] * (len(DURATION_BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, duration_ms: float):
+        self.buckets[bisect.bisect_left(DURATION_BUCKETS_MS, duration_ms)] += 1
+        self.count += 1
+        self.sum_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+
+    def quantile(self, quantile: float) -> Optional[float]:
+        """Upper bound of the bucket of the quantile, the maximum duration for the last bucket"""
+
+        if not self.count:
+            return None
+
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return DURATION_BUCKETS_MS[index] if index < len(DURATION_BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+
+class StageStats:
+    def __init__(self):
+        self.durations = DurationHistogram()
+        self.items = 0
+        self.db_calls = 0
+        self.failures = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        durations = self.durations
+        return {
+            "calls": durations.count,
+            "items": self.items,
+            "failures": self.failures,
+            "db_calls": self.db_calls,
+            "db_calls_per_item": round(self.db_calls / self.items, 2) if self.items else None,
+            "total_ms": round(durations.sum_ms, 2),
+            "mean_ms": round(durations.sum_ms / durations.count, 2) if durations.count else None,
+            "p50_ms": durations.quantile(0.5),
+            "p99_ms": durations.quantile(0.99),
+            "max_ms": round(durations.max_ms, 2),
+            "buckets": dict(zip([*DURATION_BUCKETS_MS, "+Inf"], durations.buckets)),
+        }
+
+
+class StageRegistry:
+    """Thread-safe registry of the ``StageStats`` of each stage, queryable with ``stats``"""
+
+    name = "stt_stages"
+
+    def __init__(self):
+        self._stages: Dict[str, StageStats] = {}
+        self._lock = Lock()
+        self._last_summary = time.monotonic()
+
+    def record(self, stage: str, duration_ms: float, items: int, db_calls: int, failed: bool = False):
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = StageStats()
+            stats.durations.observe(duration_ms)
+            stats.items += items
+            stats.db_calls += db_calls
+            stats.failures += int(failed)
+
+            log_summary = time.monotonic() - self._last_summary >= SUMMARY_LOG_INTERVAL
+            if log_summary:
+                self._last_summary = time.monotonic()
+
+        logger.debug("STT stage completed", extra=dict(
+            stage=stage,
+            duration_ms=round(duration_ms, 2),
+            items=items,
+            db_calls=db_calls,
+            failed=failed,
+        ))
+        if log_summary:
+            self.log_summary()
+
+    def get(self, stage: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            stats = self._stages.get(stage)
+            return stats.to_dict() if stats is not None else None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {stage: stats.to_dict() for stage, stats in sorted(self._stages.items())}
+
+    def log_summary(self):
+        for stage, stats in self.stats().items():
+            stats.pop("buckets")
+            logger.info("STT stage summary", extra=dict(stage=stage, **stats))
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+
+
+stage_registry = register_cache(StageRegistry())
+
+
+class DBCallCounter(monitoring.CommandListener):
+    """Counts the MongoDB commands started by each thread, while instrumentation is enabled"""
+
+    def started(self, event):
+        if _enabled:
+            _thread_state.db_calls = get_db_calls() + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+_db_call_counter: Optional[DBCallCounter] = None
+
+
+def get_db_calls() -> int:
+    """Number of MongoDB commands started by the current thread"""
+
+    return getattr(_thread_state, "db_calls", 0)
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    global _enabled, _db_call_counter
+
+    _enabled = enabled
+    if enabled and _db_call_counter is None:
+        _db_call_counter = DBCallCounter()
+        monitoring.register(_db_call_counter)
+
+
+def instrumented(stage: str, count_items: Optional[Callable[[Any], int]] = None):
+    """Records the runs of the decorated function as the ``stage``
+
+    :param count_items: Returns the number of items processed from the result of the function, 1 by default
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            db_calls = get_db_calls()
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                stage_registry.record(stage, (time.perf_counter() - start) * 1000, 0, get_db_calls() - db_calls, True)
+                raise
+
+            duration_ms = (time.perf_counter() - start) * 1000
+            items = count_items(result) if count_items is not None else 1
+            stage_registry.record(stage, duration_ms, items, get_db_calls() - db_calls)
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def count_list_items(result: Optional[List[Any]]) -> int:
+    return len(result or [])
+
+
+def init_app(app: SuperdeskEve):
+    set_enabled(app.config.get("STT_INSTRUMENTATION", False))
@@ -0,0 +1,281 @@
+"""Metrics of the STT ingest and content linking, exposed in the Prometheus text format
+
+The metrics are recorded by every process (gunicorn and Celery workers), buffered in memory and added to
+Redis hashes (one per metric) every ``FLUSH_INTERVAL`` seconds by a thread of each process, so they are aggregated
+across all processes and survive restarts of the workers. The buffer is flushed when a process exits too, including
+the Celery prefork children (which exit without running ``atexit`` handlers, see ``flush_on_worker_shutdown``).
+The ``rest`` process serves them at ``/stt/metrics``, to the requests with the ``STT_METRICS_TOKEN`` bearer token.
+
+Metrics are recorded when the ``STT_METRICS`` setting is enabled, using the Redis server of ``REDIS_URL``.
+The ``/stt/metrics`` endpoint is only registered when ``STT_METRICS_TOKEN`` is set.
+"""
+
+import atexit
+import hmac
+import json
+import logging
+import os
+import time
+from functools import wraps
+from threading import Lock, Thread
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import redis
+from celery.signals import worker_process_shutdown
+from flask import Blueprint, Response, current_app as app, request
+
+from superdesk.factory.app import SuperdeskEve
+
+logger = logging.getLogger(__name__)
+
+#: Number of seconds between two flushes of the metrics of a process to Redis
+FLUSH_INTERVAL = 5
+#: Prefix of the Redis keys of the metrics
+REDIS_KEY_PREFIX = "stt:metrics:"
+#: Upper bounds (in seconds) of the buckets of the histograms
+DURATION_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_redis: Optional[redis.Redis] = None
+
+blueprint = Blueprint("stt_metrics", __name__)
+
+
+class MetricsBuffer:
+    """Increments of the metrics since the last flush to Redis, by Redis key and hash field
+
+    The buffer is flushed by a daemon thread, started by the first ``add`` of each process (threads don't survive
+    a fork, and the Celery and gunicorn workers are forked once the app is created).
+    """
+
+    def __init__(self):
+        self._increments: Dict[Tuple[str, str], float] = {}
+        self._lock = Lock()
+        self._flusher_pid: Optional[int] = None
+
+    def add(self, key: str, field: str, value: float):
+        with self._lock:
+            self._increments[(key, field)] = self._increments.get((key, field), 0) + value
+            start_flusher = self._flusher_pid != os.getpid()
+            if start_flusher:
+                self._flusher_pid = os.getpid()
+        if start_flusher:
+            Thread(target=self._flush_periodically, name="stt-metrics-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def after_fork(self):
+        # The increments are flushed by the parent process, and its lock may have been held when forking
+        self._lock = Lock()
+        self._increments = {}
+        self._flusher_pid = None
+
+    def flush(self):
+        with self._lock:
+            increments, self._increments = self._increments, {}
+
+        if not increments or _redis is None:
+            return
+
+        try:
+            pipeline = _redis.pipeline(transaction=False)
+            for (key, field), value in increments.items():
+                pipeline.hincrbyfloat(key, field, value)
+            pipeline.execute()
+        except redis.RedisError:
+            # Dropped rather than kept, so the buffer doesn't grow while Redis is unavailable
+            logger.exception("Failed to write STT metrics to Redis", extra=dict(increments=len(increments)))
+
+    def clear(self):
+        with self._lock:
+            self._increments.clear()
+
+
+buffer = MetricsBuffer()
+os.register_at_fork(after_in_child=buffer.after_fork)
+_metrics: List["Metric"] = []
+
+
+def _encode_labels(labels: Dict[str, Any]) -> str:
+    return json.dumps({name: str(value) for name, value in labels.items()}, sort_keys=True)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        '{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in sorted(labels.items())
+    ) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.key = REDIS_KEY_PREFIX + name
+        _metrics.append(self)
+
+    def _check_labels(self, labels: Dict[str, Any]):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} requires the labels {', '.join(self.label_names)}")
+
+    def render(self, values: Dict[str, float]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        if _redis is None or not value:
+            return
+        self._check_labels(labels)
+        buffer.add(self.key, _encode_labels(labels), value)
+
+    def render(self, values: Dict[str, float]) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(json.loads(field))} {_format_value(value)}"
+            for field, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    """Histogram of durations (in seconds), stored with a hash field per bucket, the sum and the count"""
+
+    type = "histogram"
+
+    def observe(self, value: float, **labels):
+        if _redis is None:
+            return
+        self._check_labels(labels)
+        encoded = _encode_labels(labels)
+        bucket = next((str(bound) for bound in DURATION_BUCKETS if value <= bound), "+Inf")
+        buffer.add(self.key, f"bucket|{bucket}|{encoded}", 1)
+        buffer.add(self.key, f"sum|{encoded}", value)
+        buffer.add(self.key, f"count|{encoded}", 1)
+
+    def timed(self, **labels):
+        """Observes the duration of the decorated function"""
+
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if _redis is None:
+                    return func(*args, **kwargs)
+
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+
+            return wrapper
+
+        return decorator
+
+    def render(self, values: Dict[str, float]) -> List[str]:
+        series: Dict[str, Dict[str, float]] = {}
+        for field, value in values.items():
+            kind, _, rest = field.partition("|")
+            if kind == "bucket":
+                bucket, _, encoded = rest.partition("|")
+                series.setdefault(encoded, {})[bucket] = value
+            else:
+                series.setdefault(rest, {})[kind] = value
+
+        lines = []
+        for encoded, fields in sorted(series.items()):
+            labels = json.loads(encoded)
+            cumulative = 0.0
+            for bound in [*(str(bound) for bound in DURATION_BUCKETS), "+Inf"]:
+                cumulative += fields.get(bound, 0)
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(fields.get('sum', 0))}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(fields.get('count', 0))}")
+        return lines
+
+
+ITEMS_PARSED = Counter("stt_items_parsed_total", "Items parsed by the STT feed parsers", ["parser"])
+ITEMS_REMOVED = Counter(
+    "stt_items_removed_total",
+    "Items skipped and removed by the STT feed parsers, as they contain the sttinstruct:remove signal",
+    ["parser"],
+)
+CONTACTS = Counter("stt_contacts_total", "Contacts of ingested Events, by result (created or matched)", ["result"])
+DELIVERIES_CREATED = Counter("stt_deliveries_created_total", "Temporary deliveries created for Planning coverages")
+COVERAGES_LINKED = Counter(
+    "stt_coverages_linked_total",
+    "Coverages linked to content, by stage (ingest of the Planning item or publish of the content)",
+    ["stage"],
+)
+LINKING_FAILURES = Counter("stt_linking_failures_total", "Failures linking coverages to content", ["stage"])
+LINKING_DURATION = Histogram(
+    "stt_linking_duration_seconds",
+    "Duration of linking coverages to content, by stage (ingest of the Planning item or publish of the content)",
+    ["stage"],
+)
+
+
+def render_metrics() -> str:
+    """Returns the metrics aggregated in Redis, in the Prometheus text format"""
+
+    buffer.flush()
+    pipeline = _redis.pipeline(transaction=False)
+    for metric in _metrics:
+        pipeline.hgetall(metric.key)
+
+    lines = []
+    for metric, values in zip(_metrics, pipeline.execute()):
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render({
+            field.decode("utf-8"): float(value)
+            for field, value in values.items()
+        }))
+    return "\n".join(lines) + "\n"
+
+
+@blueprint.route("/stt/metrics", methods=["GET"])
+def metrics_view():
+    token = app.config.get("STT_METRICS_TOKEN") or ""
+    authorization = request.headers.get("Authorization") or ""
+    if not token or not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        return Response("Unauthorized\n", status=401, mimetype="text/plain",
+                        headers={"WWW-Authenticate": "Bearer"})
+    if _redis is None:
+        return Response("STT metrics are disabled\n", status=404, mimetype="text/plain")
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+
+def set_redis(client: Optional[redis.Redis]):
+    """Sets the Redis client the metrics are written to, disabling the metrics if ``None``"""
+
+    global _redis
+    _redis = client
+    buffer.clear()
+
+
+@worker_process_shutdown.connect
+def flush_on_worker_shutdown(**kwargs):
+    """Flush the last increments of a Celery prefork child, which exits with ``os._exit``"""
+
+    buffer.flush()
+
+
+def init_app(app: SuperdeskEve):
+    if app.config.get("STT_METRICS_TOKEN"):
+        app.register_blueprint(blueprint)
+    if app.config.get("STT_METRICS"):
+        set_redis(redis.Redis.from_url(app.config["REDIS_URL"]))
+        # Flush the last increments of the process when it exits
+        atexit.register(buffer.flush)
@@ -1,150 +1,154 @@
-from superdesk import etree as sd_etree
+from superdesk import config
 from superdesk.metadata.item import CONTENT_TYPE
 from superdesk.io.registry import register_feed_parser
 from superdesk.io.feed_parsers.stt_newsml import STTNewsMLFeedParser, STT_LOCATION_MAP
 
-from .common import remove_date_portion_from_id
+from .common import remove_date_portion_from_id, SubjectMerger
+from .html_utils import clean_body_html
+from .vocabularies import VocabularyCacheMixin
+from .xml_utils import CachedQNameMixin, StreamingParserMixin
+from .instrumentation import instrumented, count_list_items
+from .metrics import ITEMS_PARSED
 
 
 NA = 'N/A'
 
 
-def get_subject_names(item):
-    return [subj.get('name') for subj in item.get('subject', [])]
-
-
-class STTParser(STTNewsMLFeedParser):
+class STTParser(VocabularyCacheMixin, CachedQNameMixin, StreamingParserMixin, STTNewsMLFeedParser):
     NAME = 'sttnewsmlnewsroom'
     label = 'STT NewsML for Newsroom'
+    STREAM_ITEM_TAGS = ('newsItem',)
 
+    @instrumented("newsml.parse", count_list_items)
     def parse(self, xml, provider=None):
         items = super().parse(xml, provider)
         for item in items:
-            item.setdefault('subject', [])
-            if item.get('place'):
-                for place in item['place']:
-                    if place.get('name') and place.get('qcode') and place.get('scheme') == 'sttlocmeta':
-                        item['subject'].append({
-                            'name': place['name'],
-                            'qcode': place['qcode'],
-                            'scheme': place['scheme'],
+            subjects = SubjectMerger(item)
+            for place in item.get('place') or []:
+                if place.get('name') and place.get('qcode') and place.get('scheme') == 'sttlocmeta':
+                    subjects.add({
+                        'name': place['name'],
+                        'qcode': place['qcode'],
+                        'scheme': place['scheme'],
+                    })
+                for field in STT_LOCATION_MAP.values():
+                    if place.get(field['name']) and place[field['name']] != NA:
+                        subjects.add_if_new_name({
+                            'name': place[field['name']],
+                            'qcode': place[field['qcode']],
+                            'scheme': field['name'],
                         })
-                    for field in STT_LOCATION_MAP.values():
-                        if place.get(field['name']) and place[field['name']] != NA and \
-                                place[field['name']] not in get_subject_names(item):
-                            item['subject'].append({
-                                'name': place[field['name']],
-                                'qcode': place[field['qcode']],
-                                'scheme': field['name'],
-                            })
 
             self.set_extra_fields(item, xml)
+
+        ITEMS_PARSED.inc(len(items), parser=self.NAME)
         return items
 
     def parse_inline_content(self, tree, item):
         html_elt = tree.find(self.qname('html'))
         body_elt = html_elt.find(self.qname('body'))
-        body_elt = sd_etree.clean_html(body_elt)
-        # replace <pre> with <p>
-        for pre in body_elt.findall('.//pre'):
-            pre.tag = 'p'
-        # add target blank for all links
-        for a in body_elt.findall('.//a'):
-            a.attrib['target'] = '_blank'
 
         content = dict()
         content['contenttype'] = tree.attrib['contenttype']
-
-        if len(body_elt) > 0:
-            contents = [sd_etree.to_string(e, encoding='unicode', method="html") for e in body_elt]
-            content['content'] = '\n'.join(contents)
-        elif body_elt.text:
-            content['content'] = '<p>' + body_elt.text + '</p>'
-            content['format'] = 'xhtml/xml'
-
-        if content.get('content'):
-            content['content'] = content['content'].replace('&lt;endash&gt;-&lt;/endash&gt;', '-')
-
+        # whitelist the tags, replace <pre> with <p>, add target blank for all links
+        content.update(clean_body_html(body_elt, config.HTML_TAGS_WHITELIST))
         return content
 
     def set_extra_fields(self, item, xml):
-        """Adds extra fields"""
+        """Adds extra fields
+
+        ``contentMeta`` and ``itemMeta`` are walked once, passing each known element to its extractor.
+        An extractor returns ``True`` when no more elements with the same tag need to be processed.
+        """
+
+        extra = {}
 
         # newsItem guid
         if 'uri' in item:
-            item.setdefault('extra', {})['newsItem_guid'] = item['uri']
+            extra['newsItem_guid'] = item['uri']
             item["uri"] = remove_date_portion_from_id(item["uri"])
 
-        # newsItem altId
-        try:
-            for alt_id in xml.find(self.qname('contentMeta')).findall(self.qname('altId')):
-                if alt_id.get("type") == "sttidtype:textid" and alt_id.text:
-                    # textid is STT's Article ID
-                    item.setdefault('extra', {})['sttidtype_textid'] = alt_id.text
-        except AttributeError:
-            pass
-
-        # creator fields
-        try:
-            creator_node = xml.find(self.qname('contentMeta')).find(self.qname('creator'))
-
-            if creator_node is not None:
-                creator_name = creator_node.find(self.qname('name')).text
-                if creator_name:
-                    item.setdefault('extra', {})['creator_name'] = creator_name
-
-                creator_id = creator_node.attrib.get('qcode')
-                if creator_id:
-                    item.setdefault('extra', {})['creator_id'] = creator_id
-        except AttributeError:
-            pass
-
-        # filename
-        try:
-            link_node = xml.find(self.qname('itemMeta')).find(self.qname('link'))
-
-            if link_node is not None:
-                filename = link_node.find(self.qname('filename')).text
-                if filename:
-                    item.setdefault('extra', {})['filename'] = filename
-
-        except AttributeError:
-            pass
-
+        extractors = (
+            ('contentMeta', {
+                self.qname('altId'): self._extract_alt_id,
+                self.qname('creator'): self._extract_creator,
+                self.qname('subject'): self._extract_subject,
+                self.qname('rating'): self._extract_rating,
+                self.qname('genre'): self._extract_genre,
+            }),
+            ('itemMeta', {
+                self.qname('link'): self._extract_link,
+            }),
+        )
+
+        for meta_tag, meta_extractors in extractors:
+            meta = xml.find(self.qname(meta_tag))
+            if meta is None:
+                continue
+
+            finished = set()
+            for elt in meta:
+                extract = meta_extractors.get(elt.tag)
+                if extract is not None and elt.tag not in finished and extract(elt, extra):
+                    finished.add(elt.tag)
+
+        if extra:
+            item.setdefault('extra', {}).update(extra)
+
+    def _extract_alt_id(self, alt_id, extra):
+        if alt_id.get("type") == "sttidtype:textid" and alt_id.text:
+            # textid is STT's Article ID
+            extra['sttidtype_textid'] = alt_id.text
+
+    def _extract_creator(self, creator, extra):
+        # Only the first creator is used
+        name = creator.find(self.qname('name'))
+        if name is not None:
+            if name.text:
+                extra['creator_name'] = name.text
+
+            creator_id = creator.attrib.get('qcode')
+            if creator_id:
+                extra['creator_id'] = creator_id
+        return True
+
+    def _extract_link(self, link, extra):
+        # Only the first link is used
+        filename = link.find(self.qname('filename'))
+        if filename is not None and filename.text:
+            extra['filename'] = filename.text
+        return True
+
+    def _extract_subject(self, subject, extra):
         # stt-topics, stt-events
-        try:
-            for subject in xml.find(self.qname('contentMeta')).findall(self.qname('subject')):
-                values = subject.get('qcode', '').split(':')
-                if values:
-                    if values[0] == 'stt-topics':
-                        item.setdefault('extra', {})['stt_topics'] = values[1]
-                    elif values[0] == 'stt-events':
-                        item.setdefault('extra', {})['stt_events'] = values[1]
-        except AttributeError:
-            pass
-
+        values = subject.get('qcode', '').split(':')
+        if len(values) > 1:
+            if values[0] == 'stt-topics':
+                extra['stt_topics'] = values[1]
+            elif values[0] == 'stt-events':
+                extra['stt_events'] = values[1]
+
+    def _extract_rating(self, rating, extra):
         # webprio
-        try:
-            for rating in xml.find(self.qname('contentMeta')).findall(self.qname('rating')):
-                if rating.get('ratingtype') == 'sttrating:webprio':
-                    value = rating.get('value')
-                    if value:
-                        item.setdefault('extra', {})['sttrating_webprio'] = int(value)
-        except (AttributeError, ValueError):
-            pass
-
+        if rating.get('ratingtype') == 'sttrating:webprio':
+            value = rating.get('value')
+            if value:
+                try:
+                    extra['sttrating_webprio'] = int(value)
+                except ValueError:
+                    return True
+
+    def _extract_genre(self, genre, extra):
         # imagetype
-        try:
-            def get_name_value(genre):
-                return genre.find(self.qname('name')).text
-
-            for genre in xml.find(self.qname('contentMeta')).findall(self.qname('genre')):
-                if genre.get('qcode') == 'sttdescription:imagetype':
-                    item.setdefault('extra', {}).setdefault('imagetype', {})['id'] = get_name_value(genre)
-                elif genre.get('qcode') == 'sttdescription:imagetypename':
-                    item.setdefault('extra', {}).setdefault('imagetype', {})['name'] = get_name_value(genre)
-        except AttributeError:
-            pass
+        qcode = genre.get('qcode')
+        if qcode not in ('sttdescription:imagetype', 'sttdescription:imagetypename'):
+            return
+
+        name = genre.find(self.qname('name'))
+        if name is None:
+            return True
+
+        extra.setdefault('imagetype', {})['id' if qcode == 'sttdescription:imagetype' else 'name'] = name.text
 
 
 register_feed_parser(STTParser.NAME, STTParser())
@@ -1,9 +1,9 @@
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, NamedTuple, Set, Tuple
 from bson import ObjectId
 from copy import deepcopy
 import logging
 from eve.utils import config, ParsedRequest
-from flask import json
+from flask import json, current_app as app
 
 from superdesk import get_resource_service, signals
 from superdesk.factory.app import SuperdeskEve
@@ -19,17 +19,27 @@ from planning.common import (
 from planning.signals import planning_ingested
 
 from stt.stt_planning_ml import STTPlanningMLParser
-from stt.common import is_online_version
+from stt.common import is_online_version, get_short_id_lookup
+from stt.ingest_providers import get_provider
+from stt.content_uris import get_cached_content, get_rewrite_sort_key, record_content
+from stt.coverages import CoverageUpdates, LinkingConflict, patch_coverages
+from stt.instrumentation import instrumented
+from stt.metrics import COVERAGES_LINKED, LINKING_FAILURES, LINKING_DURATION
 
 
 logger = logging.getLogger(__name__)
 
+#: Maximum number of content items returned by the search of ``link_coverages_to_content``
+CONTENT_SEARCH_SIZE = 1000
+
 
 def init_app(_app: SuperdeskEve):
     planning_ingested.connect(link_coverages_to_content)
     signals.item_publish.connect(before_content_published)
 
 
+@instrumented("link_coverages_to_content")
+@LINKING_DURATION.timed(stage="ingest")
 def link_coverages_to_content(_sender: Any, item: Dict[str, Any], original: Optional[Dict[str, Any]] = None):
     """Link coverage(s) to content upon ingest (if content exists)"""
 
@@ -53,14 +63,13 @@ def link_coverages_to_content(_sender: Any, item: Dict[str, Any], original: Opti
     if not _is_ingested_by_stt_planning_ml(item):
         return
 
-    updates = {"coverages": deepcopy(item["coverages"])}
+    coverage_updates = CoverageUpdates(item)
     coverage_id_to_content_id_map: Dict[str, str] = {}
-    delivery_service = get_resource_service("delivery")
-    planning_service = get_resource_service("planning")
-    for coverage in updates["coverages"]:
-        try:
-            coverage_id = coverage["coverage_id"]
-        except KeyError:
+
+    # Index of the coverages to link, copied only once linked to content
+    coverages_to_link: List[int] = []
+    for index, coverage in enumerate(coverage_updates.coverages):
+        if not coverage.get("coverage_id"):
             logger.error("Failed to link coverage with content, coverage_id is missing")
             continue
 
@@ -74,27 +83,48 @@ def link_coverages_to_content(_sender: Any, item: Dict[str, Any], original: Opti
         except (KeyError, TypeError):
             pass
 
-        # Get the deliveries that aren't linked to an Assignment
-        # These deliveries are added in ``STTPlanningMLParser._create_temp_assignment_deliveries``
-        deliveries = delivery_service.get_from_mongo(req=None, lookup={
-            "planning_id": planning_id,
-            "coverage_id": coverage_id,
-            "assignment_id": None,
-            "item_id": {"$ne": None}},
-        )
-        if not deliveries.count():
+        coverages_to_link.append(index)
+
+    # Get the deliveries that aren't linked to an Assignment, for all coverages at once
+    # These deliveries are added in ``STTPlanningMLParser._create_temp_assignment_deliveries``
+    content_uris = _get_unlinked_delivery_uris(
+        planning_id,
+        [coverage_updates.coverages[index]["coverage_id"] for index in coverages_to_link]
+    )
+    if not content_uris:
+        # No unlinked deliveries found for any of the Coverages
+        return
+
+    # Then the content of all the deliveries, with a single search
+    content_items, complete = _get_content_items_by_uris(
+        list(set(uri for uris in content_uris.values() for uri in uris))
+    )
+
+    for index in coverages_to_link:
+        uris = content_uris.get(coverage_updates.coverages[index]["coverage_id"])
+        if not uris:
             # No unlinked deliveries found for this Coverage
             continue
 
-        content = _get_content_item_by_uris([delivery["item_id"] for delivery in deliveries])
+        found = [content_items[uri] for uri in uris if uri in content_items]
+        if found:
+            # The content with the lowest ``rewrite_sequence``
+            content = min(found, key=get_rewrite_sort_key)
+        elif not complete:
+            # The search results were truncated, so search the content of this Coverage on its own
+            content = _get_content_item_by_uris(uris)
+        else:
+            content = None
+
         if content is None:
             # No content has been found
             # Linking will occur when content is published (see ``before_content_published``)
             continue
 
+        coverage = coverage_updates.edit_at(index)
         _copy_metadata_from_article_to_coverage(coverage, content)
         _update_coverage_assignment_details(coverage, content)
-        coverage_id_to_content_id_map[coverage_id] = content[config.ID_FIELD]
+        coverage_id_to_content_id_map[coverage["coverage_id"]] = content[config.ID_FIELD]
 
     updated_coverage_ids = coverage_id_to_content_id_map.keys()
     if not len(updated_coverage_ids):
@@ -103,11 +133,17 @@ def link_coverages_to_content(_sender: Any, item: Dict[str, Any], original: Opti
 
     # Update the planning item with the latest Assignment information, and link the coverages to the content
     try:
-        updated_item = planning_service.patch(planning_id, updates)
+        updated_item = patch_coverages(planning_id, coverage_updates)
     except Exception:
         logger.exception("Failed to update planning with newly linked coverages")
+        LINKING_FAILURES.inc(stage="ingest")
         return
 
+    if updated_item is None:
+        # The coverages were already up to date, their Assignments are still linked to the content below
+        updated_item = item
+
+    links: List[AssignmentLink] = []
     for coverage in updated_item.get("coverages") or []:
         try:
             coverage_id = coverage["coverage_id"]
@@ -116,19 +152,39 @@ def link_coverages_to_content(_sender: Any, item: Dict[str, Any], original: Opti
             # Either ``coverage_id`` or ``assignment_id`` is not defined
             continue
 
-        if assignment_id is None:
-            # This coverage has no Assignment, no need to link to content
+        if assignment_id is None or coverage_id not in coverage_id_to_content_id_map:
+            # This coverage has no Assignment, or wasn't linked to content now, no need to link to content
             continue
 
-        try:
-            _link_assignment_and_content(assignment_id, coverage_id, coverage_id_to_content_id_map[coverage_id])
-        except Exception as err:
-            logger.exception(err)
-            logger.error("Failed to link coverage assignment to content")
+        links.append(AssignmentLink(assignment_id, coverage_id, coverage_id_to_content_id_map[coverage_id]))
+
+    try:
+        linked = _link_assignments_and_content(links)
+    except Exception as err:
+        logger.exception(err)
+        logger.error("Failed to link coverage assignments to content", extra=dict(
+            planning_id=planning_id,
+            coverage_ids=[link.coverage_id for link in links],
+        ))
+        LINKING_FAILURES.inc(stage="ingest")
+        return
+
+    COVERAGES_LINKED.inc(len(linked), stage="ingest")
+    if len(linked) < len(links):
+        logger.error("Failed to link some coverage assignments to content", extra=dict(
+            planning_id=planning_id,
+            coverage_ids=[link.coverage_id for link in links if link not in linked],
+        ))
+        LINKING_FAILURES.inc(len(links) - len(linked), stage="ingest")
 
 
+@instrumented("before_content_published")
 def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[str, Any]):
-    """Link content to coverage before publishing"""
+    """Link content to coverage before publishing
+
+    With ``STT_ASYNC_CONTENT_LINKING`` enabled, the content is linked once published by a Celery task instead
+    (see ``stt.tasks.link_content_to_coverage_task``), keeping it out of the publish request.
+    """
 
     if item.get("assignment_id") is not None:
         # This item is already linked to a coverage
@@ -141,6 +197,32 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
         # no need to continue
         return
 
+    if app.config.get("STT_ASYNC_CONTENT_LINKING"):
+        # Imported here, as the tasks module imports this one (it's registered with the other apps)
+        from stt.tasks import queue_content_linking
+
+        queue_content_linking(item)
+        return
+
+    assignment_id = link_content_to_coverage(item)
+    if assignment_id is not None:
+        item["assignment_id"] = assignment_id
+        updates["assignment_id"] = assignment_id
+
+
+@LINKING_DURATION.timed(stage="publish")
+def link_content_to_coverage(
+    item: Dict[str, Any],
+    skip_archive_update: bool = True,
+    raise_conflicts: bool = False,
+) -> Optional[ObjectId]:
+    """Link content to the coverage of its delivery (or STT topic), returning the ``assignment_id`` it's linked to
+
+    :param skip_archive_update: If ``False``, the ``archive`` item is updated with the ``assignment_id`` too
+    :param raise_conflicts: If ``True``, the Planning item is only patched if it wasn't updated since it was read,
+        raising ``LinkingConflict`` otherwise
+    """
+
     delivery_service = get_resource_service("delivery")
     planning_service = get_resource_service("planning")
 
@@ -158,41 +240,40 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
         try:
             topic_id = item["extra"]["stt_topics"]
         except (KeyError, TypeError):
-            return
+            return None
 
         if not topic_id:
             # A Topic ID was not found, unable to automatically create a coverage
-            return
+            return None
 
         planning_id = f"urn:newsml:stt.fi:{topic_id}"
         coverage_id = None
 
-    planning = planning_service.find_one(req=None, _id=planning_id)
+    if coverage_id is not None:
+        planning = planning_service.find_one(req=None, _id=planning_id)
+    else:
+        # The Topic ID is the short ID of the Planning item, which may be stored with its full ID
+        planning = planning_service.find_one(req=None, **get_short_id_lookup([planning_id]))
+        if planning:
+            planning_id = planning[config.ID_FIELD]
     if not planning:
         logger.warning("Failed to link content to coverage: Planning item not found", extra=dict(
             content_guid=item.get("guid"),
             planning_id=planning_id,
         ))
-        return
+        return None
 
-    planning_updates = {"coverages": deepcopy(planning.get("coverages") or [])}
+    coverage_updates = CoverageUpdates(planning)
     update_planning_item = True
     if coverage_id is not None:
-        coverage = next(
-            (
-                coverage
-                for coverage in planning_updates["coverages"]
-                if coverage.get("coverage_id") == coverage_id
-            ),
-            None
-        )
+        coverage = coverage_updates.edit(coverage_id)
         if coverage is None:
             logger.warning("Failed to find coverage in planning item", extra=dict(
                 content_guid=item.get("guid"),
                 planning_id=planning_id,
                 coverage_id=coverage_id,
             ))
-            return
+            return None
 
         _copy_metadata_from_article_to_coverage(coverage, item)
         _update_coverage_assignment_details(coverage, item)
@@ -206,16 +287,9 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
                 content_guid=item.get("guid"),
                 planning_id=planning_id,
             ))
-            return
+            return None
 
-        existing_coverage = next(
-            (
-                coverage
-                for coverage in planning_updates["coverages"]
-                if coverage.get("coverage_id") == coverage_id
-            ),
-            None
-        )
+        existing_coverage = coverage_updates.get(coverage_id)
         if existing_coverage:
             # A Coverage ID with STT's Article ID already exists
             # Use that to link this content to
@@ -227,6 +301,7 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
             if not coverage_has_assignment:
                 # No Assignment currently exists, add ``assigned_to`` details so the Planning module
                 # will automatically create one for us
+                existing_coverage = coverage_updates.edit(coverage_id)
                 _copy_metadata_from_article_to_coverage(existing_coverage, item)
                 _update_coverage_assignment_details(existing_coverage, item)
             else:
@@ -254,7 +329,8 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
                         planning_id=planning_id,
                         coverage_id=coverage_id,
                     ))
-                    return
+                    LINKING_FAILURES.inc(stage="publish")
+                    return None
 
                 # No need to update Planning item directly, as there are no changes to coverages
                 # Only changes to coverage assignments & deliveries (which is held in a different resource collection)
@@ -271,21 +347,27 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
             _update_coverage_assignment_details(new_coverage, item)
 
             # Remove placeholder text coverage and add the new one
-            planning_updates["coverages"] = [
+            coverage_updates.coverages = [
                 coverage
-                for coverage in planning_updates["coverages"]
+                for coverage in coverage_updates.coverages
                 if not (coverage.get("flags") or {}).get("placeholder")
             ] + [new_coverage]
 
     if update_planning_item:
+        # The linking task retries on conflicts, so only patches the Planning item the coverages were read from
+        etag = planning.get(config.ETAG) if raise_conflicts else None
         try:
-            updated_planning = planning_service.patch(planning_id, planning_updates)
+            # ``None`` if the coverages were already up to date
+            updated_planning = patch_coverages(planning_id, coverage_updates, etag) or planning
+        except LinkingConflict:
+            raise
         except Exception as err:
             logger.exception(err)
             logger.error("Failed to update planning with newly linked coverages")
-            return
+            LINKING_FAILURES.inc(stage="publish")
+            return None
     else:
-        updated_planning = planning_updates
+        updated_planning = planning
         if post_required(planning, planning):
             # Re-publish the Planning item (if required)
             # This way the updated coverage deliveries will be re-published to subscribers
@@ -307,33 +389,92 @@ def before_content_published(_sender: Any, item: Dict[str, Any], updates: Dict[s
                 planning_id=planning_id,
                 coverage_id=coverage_id,
             ))
-            return
+            LINKING_FAILURES.inc(stage="publish")
+            return None
 
     try:
-        _link_assignment_and_content(assignment_id, coverage_id, item.get("guid"), True)
+        _link_assignment_and_content(assignment_id, coverage_id, item.get("guid"), skip_archive_update)
     except Exception:
         logger.exception("Failed to link coverage assignment to content", extra=dict(
             content_guid=item.get("guid"),
             planning_id=planning_id,
             coverage_id=coverage_id,
         ))
-        return
+        LINKING_FAILURES.inc(stage="publish")
+        return None
 
-    item["assignment_id"] = assignment_id
-    updates["assignment_id"] = assignment_id
+    COVERAGES_LINKED.inc(stage="publish")
+    return assignment_id
 
 
 def _is_ingested_by_stt_planning_ml(item: Dict[str, Any]) -> bool:
     """Determine if the item was ingested by the ``STTPlanningMLParser`` parser"""
 
+    provider = get_provider(item.get("ingest_provider"))
+    return provider is not None and provider["feed_parser"] == STTPlanningMLParser.NAME
+
+
+def _get_unlinked_delivery_uris(planning_id: str, coverage_ids: List[str]) -> Dict[str, List[str]]:
+    """Returns the content URIs of the deliveries not linked to an Assignment yet, by Coverage ID"""
+
+    if not coverage_ids:
+        return {}
+
+    content_uris: Dict[str, List[str]] = {}
+    for delivery in get_resource_service("delivery").get_from_mongo(
+        req=None,
+        lookup={
+            "planning_id": planning_id,
+            "coverage_id": {"$in": list(set(coverage_ids))},
+            "assignment_id": None,
+            "item_id": {"$ne": None},
+        },
+        projection={config.ID_FIELD: 0, "coverage_id": 1, "item_id": 1},
+    ):
+        content_uris.setdefault(delivery["coverage_id"], []).append(delivery["item_id"])
+    return content_uris
+
+
+def _get_content_items_by_uris(uris: List[str]) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+    """Get the content item with the lowest ``rewrite_sequence`` of each uri
+
+    Content known by the URI cache (see ``stt.content_uris``) is read from ``archive``,
+    the rest is searched for with a single search.
+    Returns the items by uri, and ``False`` if the search results were truncated (to ``CONTENT_SEARCH_SIZE``)
+    """
+
+    if not len(uris):
+        return {}, True
+
+    items = get_cached_content(uris)
+    uris = [uri for uri in uris if uri not in items]
+    if not uris:
+        return items, True
+
     try:
-        if item["ingest_provider"] is None:
-            return False
-        ingest_provider_id = ObjectId(item["ingest_provider"])
-        ingest_provider = get_resource_service("ingest_providers").find_one(req=None, _id=ingest_provider_id)
-        return ingest_provider["feed_parser"] == STTPlanningMLParser.NAME
-    except (KeyError, TypeError):
-        return False
+        req = ParsedRequest()
+        req.args = {
+            "source": json.dumps({
+                "query": {"bool": {"must": [{"terms": {"uri": uris}}]}},
+                "sort": [{"rewrite_sequence": "asc"}],
+                "size": CONTENT_SEARCH_SIZE,
+            }),
+            "repo": "archive,published,archived",
+        }
+        cursor = get_resource_service("search").get(req=req, lookup=None)
+
+        results = list(cursor)
+        requested_uris = set(uris)
+        for content in results:
+            # Results are sorted by ``rewrite_sequence``, so keep the first one of each uri
+            if content.get("uri") in requested_uris and content["uri"] not in items:
+                items[content["uri"]] = content
+                record_content(content)
+        return items, cursor.count() <= len(results)
+    except Exception:
+        logger.exception("Failed to retrieve list of content based on URIs", extra=dict(uris=uris))
+
+    return items, True
 
 
 def _get_content_item_by_uris(uris: List[str]) -> Optional[Dict[str, Any]]:
@@ -356,6 +497,7 @@ def _get_content_item_by_uris(uris: List[str]) -> Optional[Dict[str, Any]]:
         cursor = get_resource_service("search").get(req=req, lookup=None)
 
         if cursor.count():
+            record_content(cursor[0])
             return cursor[0]
     except Exception:
         logger.exception("Failed to retrieve list of content based on URIs", extra=dict(uris=uris))
@@ -395,6 +537,12 @@ def _copy_metadata_from_article_to_coverage(coverage: Dict[str, Any], content: D
         coverage["planning"]["slugline"] = content["headline"].strip()
 
 
+class AssignmentLink(NamedTuple):
+    assignment_id: ObjectId
+    coverage_id: str
+    content_id: str
+
+
 def _link_assignment_and_content(
     assignment_id: ObjectId,
     coverage_id: str,
@@ -404,9 +552,77 @@ def _link_assignment_and_content(
     """Remove all temporary delivery entries for this coverage and link assignment and content"""
 
     get_resource_service("delivery").delete_action(lookup={"coverage_id": coverage_id, "assignment_id": None})
-    get_resource_service("assignments_link").post([{
-        "assignment_id": assignment_id,
-        "item_id": content_id,
-        "skip_archive_update": skip_archive_update,
-        "item_state": CONTENT_STATE.PUBLISHED,
-    }])
+    _post_assignment_links([AssignmentLink(assignment_id, coverage_id, content_id)], skip_archive_update)
+
+
+def _link_assignments_and_content(
+    links: List[AssignmentLink],
+    skip_archive_update: Optional[bool] = False
+) -> List[AssignmentLink]:
+    """Link the assignments and content, then remove all temporary delivery entries for the linked coverages
+
+    The links are created with a single post, which creates them one after the other. If that fails part way,
+    the links already created are found from their deliveries, and the others are created one by one.
+    Only the coverages linked have their deliveries removed, the others keep them so they can be linked
+    when their content is published. Returns the links created, raising the error if the only link fails.
+    """
+
+    if not links:
+        return []
+
+    try:
+        _post_assignment_links(links, skip_archive_update)
+        linked = links
+    except Exception:
+        if len(links) == 1:
+            raise
+
+        logger.exception("Failed to link coverage assignments to content at once, linking the others one by one")
+        created = _get_created_links(links)
+        linked = [link for link in links if link in created]
+        for link in links:
+            if link in created:
+                continue
+
+            try:
+                _post_assignment_links([link], skip_archive_update)
+                linked.append(link)
+            except Exception:
+                logger.exception("Failed to link coverage assignment to content", extra=dict(
+                    assignment_id=link.assignment_id,
+                    coverage_id=link.coverage_id,
+                    content_guid=link.content_id,
+                ))
+
+    if linked:
+        get_resource_service("delivery").delete_action(lookup={
+            "coverage_id": {"$in": list(set(link.coverage_id for link in linked))},
+            "assignment_id": None,
+        })
+    return linked
+
+
+def _get_created_links(links: List[AssignmentLink]) -> Set[AssignmentLink]:
+    """Returns the links that were created, as linking an assignment and content adds a delivery for them"""
+
+    created = {
+        (delivery.get("assignment_id"), delivery.get("item_id"))
+        for delivery in get_resource_service("delivery").get_from_mongo(
+            req=None,
+            lookup={"assignment_id": {"$in": list(set(link.assignment_id for link in links))}},
+            projection={"assignment_id": 1, "item_id": 1},
+        )
+    }
+    return {link for link in links if (link.assignment_id, link.content_id) in created}
+
+
+def _post_assignment_links(links: List[AssignmentLink], skip_archive_update: Optional[bool] = False):
+    get_resource_service("assignments_link").post([
+        {
+            "assignment_id": link.assignment_id,
+            "item_id": link.content_id,
+            "skip_archive_update": skip_archive_update,
+            "item_state": CONTENT_STATE.PUBLISHED,
+        }
+        for link in links
+    ])
@@ -0,0 +1,116 @@
+"""Profiling of the startup of the STT processes
+
+Each process type of the ``Procfile`` is started in a new interpreter with ``python -X importtime``,
+importing the module the process is started from, so the app (and its ``INSTALLED_APPS``) is created as
+when the process starts. Reports the time until the module is imported (the time-to-ready of the process)
+and the modules and top level packages that take the longest to import.
+"""
+
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+import superdesk
+
+APP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#: Module imported to start each process type of the ``Procfile``
+PROCESS_MODULES = {
+    "rest": "wsgi",
+    "work": "worker",
+    "wamp": "ws",
+}
+
+_IMPORT_SCRIPT = "import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+
+
+class ImportTime(NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+
+
+class StartupProfile(NamedTuple):
+    process: str
+    seconds: float
+    imports: List[ImportTime]
+
+    def get_slowest_modules(self, count: int) -> List[ImportTime]:
+        return sorted(self.imports, key=lambda timing: timing.cumulative_us, reverse=True)[:count]
+
+    def get_slowest_packages(self, count: int) -> List[Tuple[str, int]]:
+        """Top level packages, with the sum of the time spent importing their own modules"""
+
+        packages: Dict[str, int] = {}
+        for timing in self.imports:
+            package = timing.module.split(".")[0]
+            packages[package] = packages.get(package, 0) + timing.self_us
+        return sorted(packages.items(), key=lambda package: package[1], reverse=True)[:count]
+
+
+def parse_import_times(output: str) -> List[ImportTime]:
+    """Parses the ``import time: self [us] | cumulative | imported package`` lines of ``-X importtime``"""
+
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        try:
+            self_us, cumulative_us, module = line[len("import time:"):].split("|")
+            imports.append(ImportTime(module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            # The header line
+            continue
+    return imports
+
+
+def profile_startup(process: str) -> StartupProfile:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _IMPORT_SCRIPT.format(module=PROCESS_MODULES[process])],
+        cwd=APP_PATH,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return StartupProfile(process, float(result.stdout.strip().splitlines()[-1]), parse_import_times(result.stderr))
+
+
+class ProfileStartupCommand(superdesk.Command):
+    """Reports the startup time of the STT processes, with the modules taking the longest to import
+
+    Example:
+    ::
+
+        $ python manage.py stt:profile_startup
+        $ python manage.py stt:profile_startup --process work --top 40
+
+    """
+
+    option_list = [
+        superdesk.Option(
+            "--process",
+            "-p",
+            dest="processes",
+            action="append",
+            choices=list(PROCESS_MODULES),
+            help="Process type to profile (all by default), can be repeated",
+        ),
+        superdesk.Option("--top", "-t", dest="top", type=int, default=20, help="Number of modules to report"),
+    ]
+
+    def run(self, processes=None, top=20):
+        for process in processes or PROCESS_MODULES:
+            profile = profile_startup(process)
+            print(f"{process} ({PROCESS_MODULES[process]}): ready in {profile.seconds:.2f}s, "
+                  f"{len(profile.imports)} modules imported")
+            print(f"    {'cumulative (ms)':>15} {'self (ms)':>10}  module")
+            for timing in profile.get_slowest_modules(top):
+                print(f"    {timing.cumulative_us / 1000:>15.1f} {timing.self_us / 1000:>10.1f}  {timing.module}")
+            print(f"    {'self (ms)':>15} {'':>10}  top level package")
+            for package, self_us in profile.get_slowest_packages(top):
+                print(f"    {self_us / 1000:>15.1f} {'':>10}  {package}")
+            print()
+
+
+superdesk.command("stt:profile_startup", ProfileStartupCommand())
@@ -1,4 +1,4 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List
 
 import logging
 from xml.etree.ElementTree import Element
@@ -11,14 +11,19 @@ from superdesk.text_utils import plain_text_to_html
 from superdesk.errors import SuperdeskApiError
 from planning.feed_parsers.events_ml import EventsMLParser
 
-from .common import planning_xml_contains_remove_signal, unpost_or_spike_event_or_planning, \
-    remove_date_portion_from_id, original_item_exists
+from .contact_index import contact_index
+from .vocabularies import VocabularyCacheMixin
+from .xml_utils import CachedQNameMixin, StreamingParserMixin, STT_NS
+from .instrumentation import instrumented, count_list_items
+from .metrics import ITEMS_PARSED, ITEMS_REMOVED, CONTACTS
+from .common import planning_xml_contains_remove_signal, unpost_or_spike_events_and_planning, \
+    resolve_item_id, resolve_item_ids, set_short_id
 
 logger = logging.getLogger(__name__)
 TIMEZONE = "Europe/Helsinki"
 
 NS = {
-    "stt": "http://www.stt-lehtikuva.fi/NewsML",
+    "stt": STT_NS,
 }
 
 
@@ -68,9 +73,60 @@ def search_existing_contacts(contact: Dict[str, Any]) -> Optional[Dict[str, Any]
     return None
 
 
-class STTEventsMLParser(EventsMLParser):
+def get_indexed_contact_ids(contacts: List[Dict[str, Any]]) -> List[Optional[ObjectId]]:
+    """Returns the ID of each contact found in the in-process contact index, ``None`` if not found
+
+    Hits of the index are only used if the contact still exists and matches, as it may have been edited
+    or deleted by another process. All the hits are checked with a single query, stale entries are dropped.
+    """
+
+    contact_ids = [contact_index.get(contact) for contact in contacts]
+    hit_ids = list({contact_id for contact_id in contact_ids if contact_id is not None})
+    if not hit_ids:
+        return contact_ids
+
+    existing_contacts = {
+        ObjectId(existing_contact["_id"]): existing_contact
+        for existing_contact in get_resource_service("contacts").get_from_mongo(
+            req=None,
+            lookup={"_id": {"$in": hit_ids}},
+            projection={"first_name": 1, "last_name": 1, "contact_email": 1},
+        )
+    }
+
+    for index, (contact, contact_id) in enumerate(zip(contacts, contact_ids)):
+        if contact_id is None:
+            continue
+
+        existing_contact = existing_contacts.get(contact_id)
+        if existing_contact is not None and contact_index.matches(existing_contact, contact):
+            continue
+
+        contact_index.stale += 1
+        contact_index.remove({**contact, "_id": contact_id})
+        if existing_contact is not None:
+            contact_index.add(existing_contact)
+        contact_ids[index] = None
+
+    return contact_ids
+
+
+def find_existing_contact_id(contact: Dict[str, Any]) -> Optional[ObjectId]:
+    """Find existing media contact using Elasticsearch, for contacts not found in the contact index"""
+
+    contact_index.fallbacks += 1
+    existing_contact = search_existing_contacts(contact)
+    if existing_contact is None:
+        return None
+
+    contact_index.add(existing_contact)
+    return ObjectId(existing_contact["_id"])
+
+
+class STTEventsMLParser(VocabularyCacheMixin, CachedQNameMixin, StreamingParserMixin, EventsMLParser):
     NAME = "stteventsml"
     label = "STT Events ML"
+    STREAM_ITEM_TAGS = ("conceptItem",)
 
     SUBJ_QCODE_PREFIXES = {
         "stt-subj": None,
@@ -79,21 +135,27 @@ class STTEventsMLParser(EventsMLParser):
     }
 
     def get_item_id(self, tree: Element) -> str:
-        item_id = super(STTEventsMLParser, self).get_item_id(tree)
-        return item_id if original_item_exists("events", item_id) else remove_date_portion_from_id(item_id)
+        return resolve_item_id("events", super(STTEventsMLParser, self).get_item_id(tree))
+
+    def prefetch_item_ids(self, trees: Iterable[Element]):
+        """Resolve the IDs of a batch of Events at once, so ``get_item_id`` is served from the cache"""
+        resolve_item_ids("events", [super(STTEventsMLParser, self).get_item_id(tree) for tree in trees])
 
+    @instrumented("eventsml.parse", count_list_items)
     def parse(self, tree: Element, provider=None):
+        self.prefetch_item_ids(self.get_item_elements(tree))
         items = super(STTEventsMLParser, self).parse(tree, provider)
-        items_to_ingest = []
+        if planning_xml_contains_remove_signal(tree):
+            counts = unpost_or_spike_events_and_planning(items)
+            ITEMS_REMOVED.inc(counts["spiked"] + counts["cancelled"], parser=self.NAME)
+            # If the item contains the ``sttinstruct:remove`` signal, no need to ingest this one
+            return []
+
         for item in items:
-            if planning_xml_contains_remove_signal(tree):
-                unpost_or_spike_event_or_planning(item)
-                # If the item contains the ``sttinstruct:remove`` signal, no need to ingest this one
-                continue
             self.set_extra_fields(item, tree)
-            items_to_ingest.append(item)
 
-        return items_to_ingest
+        ITEMS_PARSED.inc(len(items), parser=self.NAME)
+        return items
 
     def datetime(self, value):
         """When there is no timezone info, assume it's Helsinki timezone."""
@@ -102,9 +164,11 @@ class STTEventsMLParser(EventsMLParser):
             return local_to_utc(TIMEZONE, parsed)
         return parsed
 
+    @instrumented("eventsml.set_extra_fields")
     def set_extra_fields(self, item, xml):
         """Adds extra fields"""
 
+        set_short_id(item)
         concept = xml.find(self.qname("concept"))
 
         # Add ``sttevents``, if one found
@@ -157,6 +221,7 @@ class STTEventsMLParser(EventsMLParser):
         self.set_location_details(item, event_details.find(self.qname("location")), location_notes)
         self.set_contact_details(item, event_details)
 
+    @instrumented("eventsml.set_location_details")
     def set_location_details(self, item, location_xml, notes):
         """Add Location information, if found"""
         if location_xml is None:
@@ -223,49 +288,77 @@ class STTEventsMLParser(EventsMLParser):
 
         item["location"] = [location]
 
+    @instrumented("eventsml.set_contact_details")
     def set_contact_details(self, item: Dict[str, Any], event_details: Element):
-        for contact_info in event_details.findall(self.qname("contactInfo")):
-            first_name = contact_info.find(self.qname("firstname", ns=NS["stt"]))
-            last_name = contact_info.find(self.qname("lastname", ns=NS["stt"]))
-            job_title = contact_info.find(self.qname("title", ns=NS["stt"]))
-            phone = contact_info.find(self.qname("phone"))
-            organization = contact_info.find(self.qname("organization", ns=NS["stt"]))
-            email = contact_info.find(self.qname("email"))
-            web = contact_info.find(self.qname("web"))
-
-            contact = {
-                "is_active": True,
-                "public": True,
-            }
-
-            if first_name is not None and first_name.text:
-                contact["first_name"] = first_name.text
-            if last_name is not None and last_name.text:
-                contact["last_name"] = last_name.text
-            if job_title is not None and job_title.text:
-                contact["job_title"] = job_title.text
-            if organization is not None and organization.text:
-                contact["organisation"] = organization.text
-            if phone is not None and phone.text:
-                contact["contact_phone"] = [{
-                    "number": phone.text,
-                    "public": True,
-                }]
-            if email is not None and email.text:
-                contact["contact_email"] = [email.text.lower()]
-            if web is not None and web.text:
-                contact["website"] = web.text
+        contacts = [self.parse_contact_info(contact_info) for contact_info in event_details.findall(
+            self.qname("contactInfo")
+        )]
+        if not contacts:
+            return
+
+        self.link_contacts(item, contacts)
+
+    def link_contacts(self, item: Dict[str, Any], contacts: List[Dict[str, Any]]):
+        """Links the contacts to the Event, creating the ones that don't exist yet"""
 
+        item.setdefault("event_contact_info", [])
+        contacts_service = get_resource_service("contacts")
+        created: List[ObjectId] = []
+        for contact, existing_contact_id in zip(contacts, get_indexed_contact_ids(contacts)):
             try:
-                existing_contact = search_existing_contacts(contact)
-                item.setdefault("event_contact_info", [])
-                if existing_contact is not None:
-                    item["event_contact_info"].append(ObjectId(existing_contact["_id"]))
+                if existing_contact_id is None and created:
+                    # The contact may have been created for a previous contact of this Event
+                    indexed_contact_id = contact_index.get(contact)
+                    if indexed_contact_id in created:
+                        existing_contact_id = indexed_contact_id
+                if existing_contact_id is None:
+                    existing_contact_id = find_existing_contact_id(contact)
+
+                if existing_contact_id is not None:
+                    item["event_contact_info"].append(existing_contact_id)
+                    CONTACTS.inc(result="matched")
                 else:
-                    new_contact_id = get_resource_service("contacts").post([contact])[0]
+                    new_contact_id = contacts_service.post([contact])[0]
+                    contact_index.add({**contact, "_id": new_contact_id})
+                    created.append(ObjectId(new_contact_id))
                     item["event_contact_info"].append(new_contact_id)
+                    CONTACTS.inc(result="created")
             except SuperdeskApiError:
                 logger.exception("Skip linking contact to ingested Event, as it failed")
 
+    def parse_contact_info(self, contact_info: Element) -> Dict[str, Any]:
+        first_name = contact_info.find(self.qname("firstname", ns=NS["stt"]))
+        last_name = contact_info.find(self.qname("lastname", ns=NS["stt"]))
+        job_title = contact_info.find(self.qname("title", ns=NS["stt"]))
+        phone = contact_info.find(self.qname("phone"))
+        organization = contact_info.find(self.qname("organization", ns=NS["stt"]))
+        email = contact_info.find(self.qname("email"))
+        web = contact_info.find(self.qname("web"))
+
+        contact = {
+            "is_active": True,
+            "public": True,
+        }
+
+        if first_name is not None and first_name.text:
+            contact["first_name"] = first_name.text
+        if last_name is not None and last_name.text:
+            contact["last_name"] = last_name.text
+        if job_title is not None and job_title.text:
+            contact["job_title"] = job_title.text
+        if organization is not None and organization.text:
+            contact["organisation"] = organization.text
+        if phone is not None and phone.text:
+            contact["contact_phone"] = [{
+                "number": phone.text,
+                "public": True,
+            }]
+        if email is not None and email.text:
+            contact["contact_email"] = [email.text.lower()]
+        if web is not None and web.text:
+            contact["website"] = web.text
+
+        return contact
+
 
 register_feed_parser(STTEventsMLParser.NAME, STTEventsMLParser())
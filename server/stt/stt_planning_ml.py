@@ -1,7 +1,8 @@
 import pytz
 import logging
 
-from typing import Dict, Any, Optional, Set
+from typing import Dict, Any, List, Optional, Set, Iterable
+from contextvars import ContextVar
 from xml.etree.ElementTree import Element
 from eve.utils import config
 from datetime import datetime
@@ -12,23 +13,32 @@ from superdesk.io.registry import register_feed_parser
 
 from planning.types import Planning
 from planning.feed_parsers.superdesk_planning_xml import PlanningMLParser
-from planning.common import get_coverage_from_planning
 
-from .common import planning_xml_contains_remove_signal, unpost_or_spike_event_or_planning, \
-    remove_date_portion_from_id, original_item_exists
+from .vocabularies import VocabularyCacheMixin, vocabulary_cache
+from .xml_utils import CachedQNameMixin, StreamingParserMixin, LINKED_EVENT_QCODES_XPATH
+from .instrumentation import instrumented, count_list_items
+from .metrics import ITEMS_PARSED, ITEMS_REMOVED, DELIVERIES_CREATED
+from .common import planning_xml_contains_remove_signal, unpost_or_spike_events_and_planning, \
+    remove_date_portion_from_id, find_stored_item_ids, resolve_item_id, resolve_item_ids, set_short_id
 
 TIMEZONE = "Europe/Helsinki"
 
 logger = logging.getLogger(__name__)
 
 
+#: IDs of the Events linked by the coverages of the Planning item being parsed, see ``get_linked_event_ids``.
+#: Set by ``parse_item`` for ``get_coverage_details``, as it is called by the Planning parser with a fixed signature
+linked_event_ids_context: ContextVar[Optional[Dict[str, Optional[str]]]] = ContextVar("linked_event_ids", default=None)
+
+
 class EventNotFound(Exception):
     pass
 
 
-class STTPlanningMLParser(PlanningMLParser):
+class STTPlanningMLParser(VocabularyCacheMixin, CachedQNameMixin, StreamingParserMixin, PlanningMLParser):
     NAME = "sttplanningml"
     label = "STT Planning ML"
+    STREAM_ITEM_TAGS = ("planningItem",)
 
     SUBJ_QCODE_PREFIXES = {
         "stt-subj": None,
@@ -37,22 +47,64 @@ class STTPlanningMLParser(PlanningMLParser):
     }
 
     def get_item_id(self, tree: Element) -> str:
-        item_id = super(STTPlanningMLParser, self).get_item_id(tree)
-        return item_id if original_item_exists("planning", item_id) else remove_date_portion_from_id(item_id)
+        return resolve_item_id("planning", super(STTPlanningMLParser, self).get_item_id(tree))
+
+    def prefetch_item_ids(self, trees: Iterable[Element]):
+        """Resolve the IDs of a batch of Planning items at once, so ``get_item_id`` is served from the cache"""
+        resolve_item_ids("planning", [super(STTPlanningMLParser, self).get_item_id(tree) for tree in trees])
+
+    @instrumented("planningml.parse", count_list_items)
+    def parse(self, tree: Element, provider=None):
+        item_elements = self.get_item_elements(tree)
+        self.prefetch_item_ids(item_elements)
+        items = super(STTPlanningMLParser, self).parse(tree, provider)
+
+        # Planning items with the ``sttinstruct:remove`` signal are removed together, once the document is parsed
+        removed_items = self.get_removed_items(item_elements)
+        if removed_items:
+            counts = unpost_or_spike_events_and_planning(removed_items)
+            ITEMS_REMOVED.inc(counts["spiked"] + counts["cancelled"], parser=self.NAME)
+        ITEMS_PARSED.inc(len(items), parser=self.NAME)
+        return items
+
+    def get_removed_items(self, item_elements: List[Element]) -> List[Dict[str, Any]]:
+        """Returns the Planning items with the ``sttinstruct:remove`` signal, to remove if they were ingested"""
+
+        return [
+            {"guid": self.get_item_id(item_element), "type": "planning"}
+            for item_element in item_elements
+            if planning_xml_contains_remove_signal(item_element)
+        ]
 
     def parse_item(self, tree: Element, original: Optional[Planning]) -> Optional[Planning]:
         if original is not None and planning_xml_contains_remove_signal(tree):
-            unpost_or_spike_event_or_planning(original)
-            # If the item contains the ``sttinstruct:remove`` signal, no need to ingest this one
+            # The item is removed by ``parse``, no need to ingest this one
             return None
 
-        item = super(STTPlanningMLParser, self).parse_item(tree, original)
-        if item is None:
-            return None
+        token = linked_event_ids_context.set(self.get_linked_event_ids(tree))
+        try:
+            item = super(STTPlanningMLParser, self).parse_item(tree, original)
+            if item is None:
+                return None
 
-        self.check_coverage(item, original, tree) if original else self.set_placeholder_coverage(item, tree)
-        self.set_extra_fields(tree, item, original)
-        return item
+            self.check_coverage(item, original, tree) if original else self.set_placeholder_coverage(item, tree)
+            self.set_extra_fields(tree, item, original)
+            return item
+        finally:
+            linked_event_ids_context.reset(token)
+
+    def get_linked_event_ids(self, tree: Element) -> Dict[str, Optional[str]]:
+        """Returns the stored ID of every Event linked by the coverages, using a single query"""
+
+        qcodes = LINKED_EVENT_QCODES_XPATH(tree)
+        if not qcodes:
+            return {}
+
+        event_ids = find_stored_item_ids("events", qcodes)
+        missing = [qcode for qcode, event_id in event_ids.items() if event_id is None]
+        if missing:
+            logger.warning("Linked events not found", extra={"events": missing})
+        return event_ids
 
     def datetime(self, value: str):
         """When there is no timezone info, assume it's Helsinki timezone."""
@@ -71,10 +123,12 @@ class STTPlanningMLParser(PlanningMLParser):
             return local_to_utc(TIMEZONE, parsed)
         return parsed
 
+    @instrumented("planningml.set_extra_fields")
     def set_extra_fields(self, tree: Element, item: Dict[str, Any], original: Optional[Planning]):
         """Adds extra fields"""
 
         item.setdefault("extra", {})["stt_topics"] = item["guid"].split(":")[-1]
+        set_short_id(item)
 
         news_coverage_set = tree.find(self.qname("newsCoverageSet"))
         if news_coverage_set is not None:
@@ -85,7 +139,7 @@ class STTPlanningMLParser(PlanningMLParser):
 
     def get_coverage_details(self, news_coverage_elt: Element, item: Planning, original: Optional[Planning]):
         try:
-            event_id = self._get_linked_event_id(news_coverage_elt)
+            event_id = self._get_linked_event_id(news_coverage_elt, linked_event_ids_context.get())
         except EventNotFound:
             return None
         if event_id is not None:
@@ -100,22 +154,30 @@ class STTPlanningMLParser(PlanningMLParser):
 
         return super().get_coverage_details(news_coverage_elt, item, original)
 
-    def _get_linked_event_id(self, news_coverage_item: Element) -> Optional[str]:
+    def _get_linked_event_id(
+        self,
+        news_coverage_item: Element,
+        linked_event_ids: Optional[Dict[str, Optional[str]]] = None
+    ) -> Optional[str]:
         planning = news_coverage_item.find(self.qname("planning"))
         if planning is None:
             return None
         for subject_item in planning.findall(self.qname("subject")):
             qcode = subject_item.get("qcode")
             if qcode and subject_item.get("type") == "cpnat:event":
-                if original_item_exists("events", qcode):
-                    return qcode
-                short_qcode = remove_date_portion_from_id(qcode)
-                if original_item_exists("events", short_qcode):
-                    return short_qcode
-                logger.warning("Linked event not found", extra={"event": qcode})
-                raise EventNotFound()
+                if linked_event_ids is not None and qcode in linked_event_ids:
+                    # Resolved (and logged if missing) along with the other coverages of the Planning item
+                    event_id = linked_event_ids[qcode]
+                else:
+                    event_id = find_stored_item_ids("events", [qcode])[qcode]
+                    if event_id is None:
+                        logger.warning("Linked event not found", extra={"event": qcode})
+                if event_id is None:
+                    raise EventNotFound()
+                return event_id
         return None
 
+    @instrumented("planningml.create_temp_assignment_deliveries")
     def _create_temp_assignment_deliveries(
         self,
         news_coverage_set: Element,
@@ -130,8 +192,18 @@ class STTPlanningMLParser(PlanningMLParser):
         deliveries = []
 
         existing_deliveries: Dict[str, Set[str]] = {}
+        original_coverages: Dict[str, Dict[str, Any]] = {}
         if original is not None:
-            for entry in delivery_service.get_from_mongo(req=None, lookup={"planning_id": planning_id}):
+            for coverage in original.get("coverages") or []:
+                # Index the coverages by ID once, keeping the first one with each ID
+                original_coverages.setdefault(coverage.get("coverage_id"), coverage)
+
+            # Served by the ``planning_id``/``coverage_id``/``item_id`` index (see ``stt.indexes``)
+            for entry in delivery_service.get_from_mongo(
+                req=None,
+                lookup={"planning_id": planning_id},
+                projection={config.ID_FIELD: 0, "coverage_id": 1, "item_id": 1},
+            ):
                 try:
                     existing_deliveries.setdefault(entry["coverage_id"], set())
                     existing_deliveries[entry["coverage_id"]].add(entry["item_id"])
@@ -145,7 +217,7 @@ class STTPlanningMLParser(PlanningMLParser):
                 continue
 
             coverage_id = news_coverage_item.get("id")
-            original_coverage = get_coverage_from_planning(original, coverage_id) if original else None
+            original_coverage = original_coverages.get(coverage_id)
 
             try:
                 if original_coverage["assigned_to"]["assignment_id"] is not None:
@@ -192,29 +264,23 @@ class STTPlanningMLParser(PlanningMLParser):
 
         if len(deliveries):
             delivery_service.post(deliveries)
+            DELIVERIES_CREATED.inc(len(deliveries))
 
     def set_urgency(self, content_meta, item):
         """set importance cv data in the subjects based on <urgency> tag [STTNHUB-200]"""
 
         urgency_elt = content_meta.find(self.qname("urgency"))
         if urgency_elt is not None and urgency_elt.text:
-            importance_list_items = (
-                get_resource_service("vocabularies")
-                .find_one(req=None, _id="stturgency")
-                .get("items", [])
+            importance_item = vocabulary_cache.get_item(
+                "stturgency",
+                f"stturgency-{'2' if urgency_elt.text == '3' else urgency_elt.text}"
             )
-            matching_items = [
-                importance_item
-                for importance_item in importance_list_items
-                if f"stturgency-{'2' if urgency_elt.text == '3' else urgency_elt.text}"
-                == importance_item["qcode"]
-            ]
-            if matching_items:
+            if importance_item is not None:
                 item.get("subject").append(
                     {
-                        "name": matching_items[0].get("name"),
+                        "name": importance_item.get("name"),
                         "qcode": f"stturgency-{urgency_elt.text}",
-                        "scheme": matching_items[0].get("scheme"),
+                        "scheme": importance_item.get("scheme"),
                     }
                 )
 
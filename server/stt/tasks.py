@@ -0,0 +1,81 @@
+"""Celery tasks of the STT apps
+
+``link_content_to_coverage_task`` links published content to its coverage when ``STT_ASYNC_CONTENT_LINKING``
+is enabled, instead of ``before_content_published`` doing so while the content is being published.
+"""
+
+from typing import Dict, Any, Optional
+import logging
+
+from bson import ObjectId
+from eve.utils import config
+
+from superdesk import get_resource_service
+from superdesk.celery_app import celery
+from superdesk.metadata.item import ITEM_STATE, PUBLISH_STATES
+
+from stt.signal_hooks import link_content_to_coverage, LinkingConflict
+
+logger = logging.getLogger(__name__)
+
+#: Seconds before linking content, so the publish request has completed
+LINK_CONTENT_COUNTDOWN = 5
+#: Seconds between attempts, when the content isn't published yet or the Planning item was updated concurrently
+LINK_CONTENT_RETRY_COUNTDOWN = 10
+LINK_CONTENT_MAX_RETRIES = 5
+
+
+def queue_content_linking(item: Dict[str, Any]):
+    """Queue the linking job of content being published"""
+
+    link_content_to_coverage_task.apply_async(args=[item[config.ID_FIELD]], countdown=LINK_CONTENT_COUNTDOWN)
+
+
+@celery.task(bind=True, max_retries=LINK_CONTENT_MAX_RETRIES, soft_time_limit=120)
+def link_content_to_coverage_task(self, item_id: str):
+    """Link published content to its coverage, writing the ``assignment_id`` back to the content
+
+    The task is idempotent: content already linked to an Assignment is not linked again, only
+    the ``assignment_id`` is written back (in case a previous attempt failed before doing so).
+    """
+
+    item = get_resource_service("archive").find_one(req=None, _id=item_id)
+    if item is None:
+        logger.warning("Failed to link content to coverage: content not found", extra=dict(content_guid=item_id))
+        return
+
+    if item.get(ITEM_STATE) not in PUBLISH_STATES:
+        # The publish request hasn't completed yet
+        raise self.retry(countdown=LINK_CONTENT_RETRY_COUNTDOWN)
+
+    assignment_id = item.get("assignment_id") or get_linked_assignment_id(item_id)
+    if assignment_id is None:
+        try:
+            assignment_id = link_content_to_coverage(item, skip_archive_update=False, raise_conflicts=True)
+        except LinkingConflict as error:
+            logger.info("Planning item updated while linking content, retrying", extra=dict(
+                content_guid=item_id,
+                planning_id=str(error),
+            ))
+            raise self.retry(exc=error, countdown=LINK_CONTENT_RETRY_COUNTDOWN)
+
+    if assignment_id is not None:
+        write_assignment_id(item, assignment_id)
+
+
+def get_linked_assignment_id(item_id: str) -> Optional[ObjectId]:
+    """Returns the ID of the Assignment the content is linked to, from its delivery"""
+
+    delivery = get_resource_service("delivery").find_one(
+        req=None,
+        item_id=item_id,
+        assignment_id={"$ne": None},
+    )
+    return delivery["assignment_id"] if delivery else None
+
+
+def write_assignment_id(item: Dict[str, Any], assignment_id: ObjectId):
+    item_id = item[config.ID_FIELD]
+    if item.get("assignment_id") != assignment_id:
+        get_resource_service("archive").system_update(item_id, {"assignment_id": assignment_id}, item)
+    get_resource_service("published").update_published_items(item_id, "assignment_id", assignment_id)
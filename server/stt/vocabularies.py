@@ -0,0 +1,173 @@
+from typing import Dict, Any, Optional, List, NamedTuple
+import json
+import logging
+from os import path
+from threading import RLock
+from time import monotonic
+
+from flask import current_app as app
+from superdesk import get_resource_service
+from superdesk.factory.app import SuperdeskEve
+
+from .cache import register_cache
+
+logger = logging.getLogger(__name__)
+
+#: Number of seconds a cached vocabulary is used before its ``_etag`` is checked again
+#: (vocabularies updated in this process are invalidated straight away, see ``init_app``)
+VOCABULARY_REVALIDATE_SECONDS = 60
+
+
+class CachedVocabulary(NamedTuple):
+    etag: Optional[str]
+    items: Optional[Dict[str, Dict[str, Any]]]
+    checked: float
+
+
+class VocabularyCache:
+    """Cache of controlled vocabulary items, keyed by vocabulary ``_id`` and item ``qcode``
+
+    The vocabularies shipped in ``data/vocabularies.json`` are loaded with a single query on first use.
+    Cached vocabularies are invalidated by the ``vocabularies`` resource hooks, and every
+    ``VOCABULARY_REVALIDATE_SECONDS`` their ``_etag`` is compared to pick up changes from other processes.
+    """
+
+    name = "vocabularies"
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.warm = False
+        self._vocabularies: Dict[str, CachedVocabulary] = {}
+        self._lock = RLock()
+
+    def warm_up(self, vocabulary_ids: Optional[List[str]] = None):
+        with self._lock:
+            if vocabulary_ids is None:
+                vocabulary_ids = get_shipped_vocabulary_ids()
+            self._load(vocabulary_ids)
+            self.warm = True
+
+    def get_items(self, vocabulary_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Returns items of the vocabulary by ``qcode``, or ``None`` if the vocabulary doesn't exist"""
+
+        with self._lock:
+            if not self.warm:
+                self.warm_up()
+
+            cached = self._vocabularies.get(vocabulary_id)
+            if cached is not None and monotonic() - cached.checked < VOCABULARY_REVALIDATE_SECONDS:
+                self.hits += 1
+                return cached.items
+
+            self.misses += 1
+            if cached is not None and self._get_etag(vocabulary_id) == cached.etag:
+                self._vocabularies[vocabulary_id] = cached._replace(checked=monotonic())
+                return cached.items
+
+            self._load([vocabulary_id])
+            return self._vocabularies[vocabulary_id].items
+
+    def get_item(self, vocabulary_id: str, qcode: str) -> Optional[Dict[str, Any]]:
+        return (self.get_items(vocabulary_id) or {}).get(qcode)
+
+    def invalidate(self, vocabulary_id: str):
+        with self._lock:
+            self._vocabularies.pop(vocabulary_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._vocabularies.clear()
+            self.warm = False
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._vocabularies),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def _load(self, vocabulary_ids: List[str]):
+        vocabularies = {
+            vocabulary["_id"]: vocabulary
+            for vocabulary in get_resource_service("vocabularies").get_from_mongo(
+                req=None,
+                lookup={"_id": {"$in": vocabulary_ids}},
+            )
+        }
+
+        checked = monotonic()
+        for vocabulary_id in vocabulary_ids:
+            vocabulary = vocabularies.get(vocabulary_id)
+            if vocabulary is None:
+                self._vocabularies[vocabulary_id] = CachedVocabulary(None, None, checked)
+                continue
+
+            items: Dict[str, Dict[str, Any]] = {}
+            for item in vocabulary.get("items") or []:
+                # Keep the first item, as the parsers use the first one that matches
+                items.setdefault(item.get("qcode"), item)
+            self._vocabularies[vocabulary_id] = CachedVocabulary(vocabulary.get("_etag"), items, checked)
+
+    def _get_etag(self, vocabulary_id: str) -> Optional[str]:
+        for vocabulary in get_resource_service("vocabularies").get_from_mongo(
+            req=None,
+            lookup={"_id": vocabulary_id},
+            projection={"_etag": 1},
+        ):
+            return vocabulary.get("_etag")
+        return None
+
+
+vocabulary_cache = register_cache(VocabularyCache())
+
+
+def get_shipped_vocabulary_ids() -> List[str]:
+    """Returns the IDs of the vocabularies in ``data/vocabularies.json``"""
+
+    try:
+        with open(path.join(app.config["INIT_DATA_PATH"], "vocabularies.json")) as f:
+            return [vocabulary["_id"] for vocabulary in json.load(f)]
+    except (KeyError, OSError, ValueError):
+        logger.warning("Failed to load the list of vocabularies to cache")
+        return []
+
+
+class VocabularyCacheMixin:
+    """Feed parser mixin, looking up vocabulary items from the ``vocabulary_cache``"""
+
+    def getVocabulary(self, voc_id, qcode, name):
+        item = vocabulary_cache.get_item(voc_id, qcode)
+        if item is not None:
+            if not item.get("is_active", True):
+                # the vocabulary exists but is disabled
+                raise ValueError
+            return item.get("name", name)
+
+        # The vocabulary item wasn't found, the parser will either reject or create it
+        try:
+            return super().getVocabulary(voc_id, qcode, name)
+        finally:
+            vocabulary_cache.invalidate(voc_id)
+
+
+def on_vocabularies_inserted(docs):
+    for doc in docs:
+        vocabulary_cache.invalidate(doc.get("_id"))
+
+
+def on_vocabulary_updated(updates, original):
+    vocabulary_cache.invalidate(original.get("_id"))
+
+
+def on_vocabulary_deleted(doc):
+    vocabulary_cache.invalidate(doc.get("_id"))
+
+
+def init_app(app: SuperdeskEve):
+    app.on_inserted_vocabularies += on_vocabularies_inserted
+    app.on_updated_vocabularies += on_vocabulary_updated
+    app.on_replaced_vocabularies += on_vocabulary_updated
+    app.on_deleted_item_vocabularies += on_vocabulary_deleted
@@ -0,0 +1,98 @@
+"""Precompiled XPath expressions and cached Qualified Names shared by the STT feed parsers"""
+
+from typing import Dict, Any, Iterator, List, Tuple
+from copy import deepcopy
+from functools import lru_cache
+from lxml import etree
+
+from superdesk.errors import ParserError
+
+IPTC_NS = "http://iptc.org/std/nar/2006-10-01/"
+STT_NS = "http://www.stt-lehtikuva.fi/NewsML"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+
+NAMESPACES = {
+    "iptc": IPTC_NS,
+    "stt": STT_NS,
+}
+
+#: ``True`` if the item contains the ``sttinstruct:remove`` signal.
+#: Anchored to the ``itemMeta`` of the item, instead of searching the whole document
+REMOVE_SIGNAL_XPATH = etree.XPath(
+    "boolean(iptc:itemMeta/iptc:signal[@qcode='sttinstruct:remove'])",
+    namespaces=NAMESPACES,
+)
+
+
+#: The ``qcode`` of the Event linked by each ``newsCoverage`` of a Planning item (its first ``cpnat:event`` subject)
+LINKED_EVENT_QCODES_XPATH = etree.XPath(
+    "iptc:newsCoverageSet/iptc:newsCoverage/iptc:planning/iptc:subject[@type='cpnat:event' and @qcode!=''][1]/@qcode",
+    namespaces=NAMESPACES,
+    smart_strings=False,
+)
+
+
+@lru_cache(maxsize=None)
+def qname(tag: str, ns: str = IPTC_NS) -> str:
+    """Returns the Qualified Name of the tag, i.e. ``{http://iptc.org/std/nar/2006-10-01/}itemMeta``"""
+
+    return str(etree.QName(ns, tag))
+
+
+@lru_cache(maxsize=None)
+def get_namespace_from_tag(tag: str) -> str:
+    return tag.rsplit("}")[0].lstrip("{")
+
+
+class CachedQNameMixin:
+    """Feed parser mixin, returning cached Qualified Names from ``qname``"""
+
+    def qname(self, tag, ns=None):
+        if ns is None:
+            ns = get_namespace_from_tag(self.root.tag)
+        elif ns == "xml":
+            ns = XML_NS
+
+        return qname(tag, ns)
+
+
+class StreamingParserMixin:
+    """Feed parser mixin, parsing documents that contain many items one item at a time
+
+    ``parse_stream`` reads the document with ``lxml.etree.iterparse`` and drops every item once it is parsed,
+    so memory usage stays flat regardless of the number of items in a bulk export or backfill package.
+    """
+
+    #: Local names of the elements passed to ``parse``, one at a time
+    STREAM_ITEM_TAGS: Tuple[str, ...] = ()
+
+    def get_item_elements(self, tree) -> List[Any]:
+        """Returns the items of the document, ``tree`` itself if it is a single item"""
+
+        tags = [qname(tag) for tag in self.STREAM_ITEM_TAGS]
+        if tree.tag in tags:
+            return [tree]
+        return list(tree.iter(*tags))
+
+    def parse_stream(self, source, provider=None) -> Iterator[Dict[str, Any]]:
+        """Yields the items parsed from ``source``, a filename or a file-like object"""
+
+        try:
+            for _event, elt in etree.iterparse(
+                source,
+                events=("end",),
+                tag=[qname(tag) for tag in self.STREAM_ITEM_TAGS],
+            ):
+                parent = elt.getparent()
+                if parent is None:
+                    # The document contains a single item
+                    yield from self.parse(elt, provider)
+                    continue
+
+                # Parse a copy of the item as its own document, as the parsers use XPath
+                # expressions relative to the root (i.e. ``//iptc:genre``), then drop the original
+                document = deepcopy(elt)
+                parent.remove(elt)
+                yield from self.parse(document, provider)
+        except etree.XMLSyntaxError as error:
+            raise ParserError.parseMessageError(error, provider)
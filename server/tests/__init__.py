@@ -5,6 +5,7 @@ from lxml import etree
 from superdesk.tests import TestCase as CoreTestCase
 from apps.prepopulate.app_populate import AppPopulateCommand
 from stt.parser import STTParser
+from stt.cache import clear_caches
 
 
 class TestCase(CoreTestCase):
@@ -15,6 +16,8 @@ class TestCase(CoreTestCase):
     parse_source = True
 
     def setUp(self):
+        clear_caches()
+
         if self.add_stt_cvs:
             self.addSttCVs()
 
@@ -1,5 +1,19 @@
+import os
+from unittest import mock
+from lxml import etree
+
+from superdesk import get_resource_service
+
 from . import TestCase
-from stt.common import is_online_version
+from stt.common import (
+    is_online_version,
+    resolve_item_ids,
+    find_stored_item_ids,
+    unpost_or_spike_events_and_planning,
+    RemoveItemsFailed,
+    planning_xml_contains_remove_signal,
+    SubjectMerger,
+)
 
 
 class CommonUtilsTest(TestCase):
@@ -13,3 +27,128 @@ class CommonUtilsTest(TestCase):
         self.fixture = "stt_newsml_online_version.xml"
         self.parse_source_content()
         self.assertTrue(is_online_version(self.item))
+
+    def test_resolve_item_ids(self):
+        long_ids = ["urn:newsml:stt.fi:20230317:276671", "urn:newsml:stt.fi:20230317:276672"]
+        self.app.data.insert("events", [{"_id": long_ids[0]}])
+
+        expected = {
+            long_ids[0]: "urn:newsml:stt.fi:20230317:276671",
+            long_ids[1]: "urn:newsml:stt.fi:276672",
+        }
+        self.assertEqual(resolve_item_ids("events", long_ids), expected)
+
+        # Repeat deliveries are resolved from the cache, without touching the database
+        with mock.patch("stt.common.get_resource_service") as get_resource_service:
+            self.assertEqual(resolve_item_ids("events", long_ids), expected)
+            get_resource_service.assert_not_called()
+
+    def test_find_stored_item_ids(self):
+        self.app.data.insert("events", [
+            {"_id": "urn:newsml:stt.fi:20230317:276671"},
+            {"_id": "urn:newsml:stt.fi:276672"},
+            # Stored with both the exact and the short ID
+            {"_id": "urn:newsml:stt.fi:20230317:276673"},
+            {"_id": "urn:newsml:stt.fi:276673"},
+            # Stored with another date only
+            {"_id": "urn:newsml:stt.fi:20230316:276674"},
+        ])
+
+        with mock.patch.object(get_resource_service("events"), "get_from_mongo",
+                               wraps=get_resource_service("events").get_from_mongo) as get_events:
+            found = find_stored_item_ids("events", [
+                "urn:newsml:stt.fi:20230317:276671",
+                "urn:newsml:stt.fi:20230317:276672",
+                "urn:newsml:stt.fi:20230317:276673",
+                "urn:newsml:stt.fi:20230317:276674",
+            ])
+
+        get_events.assert_called_once()
+        self.assertEqual(found, {
+            "urn:newsml:stt.fi:20230317:276671": "urn:newsml:stt.fi:20230317:276671",
+            "urn:newsml:stt.fi:20230317:276672": "urn:newsml:stt.fi:276672",
+            "urn:newsml:stt.fi:20230317:276673": "urn:newsml:stt.fi:20230317:276673",
+            "urn:newsml:stt.fi:20230317:276674": None,
+        })
+
+    def test_unpost_or_spike_events_and_planning(self):
+        self.app.data.insert("events", [
+            {"_id": "draft", "type": "event", "state": "ingested"},
+            {"_id": "posted", "type": "event", "state": "scheduled", "pubstatus": "usable", "_etag": "1"},
+            {"_id": "cancelled", "type": "event", "state": "cancelled", "pubstatus": "cancelled"},
+        ])
+        self.app.data.insert("planning", [{"_id": "planning", "type": "planning", "state": "draft"}])
+
+        with self.app.app_context(), \
+                mock.patch("stt.common.update_post_item") as update_post_item, \
+                mock.patch.object(get_resource_service("events_spike"), "patch") as spike_event, \
+                mock.patch.object(get_resource_service("planning_spike"), "patch") as spike_planning, \
+                mock.patch.object(get_resource_service("events"), "get_from_mongo",
+                                  wraps=get_resource_service("events").get_from_mongo) as get_events:
+            counts = unpost_or_spike_events_and_planning([
+                {"guid": "draft", "type": "event"},
+                {"guid": "posted", "type": "event"},
+                {"guid": "cancelled", "type": "event"},
+                {"guid": "missing", "type": "event"},
+                {"guid": "planning", "type": "planning"},
+            ])
+
+        self.assertEqual(counts, {"spiked": 2, "cancelled": 1, "skipped": 2, "failed": 0})
+        get_events.assert_called_once()
+        self.assertEqual(spike_event.call_args[0][0], "draft")
+        self.assertEqual(spike_planning.call_args[0][0], "planning")
+        update_post_item.assert_called_once()
+        self.assertEqual(update_post_item.call_args[0][1]["_id"], "posted")
+
+    def test_unpost_or_spike_events_and_planning_failure(self):
+        self.app.data.insert("events", [
+            {"_id": "failing", "type": "event", "state": "ingested"},
+            {"_id": "draft", "type": "event", "state": "ingested"},
+        ])
+
+        def spike(item_id, original):
+            if item_id == "failing":
+                raise ValueError("Item is locked")
+
+        with self.app.app_context(), \
+                mock.patch.object(get_resource_service("events_spike"), "patch", side_effect=spike) as spike_event:
+            with self.assertRaises(RemoveItemsFailed) as context:
+                unpost_or_spike_events_and_planning([
+                    {"guid": "failing", "type": "event"},
+                    {"guid": "draft", "type": "event"},
+                ])
+
+        # The other items are still removed, before the failure is raised
+        self.assertEqual(spike_event.call_count, 2)
+        self.assertEqual(context.exception.failed, ["failing"])
+        self.assertEqual(context.exception.counts["spiked"], 1)
+        self.assertIsInstance(context.exception.__cause__, ValueError)
+
+    def test_planning_xml_contains_remove_signal(self):
+        fixtures_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures")
+        for fixture, expected in [
+            ("events_ml_259431.xml", False),
+            ("events_ml_259431_delete.xml", True),
+            ("planning_ml_584717.xml", False),
+            ("planning_ml_584717_delete.xml", True),
+        ]:
+            with open(os.path.join(fixtures_path, fixture), "rb") as f:
+                self.assertEqual(planning_xml_contains_remove_signal(etree.parse(f).getroot()), expected, fixture)
+
+    def test_subject_merger(self):
+        item = {"subject": [{"name": "Viro", "qcode": "238", "scheme": "country"}]}
+        subjects = SubjectMerger(item)
+
+        self.assertFalse(subjects.add_if_new_name({"name": "Viro", "qcode": "999", "scheme": "state"}))
+        self.assertTrue(subjects.add_if_new_name({"name": "Tallinna", "qcode": "392", "scheme": "locality"}))
+        subjects.add({"name": "Viro", "qcode": "238", "scheme": "country"})
+
+        self.assertEqual(
+            [(subject["scheme"], subject["qcode"]) for subject in item["subject"]],
+            [("country", "238"), ("locality", "392"), ("country", "238")],
+        )
+        self.assertTrue(subjects.has_name("Tallinna"))
+
+        item = {"subject": None}
+        SubjectMerger(item).add({"name": "Aasia", "qcode": "142", "scheme": "world_region"})
+        self.assertEqual(len(item["subject"]), 1)
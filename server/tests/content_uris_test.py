@@ -0,0 +1,40 @@
+from tests import TestCase
+from stt.content_uris import (
+    CachedContent,
+    content_uri_cache,
+    record_content,
+    on_archive_inserted,
+    on_archive_updated,
+    on_archive_deleted,
+)
+
+
+class ContentURICacheTest(TestCase):
+    parse_source = False
+
+    def test_records_search_results(self):
+        record_content({"_id": "original", "uri": "uri-a", "state": "published", "rewrite_sequence": 0})
+        self.assertEqual(content_uri_cache.peek("uri-a"), CachedContent("original", 0))
+
+        # Rewrites and updates of the cached content don't change the content to link
+        on_archive_inserted([{"_id": "update", "uri": "uri-a", "rewrite_sequence": 1}])
+        on_archive_updated({"state": "corrected"}, {"_id": "original", "uri": "uri-a", "rewrite_sequence": 0})
+        on_archive_deleted({"_id": "update", "uri": "uri-a", "rewrite_sequence": 1})
+        self.assertEqual(content_uri_cache.peek("uri-a"), CachedContent("original", 0))
+
+        on_archive_deleted({"_id": "original", "uri": "uri-a", "rewrite_sequence": 0})
+        self.assertIsNone(content_uri_cache.peek("uri-a"))
+
+    def test_rewrite_not_cached_before_original(self):
+        # The cached rewrite was found while the original wasn't in the search results yet
+        record_content({"_id": "update", "uri": "uri-a", "rewrite_sequence": 1})
+        on_archive_inserted([{"_id": "original", "uri": "uri-a", "rewrite_sequence": 0}])
+        self.assertIsNone(content_uri_cache.peek("uri-a"))
+
+        # Content is only cached from the search results, not when inserted
+        on_archive_inserted([{"_id": "update-2", "uri": "uri-a", "rewrite_sequence": 2}])
+        self.assertIsNone(content_uri_cache.peek("uri-a"))
+
+    def test_ignores_content_without_uri(self):
+        record_content({"_id": "no-uri", "state": "published"})
+        self.assertEqual(len(content_uri_cache), 0)
@@ -0,0 +1,84 @@
+from unittest import mock
+
+from tests import TestCase
+from superdesk import get_resource_service
+from stt.coverages import CoverageUpdates, LinkingConflict, patch_coverages
+
+
+class CoverageUpdatesTest(TestCase):
+    parse_source = False
+
+    def get_planning(self):
+        return {
+            "_id": "urn:newsml:stt.fi:620121",
+            "coverages": [
+                {"coverage_id": "cov1", "planning": {"slugline": "one"}},
+                {"coverage_id": "cov2", "planning": {"slugline": "two"}},
+            ],
+        }
+
+    def test_copy_on_write(self):
+        planning = self.get_planning()
+        updates = CoverageUpdates(planning)
+        self.assertIs(updates.get("cov1"), planning["coverages"][0])
+        self.assertFalse(updates.has_changes())
+
+        # Editing a coverage with the same values is not a change
+        updates.edit("cov1")["planning"]["slugline"] = "one"
+        self.assertFalse(updates.has_changes())
+
+        coverage = updates.edit("cov2")
+        coverage["planning"]["slugline"] = "updated"
+        self.assertIs(updates.edit("cov2"), coverage)
+        self.assertEqual(planning["coverages"][1]["planning"]["slugline"], "two")
+        self.assertTrue(updates.has_changes())
+        self.assertEqual(updates.get_changed(), [coverage])
+        self.assertIs(updates.get_updates()["coverages"][0], planning["coverages"][0])
+
+    def test_removed_coverages_are_changes(self):
+        updates = CoverageUpdates(self.get_planning())
+        updates.coverages = updates.coverages[:1]
+        self.assertTrue(updates.has_changes())
+        self.assertEqual(updates.get_changed(), [])
+
+    def test_patch_coverages(self):
+        planning = self.get_planning()
+        with self.app.app_context(), mock.patch("stt.coverages.get_resource_service") as get_resource_service:
+            updates = CoverageUpdates(planning)
+            self.assertIsNone(patch_coverages(planning["_id"], updates))
+            get_resource_service.assert_not_called()
+
+            updates.edit("cov1")["workflow_status"] = "active"
+            patch_coverages(planning["_id"], updates)
+            get_resource_service.return_value.patch.assert_called_once_with(
+                planning["_id"], {"coverages": updates.coverages}
+            )
+
+    def test_patch_coverages_conflict(self):
+        planning = {**self.get_planning(), "_etag": "read"}
+        with self.app.app_context():
+            self.app.data.insert("planning", [{**planning, "_etag": "updated"}])
+            planning_service = get_resource_service("planning")
+
+            # The Planning item was updated since it was read
+            updates = CoverageUpdates(planning)
+            updates.edit("cov1")["workflow_status"] = "active"
+            with mock.patch.object(planning_service, "update") as update, self.assertRaises(LinkingConflict):
+                patch_coverages(planning["_id"], updates, planning["_etag"])
+            update.assert_not_called()
+
+            # Updated in between reading the original and updating it
+            with mock.patch.object(planning_service, "update") as update, \
+                    mock.patch.object(planning_service, "on_updated") as on_updated, \
+                    self.assertRaises(LinkingConflict):
+                patch_coverages(planning["_id"], updates, "updated")
+            update.assert_called_once()
+            on_updated.assert_not_called()
+
+            with mock.patch.object(planning_service, "on_update"), mock.patch.object(planning_service, "on_updated"):
+                updated = patch_coverages(planning["_id"], updates, "updated")
+
+            stored = planning_service.find_one(req=None, _id=planning["_id"])
+            self.assertNotEqual(stored["_etag"], "updated")
+            self.assertEqual(updated["_etag"], stored["_etag"])
+            self.assertEqual(stored["coverages"][0]["workflow_status"], "active")
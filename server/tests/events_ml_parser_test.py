@@ -1,6 +1,13 @@
+import os
+from copy import deepcopy
+from unittest import mock
+from lxml import etree
+
 from tests import TestCase
 from superdesk import get_resource_service
+from stt.common import find_stored_item_ids
 from stt.stt_events_ml import STTEventsMLParser, search_existing_contacts
+from stt.contact_index import contact_index
 
 
 class STTEventsMLParserTest(TestCase):
@@ -10,6 +17,7 @@ class STTEventsMLParserTest(TestCase):
     def test_subjects(self):
         self.assertEqual(self.item["extra"]["stt_events"], "259431")
         self.assertEqual(self.item["extra"]["stt_topics"], "584717")
+        self.assertEqual(self.item["extra"]["stt_short_id"], "urn:newsml:stt.fi:259431")
 
         self.assertTrue(self.item["invitation_details"].startswith("<p>"))
         url = "www.foobar.com/event/invitation"
@@ -49,6 +57,39 @@ class STTEventsMLParserTest(TestCase):
         self.assertEqual(location["details"], ["Knock 3 times"])
 
 
+class STTEventsMLParserItemIdTest(TestCase):
+    fixture = "events_ml_259431.xml"
+    parser_class = STTEventsMLParser
+    parse_source = False
+
+    def test_parse_resolves_item_ids_with_single_query(self):
+        with mock.patch("stt.common.find_stored_item_ids", wraps=find_stored_item_ids) as find:
+            self.parse_source_content()
+
+        find.assert_called_once()
+        self.assertEqual(find.call_args[0][1], {"urn:newsml:stt.fi:20220402:259431"})
+        self.assertEqual(self.item["guid"], "urn:newsml:stt.fi:259431")
+
+    def test_prefetch_item_ids_of_document(self):
+        fixture = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", self.fixture)
+        item = etree.parse(fixture).getroot()
+        document = etree.Element(item.tag.replace("conceptItem", "conceptSet"))
+        for guid in ("urn:newsml:stt.fi:20220402:259431", "urn:newsml:stt.fi:20220402:259432"):
+            concept_item = deepcopy(item)
+            concept_item.set("guid", guid)
+            document.append(concept_item)
+
+        parser = STTEventsMLParser()
+        with self.ctx, mock.patch("stt.common.find_stored_item_ids", wraps=find_stored_item_ids) as find:
+            items = parser.get_item_elements(document)
+            self.assertEqual(len(items), 2)
+            parser.prefetch_item_ids(items)
+            item_ids = [parser.get_item_id(concept_item) for concept_item in items]
+
+        find.assert_called_once()
+        self.assertEqual(len(set(item_ids)), 2)
+
+
 class STTEventsMLParserEventTypeCVTest(TestCase):
     fixture = "events_ml_259431.xml"
     parser_class = STTEventsMLParser
@@ -121,6 +162,39 @@ class STTEventsMLParserContactInfoTest(TestCase):
         self.parse_source_content()
         self.assertEqual(self.item["event_contact_info"][0], contact_id)
 
+    def test_contacts_matched_from_index(self):
+        self.parse_source_content()
+        contact_ids = self.item["event_contact_info"]
+        self.assertEqual(len(contact_ids), 2)
+        self.assertEqual(contact_index.stats()["fallbacks"], 2)
+
+        # Contacts created by the previous ingest are matched without searching Elasticsearch,
+        # and checked with a single query
+        contacts_service = get_resource_service("contacts")
+        with mock.patch("stt.stt_events_ml.search_existing_contacts") as search_contacts, \
+                mock.patch.object(contacts_service, "get_from_mongo", wraps=contacts_service.get_from_mongo) as get, \
+                mock.patch.object(contacts_service, "find_one", wraps=contacts_service.find_one) as find_one:
+            self.parse_source_content()
+            search_contacts.assert_not_called()
+            get.assert_called_once()
+            find_one.assert_not_called()
+
+        self.assertEqual(self.item["event_contact_info"], contact_ids)
+        self.assertEqual(contact_index.stats()["fallbacks"], 2)
+
+    def test_stale_contact_in_index(self):
+        self.parse_source_content()
+        contact_ids = self.item["event_contact_info"]
+
+        # Deleted without the index knowing, i.e. by another process
+        get_resource_service("contacts").delete_action({"_id": contact_ids[0]})
+        self.parse_source_content()
+
+        self.assertEqual(contact_index.stats()["stale"], 1)
+        self.assertEqual(contact_index.stats()["fallbacks"], 3)
+        self.assertNotEqual(self.item["event_contact_info"][0], contact_ids[0])
+        self.assertEqual(self.item["event_contact_info"][1], contact_ids[1])
+
     def test_search_contacts_case_insensitive(self):
         contact_ids = get_resource_service("contacts").post([{
             "is_active": True,
@@ -0,0 +1,59 @@
+from lxml import etree
+
+from tests import TestCase
+from stt.common import is_online_version
+from stt.feed_generator import FeedGenerator
+from stt.parser import STTParser
+from stt.stt_events_ml import STTEventsMLParser
+from stt.xml_utils import NAMESPACES, REMOVE_SIGNAL_XPATH
+
+
+class FeedGeneratorTest(TestCase):
+    parse_source = False
+
+    def get_documents(self, **kwargs):
+        return list(FeedGenerator(**kwargs).generate())
+
+    def test_cross_references(self):
+        documents = self.get_documents(volume=5, coverages=3, online_ratio=0, remove_ratio=0)
+        guids = {kind: [document.guid for document in documents if document.kind == kind]
+                 for kind in ("events", "newsml", "planning")}
+        self.assertEqual(len(guids["events"]), 5)
+        self.assertEqual(len(guids["newsml"]), 15)
+        self.assertEqual(len(guids["planning"]), 5)
+
+        delivered = []
+        for document in documents:
+            if document.kind == "planning":
+                root = etree.fromstring(document.xml)
+                delivered.extend(root.xpath("//iptc:deliveredItemRef/@guidref", namespaces=NAMESPACES))
+                self.assertEqual(
+                    set(root.xpath("//iptc:subject[@type='cpnat:event']/@qcode", namespaces=NAMESPACES)),
+                    {guids["events"][guids["planning"].index(document.guid)]},
+                )
+        self.assertEqual(sorted(delivered), sorted(guids["newsml"]))
+
+    def test_remove_signals_and_online_versions(self):
+        documents = self.get_documents(volume=10, coverages=1, online_ratio=1, remove_ratio=1)
+        self.assertEqual(len(documents), 10 * 4 + 10 * 2)
+        self.assertEqual(sum(REMOVE_SIGNAL_XPATH(etree.fromstring(document.xml)) for document in documents), 20)
+        self.assertEqual(documents, self.get_documents(volume=10, coverages=1, online_ratio=1, remove_ratio=1))
+
+        with self.ctx:
+            online, = STTParser().parse(etree.fromstring(documents[2].xml), {"name": "Test"})
+            self.assertTrue(is_online_version(online))
+            article, = STTParser().parse(etree.fromstring(documents[1].xml), {"name": "Test"})
+            self.assertFalse(is_online_version(article))
+            self.assertEqual(article["extra"]["stt_topics"], "600000")
+
+    def test_contacts(self):
+        documents = self.get_documents(volume=4, coverages=1, contacts=3, online_ratio=0, remove_ratio=0)
+        emails = set()
+        for document in documents:
+            if document.kind == "events":
+                emails.update(etree.fromstring(document.xml).xpath("//iptc:email/text()", namespaces=NAMESPACES))
+        self.assertEqual(emails, {"contact0@example.com", "contact1@example.com", "contact2@example.com"})
+
+        with self.ctx:
+            event, = STTEventsMLParser().parse(etree.fromstring(documents[0].xml), {"name": "Test"})
+        self.assertEqual(len(event["event_contact_info"]), 2)
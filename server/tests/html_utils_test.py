@@ -0,0 +1,69 @@
+import os
+from glob import glob
+
+from lxml import etree
+from superdesk import etree as sd_etree
+
+from tests import TestCase
+from stt.html_utils import clean_body_html
+
+IPTC_NS = "http://iptc.org/std/nar/2006-10-01/"
+
+
+def legacy_body_html(body_elt):
+    """The body HTML pipeline ``STTParser.parse_inline_content`` used before ``clean_body_html``"""
+
+    body_elt = sd_etree.clean_html(body_elt)
+    for pre in body_elt.findall(".//pre"):
+        pre.tag = "p"
+    for a in body_elt.findall(".//a"):
+        a.attrib["target"] = "_blank"
+
+    content = {}
+    if len(body_elt) > 0:
+        content["content"] = "\n".join([sd_etree.to_string(e, encoding="unicode", method="html") for e in body_elt])
+    elif body_elt.text:
+        content["content"] = "<p>" + body_elt.text + "</p>"
+        content["format"] = "xhtml/xml"
+
+    if content.get("content"):
+        content["content"] = content["content"].replace("&lt;endash&gt;-&lt;/endash&gt;", "-")
+    return content
+
+
+class CleanBodyHTMLTestCase(TestCase):
+    parse_source = False
+
+    def get_bodies(self):
+        bodies = []
+        fixtures = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "stt_newsml_*.xml")
+        for fixture in sorted(glob(fixtures)):
+            bodies.extend(etree.parse(fixture).getroot().iter(f"{{{IPTC_NS}}}body"))
+
+        for html in [
+            "<p>Hello <b>world</b></p>",
+            "Plain text &lt;endash&gt;-&lt;/endash&gt; only",
+            "<span>inline <em>text</em></span> and a tail",
+            "<p>one</p>text<!-- comment --><p>two &lt;endash&gt;-&lt;/endash&gt; three</p><div>unwrapped</div>",
+            '<p onclick="x()" style="color: red" class="c">Styled <a href=" javascript:alert(1)">link</a></p>'
+            '<pre>code</pre><h5 title="t">not <u>allowed</u></h5><div dir="ltr"><a href="https://stt.fi">STT</a></div>',
+            "<p>Script <script>alert(1)</script> and form <form><input/>inputs</form></p><iframe>frame</iframe>",
+        ]:
+            bodies.append(etree.fromstring(f'<body xmlns="{IPTC_NS}">{html}</body>'))
+        return bodies
+
+    def test_same_html_as_legacy_pipeline(self):
+        with self.app.app_context():
+            whitelist = self.app.config["HTML_TAGS_WHITELIST"]
+            for body in self.get_bodies():
+                with self.subTest(body=etree.tostring(body)[:100]):
+                    self.assertEqual(clean_body_html(body, whitelist), legacy_body_html(body))
+
+    def test_rewrites(self):
+        body = etree.fromstring(
+            f'<body xmlns="{IPTC_NS}"><pre>pre</pre><p><a href="javascript:alert(1)">link</a>'
+            "&lt;endash&gt;-&lt;/endash&gt;<script>alert(1)</script></p></body>"
+        )
+        with self.app.app_context():
+            content = clean_body_html(body, self.app.config["HTML_TAGS_WHITELIST"])
+        self.assertEqual(content, {"content": '<p>pre</p>\n<p><a href="" target="_blank">link</a>-</p>'})
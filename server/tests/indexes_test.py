@@ -0,0 +1,40 @@
+from tests import TestCase
+from stt.indexes import backfill_short_ids, get_index_report, create_missing_indexes, STT_MONGO_INDEXES
+
+
+class STTIndexesTest(TestCase):
+    parse_source = False
+
+    def test_backfill_short_ids(self):
+        with self.app.app_context():
+            self.app.data.insert("events", [
+                {"_id": "urn:newsml:stt.fi:20230317:276671"},
+                {"_id": "urn:newsml:stt.fi:276672", "extra": {"stt_topics": "1234"}},
+                {"_id": "urn:newsml:stt.fi:276673", "extra": {"stt_short_id": "urn:newsml:stt.fi:276673"}},
+                {"_id": "manually-created-event"},
+            ])
+
+            collection = self.app.data.get_mongo_collection("events")
+            self.assertEqual(backfill_short_ids(collection), 2)
+            self.assertEqual(
+                {doc["_id"]: doc.get("extra") for doc in collection.find({}, {"extra": 1})},
+                {
+                    "urn:newsml:stt.fi:20230317:276671": {"stt_short_id": "urn:newsml:stt.fi:276671"},
+                    "urn:newsml:stt.fi:276672": {"stt_topics": "1234", "stt_short_id": "urn:newsml:stt.fi:276672"},
+                    "urn:newsml:stt.fi:276673": {"stt_short_id": "urn:newsml:stt.fi:276673"},
+                    "manually-created-event": None,
+                },
+            )
+
+    def test_index_report(self):
+        with self.app.app_context():
+            self.app.data.insert("delivery", [{"planning_id": "p1", "coverage_id": "c1", "item_id": "i1"}])
+            self.app.data.get_mongo_collection("delivery").drop_indexes()
+
+            report = get_index_report(["delivery"])
+            self.assertEqual(report[0]["missing"], list(STT_MONGO_INDEXES["delivery"].keys()))
+
+            create_missing_indexes(report)
+            report = get_index_report(["delivery"])
+            self.assertEqual(report[0]["missing"], [])
+            self.assertIn("stt_item_id_1_assignment_id_1", [index["name"] for index in report[0]["indexes"]])
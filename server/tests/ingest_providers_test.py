@@ -0,0 +1,46 @@
+from unittest import mock
+
+from superdesk import get_resource_service
+
+from tests import TestCase
+from stt.ingest_providers import get_provider, provider_cache
+
+
+class IngestProviderCacheTest(TestCase):
+    parse_source = False
+
+    def test_get_provider(self):
+        with self.app.app_context():
+            service = get_resource_service("ingest_providers")
+            provider_id = service.post([{
+                "name": "STT-PlanningML Ingest",
+                "source": "sf",
+                "feed_parser": "sttplanningml",
+                "feeding_service": "ftp",
+            }])[0]
+
+            provider = get_provider(str(provider_id))
+            self.assertEqual(provider["feed_parser"], "sttplanningml")
+
+            # Repeat lookups are served from the cache
+            with mock.patch("stt.ingest_providers.get_resource_service") as get_resource_service_mock:
+                self.assertEqual(get_provider(provider_id), provider)
+                get_resource_service_mock.assert_not_called()
+            self.assertEqual(provider_cache.stats()["hits"], 1)
+            self.assertEqual(provider_cache.stats()["misses"], 1)
+
+            # Updating the provider invalidates it
+            service.patch(provider_id, {"feed_parser": "stteventsml"})
+            self.assertEqual(get_provider(provider_id)["feed_parser"], "stteventsml")
+
+            self.assertIsNone(get_provider(None))
+            self.assertIsNone(get_provider("not-an-object-id"))
+
+    def test_ttl(self):
+        with self.app.app_context(), mock.patch("stt.cache.time.monotonic", return_value=1000):
+            provider_cache.set("provider", {"feed_parser": "sttplanningml"})
+            self.assertEqual(provider_cache.get("provider"), {"feed_parser": "sttplanningml"})
+
+        with mock.patch("stt.cache.time.monotonic", return_value=1000 + provider_cache.ttl):
+            self.assertIsNone(provider_cache.get("provider"))
+        self.assertNotIn("provider", provider_cache)
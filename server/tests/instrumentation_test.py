@@ -0,0 +1,76 @@
+import os
+from unittest import mock
+
+from lxml import etree
+
+from tests import TestCase
+from stt.instrumentation import instrumented, stage_registry, set_enabled, DBCallCounter, DurationHistogram
+from stt.stt_events_ml import STTEventsMLParser
+
+
+class InstrumentationTest(TestCase):
+    parse_source = False
+
+    def setUp(self):
+        super().setUp()
+        set_enabled(True)
+        self.addCleanup(set_enabled, False)
+
+    def test_disabled(self):
+        set_enabled(False)
+
+        @instrumented("test.disabled")
+        def stage():
+            return "result"
+
+        self.assertEqual(stage(), "result")
+        self.assertIsNone(stage_registry.get("test.disabled"))
+
+    def test_stage_stats(self):
+        counter = DBCallCounter()
+
+        @instrumented("test.stage", len)
+        def stage(items):
+            for _ in items:
+                counter.started(mock.Mock())
+            return items
+
+        stage([1, 2, 3])
+        stage([4])
+        stats = stage_registry.get("test.stage")
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["items"], 4)
+        self.assertEqual(stats["db_calls"], 4)
+        self.assertEqual(stats["db_calls_per_item"], 1)
+        self.assertEqual(stats["failures"], 0)
+        self.assertEqual(sum(stats["buckets"].values()), 2)
+
+        @instrumented("test.failure")
+        def failure():
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            failure()
+        self.assertEqual(stage_registry.get("test.failure")["failures"], 1)
+
+    def test_histogram_quantiles(self):
+        histogram = DurationHistogram()
+        self.assertIsNone(histogram.quantile(0.5))
+        for duration_ms in [0.5] * 98 + [30, 20000]:
+            histogram.observe(duration_ms)
+        self.assertEqual(histogram.quantile(0.5), 1)
+        self.assertEqual(histogram.quantile(0.99), 50)
+        self.assertEqual(histogram.quantile(1), 20000)
+
+    def test_parser_stages(self):
+        fixture = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "events_ml_259431.xml")
+        tree = etree.parse(fixture).getroot()
+
+        with self.ctx:
+            STTEventsMLParser().parse(tree, {"name": "Test"})
+
+        stats = stage_registry.stats()
+        self.assertEqual(stats["eventsml.parse"]["items"], 1)
+        self.assertEqual(stats["eventsml.set_contact_details"]["calls"], 1)
+        self.assertEqual(stats["eventsml.set_location_details"]["calls"], 1)
+        self.assertGreaterEqual(stats["eventsml.parse"]["total_ms"], stats["eventsml.set_extra_fields"]["total_ms"])
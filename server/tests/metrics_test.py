@@ -0,0 +1,105 @@
+from celery.signals import worker_process_shutdown
+from flask import Flask
+
+from tests import TestCase
+from stt import metrics
+from stt.metrics import ITEMS_PARSED, COVERAGES_LINKED, LINKING_DURATION, set_redis, render_metrics
+
+
+class FakeRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.commands = []
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hincrbyfloat(self, key, field, value):
+        values = self.hashes.setdefault(key, {})
+        values[field.encode()] = values.get(field.encode(), 0) + value
+        self.commands.append(None)
+
+    def hgetall(self, key):
+        self.commands.append({field: str(value).encode() for field, value in self.hashes.get(key, {}).items()})
+
+    def execute(self):
+        results, self.commands = self.commands, []
+        return results
+
+
+class MetricsTest(TestCase):
+    parse_source = False
+
+    def setUp(self):
+        super().setUp()
+        self.redis = FakeRedis()
+        set_redis(self.redis)
+        self.addCleanup(set_redis, None)
+
+    def test_disabled(self):
+        set_redis(None)
+        ITEMS_PARSED.inc(parser="sttplanningml")
+        self.assertEqual(metrics.buffer._increments, {})
+
+    def test_buffered_until_flushed(self):
+        ITEMS_PARSED.inc(2, parser="sttplanningml")
+        ITEMS_PARSED.inc(3, parser="sttplanningml")
+        self.assertEqual(self.redis.hashes, {})
+
+        metrics.buffer.flush()
+        self.assertEqual(self.redis.hashes, {
+            "stt:metrics:stt_items_parsed_total": {b'{"parser": "sttplanningml"}': 5},
+        })
+
+        with self.assertRaises(ValueError):
+            ITEMS_PARSED.inc(stage="ingest")
+
+    def test_flushed_on_worker_shutdown(self):
+        ITEMS_PARSED.inc(2, parser="sttplanningml")
+        worker_process_shutdown.send(sender=None, pid=1, exitcode=0)
+        self.assertEqual(self.redis.hashes, {
+            "stt:metrics:stt_items_parsed_total": {b'{"parser": "sttplanningml"}': 2},
+        })
+
+    def test_forked_process_starts_empty(self):
+        ITEMS_PARSED.inc(2, parser="sttplanningml")
+        metrics.buffer.after_fork()
+        metrics.buffer.flush()
+        self.assertEqual(self.redis.hashes, {})
+
+    def test_render_metrics(self):
+        ITEMS_PARSED.inc(2, parser="sttplanningml")
+        ITEMS_PARSED.inc(parser="stteventsml")
+        COVERAGES_LINKED.inc(3, stage="ingest")
+        LINKING_DURATION.observe(0.003, stage="publish")
+        LINKING_DURATION.observe(0.2, stage="publish")
+        LINKING_DURATION.observe(20, stage="publish")
+
+        lines = render_metrics().splitlines()
+        self.assertIn("# TYPE stt_items_parsed_total counter", lines)
+        self.assertIn('stt_items_parsed_total{parser="sttplanningml"} 2', lines)
+        self.assertIn('stt_items_parsed_total{parser="stteventsml"} 1', lines)
+        self.assertIn('stt_coverages_linked_total{stage="ingest"} 3', lines)
+        self.assertIn("# TYPE stt_linking_duration_seconds histogram", lines)
+        self.assertIn('stt_linking_duration_seconds_bucket{le="0.005",stage="publish"} 1', lines)
+        self.assertIn('stt_linking_duration_seconds_bucket{le="0.25",stage="publish"} 2', lines)
+        self.assertIn('stt_linking_duration_seconds_bucket{le="10",stage="publish"} 2', lines)
+        self.assertIn('stt_linking_duration_seconds_bucket{le="+Inf",stage="publish"} 3', lines)
+        self.assertIn('stt_linking_duration_seconds_count{stage="publish"} 3', lines)
+        self.assertIn('stt_linking_duration_seconds_sum{stage="publish"} 20.203', lines)
+
+    def test_metrics_view_requires_token(self):
+        # Not served without a token configured
+        self.assertNotIn("/stt/metrics", [rule.rule for rule in self.app.url_map.iter_rules()])
+
+        app = Flask(__name__)
+        app.config["STT_METRICS_TOKEN"] = "secret"
+        app.register_blueprint(metrics.blueprint)
+        client = app.test_client()
+
+        self.assertEqual(client.get("/stt/metrics").status_code, 401)
+        self.assertEqual(client.get("/stt/metrics", headers={"Authorization": "Bearer wrong"}).status_code, 401)
+        ITEMS_PARSED.inc(parser="sttplanningml")
+        response = client.get("/stt/metrics", headers={"Authorization": "Bearer secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'stt_items_parsed_total{parser="sttplanningml"} 1', response.data)
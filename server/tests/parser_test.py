@@ -1,4 +1,13 @@
+import os
+from io import BytesIO
+from copy import deepcopy
+from glob import glob
+
+from lxml import etree
+
 from tests import TestCase
+from stt.common import remove_date_portion_from_id
+from stt.parser import STTParser
 
 
 class STTParseTestCase(TestCase):
@@ -55,3 +64,131 @@ class STTParsePRETestCase(TestCase):
     def test_replace_pre_with_p(self):
         body_html = self.item['body_html']
         self.assertIn('<p>It used to be a pre</p>', body_html)
+
+
+def legacy_set_extra_fields(parser, item, xml):
+    """The ``set_extra_fields`` implementation which looked up each field separately"""
+
+    if 'uri' in item:
+        item.setdefault('extra', {})['newsItem_guid'] = item['uri']
+        item["uri"] = remove_date_portion_from_id(item["uri"])
+
+    try:
+        for alt_id in xml.find(parser.qname('contentMeta')).findall(parser.qname('altId')):
+            if alt_id.get("type") == "sttidtype:textid" and alt_id.text:
+                item.setdefault('extra', {})['sttidtype_textid'] = alt_id.text
+    except AttributeError:
+        pass
+
+    try:
+        creator_node = xml.find(parser.qname('contentMeta')).find(parser.qname('creator'))
+        if creator_node is not None:
+            creator_name = creator_node.find(parser.qname('name')).text
+            if creator_name:
+                item.setdefault('extra', {})['creator_name'] = creator_name
+
+            creator_id = creator_node.attrib.get('qcode')
+            if creator_id:
+                item.setdefault('extra', {})['creator_id'] = creator_id
+    except AttributeError:
+        pass
+
+    try:
+        link_node = xml.find(parser.qname('itemMeta')).find(parser.qname('link'))
+        if link_node is not None:
+            filename = link_node.find(parser.qname('filename')).text
+            if filename:
+                item.setdefault('extra', {})['filename'] = filename
+    except AttributeError:
+        pass
+
+    try:
+        for subject in xml.find(parser.qname('contentMeta')).findall(parser.qname('subject')):
+            values = subject.get('qcode', '').split(':')
+            if values[0] == 'stt-topics':
+                item.setdefault('extra', {})['stt_topics'] = values[1]
+            elif values[0] == 'stt-events':
+                item.setdefault('extra', {})['stt_events'] = values[1]
+    except AttributeError:
+        pass
+
+    try:
+        for rating in xml.find(parser.qname('contentMeta')).findall(parser.qname('rating')):
+            if rating.get('ratingtype') == 'sttrating:webprio':
+                value = rating.get('value')
+                if value:
+                    item.setdefault('extra', {})['sttrating_webprio'] = int(value)
+    except (AttributeError, ValueError):
+        pass
+
+    try:
+        for genre in xml.find(parser.qname('contentMeta')).findall(parser.qname('genre')):
+            if genre.get('qcode') == 'sttdescription:imagetype':
+                item.setdefault('extra', {}).setdefault('imagetype', {})['id'] = \
+                    genre.find(parser.qname('name')).text
+            elif genre.get('qcode') == 'sttdescription:imagetypename':
+                item.setdefault('extra', {}).setdefault('imagetype', {})['name'] = \
+                    genre.find(parser.qname('name')).text
+    except AttributeError:
+        pass
+
+
+class STTExtraFieldsTestCase(TestCase):
+    parse_source = False
+
+    def test_extra_fields_match_legacy_implementation(self):
+        parser = STTParser()
+        fixtures = glob(os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'stt_newsml_*.xml'))
+        self.assertTrue(fixtures)
+
+        for fixture in sorted(fixtures):
+            root = etree.parse(fixture).getroot()
+            parser.root = root
+            for news_item in root.iter(parser.qname('newsItem')):
+                with self.subTest(fixture=os.path.basename(fixture), guid=news_item.get('guid')):
+                    item = {'uri': news_item.get('guid'), 'extra': {'sttnote_private': 'private'}}
+                    expected = deepcopy(item)
+
+                    parser.set_extra_fields(item, news_item)
+                    legacy_set_extra_fields(parser, expected, news_item)
+                    self.assertEqual(expected, item)
+                    self.assertIn('newsItem_guid', item['extra'])
+
+
+class STTParseStreamTestCase(TestCase):
+    parse_source = False
+
+    def test_parse_stream_package(self):
+        dirname = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+        fixtures = ['stt_newsml_location_test.xml', 'stt_newsml_pre_test.xml', 'stt_newsml_link_content.xml']
+        provider = {'name': 'Test'}
+        parser = STTParser()
+
+        expected = []
+        news_items = []
+        with self.ctx:
+            for fixture in fixtures:
+                with open(os.path.join(dirname, fixture), 'rb') as f:
+                    root = etree.parse(f).getroot()
+                expected.extend(parser.parse(root, provider))
+                news_items.append(etree.tostring(root))
+
+            package = b''.join([
+                b'<newsMessage xmlns="http://iptc.org/std/nar/2006-10-01/"><header><priority>3</priority></header>',
+                b'<itemSet>',
+                *news_items,
+                b'</itemSet></newsMessage>',
+            ])
+            items = list(parser.parse_stream(BytesIO(package), provider))
+
+            # A single item document is parsed too
+            with open(os.path.join(dirname, fixtures[0]), 'rb') as f:
+                single = list(parser.parse_stream(f, provider))
+
+        self.assertEqual(len(items), len(fixtures))
+        for item, expected_item in zip(items, expected):
+            for field in ('guid', 'headline', 'body_html', 'subject', 'place', 'extra'):
+                self.assertEqual(item.get(field), expected_item.get(field), field)
+
+        self.assertEqual(len(single), 1)
+        self.assertEqual(single[0]['guid'], expected[0]['guid'])
@@ -0,0 +1,156 @@
+from unittest import mock
+from bson import ObjectId
+from superdesk.errors import SuperdeskApiError
+
+from tests import TestCase
+from stt import signal_hooks
+from stt.content_uris import record_content, content_uri_cache, CachedContent
+
+
+class SearchCursor(list):
+    def __init__(self, items, total=None):
+        super().__init__(items)
+        self.total = len(items) if total is None else total
+
+    def count(self, **kwargs):
+        return self.total
+
+
+class LinkCoveragesToContentTest(TestCase):
+    parse_source = False
+
+    def test_get_content_items_by_uris(self):
+        results = SearchCursor([
+            {"_id": "a2", "uri": "uri-a", "rewrite_sequence": 0},
+            {"_id": "b1", "uri": "uri-b", "rewrite_sequence": 0},
+            {"_id": "a1", "uri": "uri-a", "rewrite_sequence": 1},
+        ])
+        with self.app.app_context(), mock.patch.object(signal_hooks, "get_resource_service") as get_service:
+            get_service.return_value.get.return_value = results
+            items, complete = signal_hooks._get_content_items_by_uris(["uri-a", "uri-b", "uri-c"])
+
+        get_service.assert_called_once_with("search")
+        self.assertTrue(complete)
+        self.assertEqual(items, {"uri-a": results[0], "uri-b": results[1]})
+
+        with self.app.app_context(), mock.patch.object(signal_hooks, "get_resource_service") as get_service:
+            get_service.return_value.get.return_value = SearchCursor(results, total=5000)
+            self.assertFalse(signal_hooks._get_content_items_by_uris(["uri-c"])[1])
+
+    def test_get_content_items_by_uris_from_cache(self):
+        with self.app.app_context():
+            self.app.data.insert("archive", [{"_id": "a1", "uri": "uri-a", "state": "published"}])
+            record_content({"_id": "a1", "uri": "uri-a", "state": "published"})
+
+            with mock.patch.object(signal_hooks, "get_resource_service") as get_service:
+                get_service.return_value.get.return_value = SearchCursor([{"_id": "b1", "uri": "uri-b"}])
+                items, complete = signal_hooks._get_content_items_by_uris(["uri-a", "uri-b"])
+
+        # Only the uri missing from the cache is searched for
+        self.assertIn('"terms": {"uri": ["uri-b"]}', get_service.return_value.get.call_args[1]["req"].args["source"])
+        self.assertEqual(items["uri-a"]["_id"], "a1")
+        self.assertEqual(items["uri-b"]["_id"], "b1")
+        self.assertEqual(content_uri_cache.peek("uri-b"), CachedContent("b1", None))
+
+    def test_link_assignments_when_coverages_unchanged(self):
+        planning = {
+            "_id": "urn:newsml:stt.fi:620121",
+            "coverages": [{"coverage_id": "cov1", "planning": {}, "assigned_to": {"assignment_id": None}}],
+        }
+        content_items = ({"uri-1": (0, {"_id": "content1", "uri": "uri-1"})}, True)
+
+        with self.app.app_context(), \
+                mock.patch.object(signal_hooks, "_is_ingested_by_stt_planning_ml", return_value=True), \
+                mock.patch.object(signal_hooks, "_get_unlinked_delivery_uris", return_value={"cov1": ["uri-1"]}), \
+                mock.patch.object(signal_hooks, "_get_content_items_by_uris", return_value=content_items), \
+                mock.patch.object(signal_hooks, "patch_coverages", return_value=None), \
+                mock.patch.object(signal_hooks, "_link_assignments_and_content", return_value=[]) as link:
+            signal_hooks.link_coverages_to_content(None, planning)
+
+        link.assert_called_once_with([])
+
+    def test_link_coverages_with_single_delivery_query_and_search(self):
+        planning = {
+            "_id": "urn:newsml:stt.fi:620121",
+            "coverages": [
+                {"coverage_id": "cov1", "planning": {}},
+                {"coverage_id": "cov2", "planning": {}},
+                {"coverage_id": "cov3", "planning": {}},
+            ],
+        }
+        content = {"_id": "content1", "uri": "uri-1", "slugline": "Slug", "task": {"desk": "d", "user": "u"}}
+
+        with self.app.app_context():
+            self.app.data.insert("delivery", [
+                {"planning_id": planning["_id"], "coverage_id": "cov1", "item_id": "uri-1", "assignment_id": None},
+                {"planning_id": planning["_id"], "coverage_id": "cov2", "item_id": "uri-2", "assignment_id": None},
+            ])
+
+            with mock.patch.object(signal_hooks, "_is_ingested_by_stt_planning_ml", return_value=True), \
+                    mock.patch.object(signal_hooks, "_get_content_items_by_uris") as get_content, \
+                    mock.patch("planning.planning.PlanningService.patch") as patch:
+                get_content.return_value = ({"uri-1": content}, True)
+                patch.return_value = {"coverages": []}
+                signal_hooks.link_coverages_to_content(None, planning)
+
+        get_content.assert_called_once()
+        self.assertEqual(sorted(get_content.call_args[0][0]), ["uri-1", "uri-2"])
+        patch.assert_called_once()
+        coverages = patch.call_args[0][1]["coverages"]
+        self.assertEqual(coverages[0]["planning"]["slugline"], "Slug")
+        self.assertNotIn("assigned_to", coverages[1])
+        self.assertNotIn("assigned_to", coverages[2])
+
+    def test_link_assignments_and_content_in_batch(self):
+        links = [
+            signal_hooks.AssignmentLink(ObjectId(), "cov1", "content1"),
+            signal_hooks.AssignmentLink(ObjectId(), "cov2", "content2"),
+        ]
+        with self.app.app_context(), mock.patch.object(signal_hooks, "get_resource_service") as get_service:
+            signal_hooks._link_assignments_and_content(links)
+
+        get_service.return_value.delete_action.assert_called_once()
+        lookup = get_service.return_value.delete_action.call_args[1]["lookup"]
+        self.assertEqual(sorted(lookup["coverage_id"]["$in"]), ["cov1", "cov2"])
+        self.assertIsNone(lookup["assignment_id"])
+
+        get_service.return_value.post.assert_called_once()
+        self.assertEqual(
+            [(doc["assignment_id"], doc["item_id"]) for doc in get_service.return_value.post.call_args[0][0]],
+            [(links[0].assignment_id, "content1"), (links[1].assignment_id, "content2")],
+        )
+
+    def test_link_assignments_and_content_batch_failure(self):
+        links = [
+            signal_hooks.AssignmentLink(ObjectId(), "cov1", "content1"),
+            signal_hooks.AssignmentLink(ObjectId(), "cov2", "unlinkable"),
+            signal_hooks.AssignmentLink(ObjectId(), "cov3", "content3"),
+        ]
+        deliveries = []
+
+        def post(docs):
+            # The links are created one after the other, until one fails
+            for doc in docs:
+                if doc["item_id"] == "unlinkable":
+                    raise SuperdeskApiError.badRequestError("Content is already linked to an assignment")
+                deliveries.append({"assignment_id": doc["assignment_id"], "item_id": doc["item_id"]})
+            return [ObjectId() for _ in docs]
+
+        with self.app.app_context(), mock.patch.object(signal_hooks, "get_resource_service") as get_service:
+            get_service.return_value.post.side_effect = post
+            get_service.return_value.get_from_mongo.side_effect = lambda **kwargs: list(deliveries)
+            self.assertEqual(signal_hooks._link_assignments_and_content(links), [links[0], links[2]])
+
+        # The batch, then each link not created by the batch on its own
+        self.assertEqual(get_service.return_value.post.call_count, 3)
+        self.assertEqual(len(deliveries), 2)
+        # Only the deliveries of the linked coverages are removed
+        get_service.return_value.delete_action.assert_called_once()
+        lookup = get_service.return_value.delete_action.call_args[1]["lookup"]
+        self.assertEqual(sorted(lookup["coverage_id"]["$in"]), ["cov1", "cov3"])
+
+    def test_link_assignment_and_content_removes_deliveries_first(self):
+        with self.app.app_context(), mock.patch.object(signal_hooks, "get_resource_service") as get_service:
+            signal_hooks._link_assignment_and_content(ObjectId(), "cov1", "content1")
+
+        self.assertEqual([call[0] for call in get_service.return_value.method_calls], ["delete_action", "post"])
@@ -0,0 +1,17 @@
+from tests import TestCase
+from stt.startup import parse_import_times
+
+
+class StartupProfileTest(TestCase):
+    parse_source = False
+
+    def test_parse_import_times(self):
+        imports = parse_import_times(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   stt.cache\n"
+            "import time:      2500 |       3100 | stt.parser\n"
+        )
+        self.assertEqual([(timing.module, timing.self_us, timing.cumulative_us) for timing in imports], [
+            ("stt.cache", 120, 120),
+            ("stt.parser", 2500, 3100),
+        ])
@@ -1,6 +1,9 @@
+import os
 from unittest import mock
+from lxml import etree
 from tests import TestCase
-from stt.stt_planning_ml import STTPlanningMLParser
+from stt.stt_planning_ml import STTPlanningMLParser, linked_event_ids_context
+from stt.common import find_stored_item_ids
 from datetime import datetime, timedelta
 from dateutil.tz import tzoffset, tzutc
 from superdesk.tests import TestCase as CoreTestCase
@@ -17,6 +20,7 @@ class STTPlanningMLParserTest(TestCase):
     def test_stt_metadata(self):
         # Extra metadata
         self.assertEqual(self.item["extra"]["stt_topics"], "584717")
+        self.assertEqual(self.item["extra"]["stt_short_id"], "urn:newsml:stt.fi:584717")
 
         # Subjects (only ``sttdepartment`` found in provided xml files)
         self.assertIn(
@@ -43,12 +47,48 @@ class STTPlanningMLParserTest(TestCase):
             self.item["subject"],
         )
 
+    def test_vocabularies_cached(self):
+        # First ingest adds the missing ``sttdepartment`` item, after which all lookups come from the cache
+        self.parse_source_content()
+        with mock.patch("stt.vocabularies.get_resource_service") as get_resource_service:
+            self.parse_source_content()
+            get_resource_service.assert_not_called()
+
+        self.assertIn(
+            {"qcode": "stturgency-3", "name": "Keskipitkä juttu", "scheme": "stturgency"},
+            self.item["subject"],
+        )
+        self.assertIn(
+            {"qcode": "9", "name": "Politiikka", "scheme": "sttdepartment"},
+            self.item["subject"],
+        )
+
     def test_event_link(self):
         self.app.data.insert("events", [{"_id": "urn:newsml:stt.fi:259431"}])
         self.parse_source_content()
         self.assertEqual(self.item["event_item"], "urn:newsml:stt.fi:259431")
         self.assertEqual(self.item["extra"]["stt_events"], "259431")
 
+    def test_remove_signal(self):
+        self.app.data.insert("planning", [{"_id": "urn:newsml:stt.fi:584717", "type": "planning", "state": "ingested"}])
+        fixture = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "planning_ml_584717_delete.xml")
+
+        with self.ctx, mock.patch("stt.stt_planning_ml.unpost_or_spike_events_and_planning") as unpost:
+            unpost.return_value = {"spiked": 1, "cancelled": 0, "skipped": 0, "failed": 0}
+            items = STTPlanningMLParser().parse(etree.parse(fixture).getroot(), {"name": "Test"})
+
+        self.assertEqual(items, [])
+        unpost.assert_called_once_with([{"guid": "urn:newsml:stt.fi:584717", "type": "planning"}])
+
+    def test_linked_events_resolved_at_once(self):
+        self.app.data.insert("events", [{"_id": "urn:newsml:stt.fi:259431"}])
+        with mock.patch("stt.stt_planning_ml.find_stored_item_ids", wraps=find_stored_item_ids) as find:
+            self.parse_source_content()
+
+        find.assert_called_once_with("events", ["urn:newsml:stt.fi:20220402:259431"])
+        self.assertEqual(self.item["event_item"], "urn:newsml:stt.fi:259431")
+        self.assertIsNone(linked_event_ids_context.get())
+
     def test_placeholder_coverage(self):
         # Case 1 : If Ingest Item does not contain any Coverage
 
@@ -175,6 +215,56 @@ class STTPlanningMLParserTest(TestCase):
             dest["coverages"][0]["coverage_id"],
         )
 
+    def test_create_temp_assignment_deliveries(self):
+        news_coverage_set = etree.fromstring(
+            '<newsCoverageSet xmlns="http://iptc.org/std/nar/2006-10-01/">'
+            '<newsCoverage id="cov1"><delivery>'
+            '<deliveredItemRef guidref="urn:newsml:stt.fi:20230317:101"/>'
+            '<deliveredItemRef guidref="urn:newsml:stt.fi:20230317:102"/>'
+            "</delivery></newsCoverage>"
+            '<newsCoverage id="cov2"><delivery><deliveredItemRef guidref="urn:newsml:stt.fi:20230317:103"/>'
+            "</delivery></newsCoverage>"
+            '<newsCoverage id="cov3"><delivery><deliveredItemRef guidref="urn:newsml:stt.fi:20230317:104"/>'
+            "</delivery></newsCoverage>"
+            "</newsCoverageSet>"
+        )
+        item = {"_id": "urn:newsml:stt.fi:620121"}
+        original = {
+            "_id": "urn:newsml:stt.fi:620121",
+            "coverages": [
+                {"coverage_id": "cov1"},
+                {"coverage_id": "cov2"},
+                {"coverage_id": "cov3", "assigned_to": {"assignment_id": ObjectId()}},
+            ],
+        }
+
+        with self.app.app_context():
+            delivery_service = get_resource_service("delivery")
+            delivery_service.post([{
+                "planning_id": "urn:newsml:stt.fi:620121",
+                "coverage_id": "cov1",
+                "item_id": "urn:newsml:stt.fi:101",
+                "assignment_id": None,
+            }])
+
+            with mock.patch.object(delivery_service, "post", wraps=delivery_service.post) as post:
+                STTPlanningMLParser()._create_temp_assignment_deliveries(news_coverage_set, item, original)
+
+        post.assert_called_once_with([
+            {
+                "planning_id": "urn:newsml:stt.fi:620121",
+                "coverage_id": "cov1",
+                "item_id": "urn:newsml:stt.fi:102",
+                "assignment_id": None,
+            },
+            {
+                "planning_id": "urn:newsml:stt.fi:620121",
+                "coverage_id": "cov2",
+                "item_id": "urn:newsml:stt.fi:103",
+                "assignment_id": None,
+            },
+        ])
+
 
 def is_placeholder_coverage(coverage):
     try:
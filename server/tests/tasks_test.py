@@ -0,0 +1,62 @@
+from unittest import mock
+from bson import ObjectId
+
+from superdesk import get_resource_service
+
+from tests import TestCase
+from stt import tasks
+from stt.signal_hooks import LinkingConflict, before_content_published
+
+
+class LinkContentToCoverageTaskTest(TestCase):
+    parse_source = False
+
+    def setUp(self):
+        super().setUp()
+        self.assignment_id = ObjectId()
+        with self.app.app_context():
+            self.app.data.insert("archive", [
+                {"_id": "published-linked", "state": "published", "assignment_id": self.assignment_id},
+                {"_id": "published", "state": "published", "uri": "urn:newsml:stt.fi:101"},
+                {"_id": "in-progress", "state": "in_progress"},
+            ])
+
+    def test_queued_when_async(self):
+        item = {"_id": "in-progress", "uri": "urn:newsml:stt.fi:102"}
+        updates = {}
+        with self.app.app_context(), \
+                mock.patch.dict(self.app.config, {"STT_ASYNC_CONTENT_LINKING": True}), \
+                mock.patch.object(tasks.link_content_to_coverage_task, "apply_async") as apply_async, \
+                mock.patch("stt.signal_hooks.link_content_to_coverage") as link:
+            before_content_published(None, item, updates)
+
+        apply_async.assert_called_once_with(args=["in-progress"], countdown=tasks.LINK_CONTENT_COUNTDOWN)
+        link.assert_not_called()
+        self.assertEqual(updates, {})
+
+    def test_already_linked_content_is_only_written_back(self):
+        with self.app.app_context(), \
+                mock.patch.object(tasks, "link_content_to_coverage") as link, \
+                mock.patch.object(get_resource_service("published"), "update_published_items") as update_published:
+            tasks.link_content_to_coverage_task.run("published-linked")
+
+        link.assert_not_called()
+        update_published.assert_called_once_with("published-linked", "assignment_id", self.assignment_id)
+
+    def test_link_and_write_back(self):
+        with self.app.app_context(), \
+                mock.patch.object(tasks, "link_content_to_coverage", return_value=self.assignment_id) as link, \
+                mock.patch.object(get_resource_service("published"), "update_published_items"):
+            tasks.link_content_to_coverage_task.run("published")
+
+            self.assertEqual(link.call_args[1], {"skip_archive_update": False, "raise_conflicts": True})
+            self.assertEqual(
+                get_resource_service("archive").find_one(req=None, _id="published")["assignment_id"],
+                self.assignment_id,
+            )
+
+    def test_retry_on_conflict(self):
+        with self.app.app_context(), \
+                mock.patch.object(tasks, "link_content_to_coverage", side_effect=LinkingConflict("planning")):
+            with self.assertRaises(LinkingConflict):
+                tasks.link_content_to_coverage_task.run("published")